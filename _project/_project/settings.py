@@ -146,6 +146,8 @@ CELERY_BROKER_URL = "redis://localhost:6379/0"
 CELERY_RESULT_BACKEND = "redis://localhost:6379/0"
 CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
+# Take one task at a time so audit shards land on workers with free capacity.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
 # == Logging configuration ==
 import os
@@ -228,3 +230,136 @@ CORS_ALLOW_HEADERS = list(default_headers) + [
     'content-disposition',
 ]
 CORS_EXPOSE_HEADERS = ['Content-Disposition']
+
+# === Audit engine ===
+# Warm Chromium instances kept per Celery worker process.
+AUDIT_BROWSER_POOL_SIZE = 2
+# Recycle a pooled browser after this many pages or seconds (0 disables).
+AUDIT_BROWSER_MAX_PAGES = 200
+AUDIT_BROWSER_MAX_AGE = 30 * 60
+# Seconds a single product may hold a browser slot before it is given up on.
+AUDIT_ITEM_TIMEOUT = 120
+# Sharded audits: products per shard subtask and browser slots per shard.
+AUDIT_SHARD_SIZE = 2000
+AUDIT_SHARD_BROWSERS = 10
+# Lists larger than this are audited as shards across the worker fleet.
+AUDIT_SHARD_THRESHOLD = 5000
+# Browser slots shared by every worker process on the same Redis, and how long
+# a slot lease survives without a heartbeat before it is reclaimed.
+AUDIT_GLOBAL_BROWSER_SLOTS = 20
+AUDIT_SLOT_LEASE_TTL = 30
+# Let captcha / Rush Hour rates drive an audit's browser slots (AIMD) between
+# the per-platform bounds in AdminPref; these bounds apply when none is set.
+AUDIT_ADAPTIVE_CONCURRENCY = True
+AUDIT_MIN_BROWSERS = 2
+AUDIT_MAX_BROWSERS = 20
+# Rush Hour, captcha failures, navigation errors and timeouts are retried at
+# the end of the run with exponential backoff (seconds) before giving up.
+AUDIT_RETRY_MAX_ATTEMPTS = 3
+AUDIT_RETRY_BASE_DELAY = 30
+AUDIT_RETRY_MAX_DELAY = 300
+AMAZON_BASE_URL = "https://www.amazon.in"
+# Try a plain HTTP fetch + HTML parse first; only captcha, interstitial or
+# incomplete pages go to the browser.
+AUDIT_HTTP_FIRST = True
+AUDIT_HTTP_CONNECTIONS = 50
+AUDIT_HTTP_TIMEOUT = 15
+# Gap between two HTTP requests of one worker process (min, max seconds). The
+# HTTP path skips the browser slots and identities, so this is its only pacing.
+AUDIT_HTTP_DELAY = (0.2, 0.6)
+# "evaluate" reads every field in one page.evaluate round-trip; "locators"
+# keeps the one-Playwright-call-per-field extraction.
+AUDIT_EXTRACTION_MODE = "evaluate"
+# Request interception per platform: "dom-only" (document, scripts and CSS),
+# "dom+xhr" (also XHR/fetch) or "full". Images, media, fonts and third-party
+# trackers are blocked by everything but "full".
+AUDIT_INTERCEPTION_PROFILES = {
+    "amazon": "dom-only",
+    "flipkart": "dom+xhr",
+    "myntra": "dom+xhr",
+}
+# Pacing: pages wait for the selectors they need (up to AUDIT_CONTENT_TIMEOUT
+# seconds) instead of sleeping; the human-like gap between two navigations of
+# the same browser identity is drawn from AUDIT_HUMAN_DELAY (min, max seconds).
+AUDIT_BROWSER_SLOW_MO = 0
+AUDIT_CONTENT_TIMEOUT = 10
+AUDIT_HUMAN_DELAY = (0.5, 1.5)
+# Seconds all element waits on one product page may spend together; each wait
+# is further capped by the p95 latency learned for its field.
+AUDIT_PAGE_BUDGET = 25
+# Write-behind persistence: results are upserted in one transaction per batch
+# of up to AUDIT_WRITE_BATCH_SIZE rows or every AUDIT_WRITE_INTERVAL seconds;
+# scraping waits once AUDIT_WRITE_QUEUE_SIZE rows are queued.
+AUDIT_WRITE_BATCH_SIZE = 500
+AUDIT_WRITE_INTERVAL = 2
+AUDIT_WRITE_QUEUE_SIZE = 5000
+# A batch with rows the database rejects is split to isolate them; any other
+# failure retries the whole batch this many times (waiting
+# AUDIT_WRITE_RETRY_DELAY seconds, doubling each time). Rows that still can't
+# be written go to the task journal's dead-letter file.
+AUDIT_WRITE_RETRIES = 3
+AUDIT_WRITE_RETRY_DELAY = 0.5
+# "sql" upserts compact row tuples with raw INSERT ... ON CONFLICT statements;
+# "orm" builds ProductInfo instances for bulk_create.
+AUDIT_WRITE_MODE = "sql"
+# Audit progress is published at most once per this many seconds per worker.
+AUDIT_PROGRESS_INTERVAL = 0.5
+# Per-task audit journal (one directory per task under AUDIT_JOURNAL_DIR),
+# "ndjson" or "csv.gz"; buffered rows are written every
+# AUDIT_JOURNAL_FLUSH_ROWS rows or AUDIT_JOURNAL_FLUSH_INTERVAL seconds.
+AUDIT_JOURNAL_DIR = BASE_DIR / "journals"
+AUDIT_JOURNAL_FORMAT = "ndjson"
+AUDIT_JOURNAL_FLUSH_ROWS = 200
+AUDIT_JOURNAL_FLUSH_INTERVAL = 5
+AUDIT_JOURNAL_MAX_BYTES = 64 * 1024 * 1024
+AUDIT_JOURNAL_RETENTION_DAYS = 14
+# Product IDs committed by an audit run are kept this long (seconds) so the
+# run can be resumed under the same task id.
+AUDIT_CHECKPOINT_TTL = 7 * 24 * 3600
+# Incremental audits re-audit products whose last audit is older than this
+# many hours, at most AUDIT_INCREMENTAL_LIMIT of them per run (None: all).
+AUDIT_FRESHNESS_HOURS = 24
+AUDIT_INCREMENTAL_LIMIT = None
+# Results shared across lists and users: a product scraped within the last
+# AUDIT_RESULT_CACHE_TTL seconds is copied instead of fetched again, and
+# concurrent audits of the same product share one fetch.
+AUDIT_RESULT_CACHE = True
+AUDIT_RESULT_CACHE_TTL = 30 * 60
+# Seconds an audit waits on another process fetching the same product before
+# fetching it itself. Kept well below AUDIT_ITEM_TIMEOUT so a waiter stuck
+# behind a dead or slow fetch still has time for its own.
+AUDIT_RESULT_CACHE_LOCK_TTL = 30
+# Optional raw page archive for offline re-extraction (manage.py
+# reextract_archive): gzip blobs deduplicated by content hash under
+# AUDIT_ARCHIVE_DIR, least recently seen evicted beyond AUDIT_ARCHIVE_MAX_BYTES.
+AUDIT_PAGE_ARCHIVE = False
+AUDIT_ARCHIVE_DIR = BASE_DIR / "page_archive"
+AUDIT_ARCHIVE_MAX_BYTES = 5 * 1024 * 1024 * 1024
+# Captcha images are solved in a pool of this many processes, forked through
+# billiard so the pool also works inside daemonic Celery prefork workers;
+# solutions are cached by image hash (up to AUDIT_CAPTCHA_CACHE_SIZE images).
+AUDIT_CAPTCHA_WORKERS = 2
+AUDIT_CAPTCHA_CACHE_SIZE = 10000
+AUDIT_CAPTCHA_TIMEOUT = 15
+# Product fields read from the page's own JSON/XHR responses (variations,
+# price, MRP, availability). Only responses matching a capture rule are let
+# through the interception profile and buffered, at most
+# AUDIT_CAPTURE_MAX_BYTES each; extraction waits up to AUDIT_CAPTURE_WAIT
+# seconds for bodies still in flight. Fields in AUDIT_CAPTURE_TRUSTED_FIELDS
+# are taken from the responses and their DOM probes skipped; the rest only
+# fill what the DOM could not find. Off, and nothing trusted, until the rules
+# are validated with manage.py benchmark_extraction --capture.
+AUDIT_RESPONSE_CAPTURE = False
+AUDIT_CAPTURE_TRUSTED_FIELDS = ()
+AUDIT_CAPTURE_MAX_BYTES = 2 * 1024 * 1024
+AUDIT_CAPTURE_WAIT = 1.0
+# Browser contexts present one of AUDIT_IDENTITY_POOL_SIZE consistent en-IN
+# identities. Their cookies are saved to AUDIT_IDENTITY_DIR every
+# AUDIT_IDENTITY_SAVE_INTERVAL seconds; page and captcha counts live in Redis.
+# An identity is retired once it has loaded AUDIT_IDENTITY_MIN_PAGES pages and
+# more than AUDIT_IDENTITY_MAX_CAPTCHA_RATE of them were captchas.
+AUDIT_IDENTITY_POOL_SIZE = 16
+AUDIT_IDENTITY_DIR = BASE_DIR / "identities"
+AUDIT_IDENTITY_SAVE_INTERVAL = 60
+AUDIT_IDENTITY_MIN_PAGES = 20
+AUDIT_IDENTITY_MAX_CAPTCHA_RATE = 0.2
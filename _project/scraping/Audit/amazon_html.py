@@ -0,0 +1,146 @@
+import re
+from typing import Any, Dict, Tuple
+
+import lxml.html
+
+from .amazon_regular import (
+    BROWSE_NODE_SELECTOR,
+    BSR_TABLE_SELECTOR,
+    BULLET_POINTS_SELECTOR,
+    MAIN_IMAGE_LIST_SELECTORS,
+    TELL_AMAZON_ASIN_SELECTOR,
+    VARIATIONS_SELECTOR,
+    empty_result,
+    fields_from_raw,
+    is_rush_hour,
+)
+
+# Reasons a page has to go through the browser instead.
+CAPTCHA = "captcha"
+CONTINUE_SHOPPING = "continue_shopping"
+NO_STATUS_CARD = "no_status_card"
+MISSING_TITLE = "missing_title"
+UNPARSABLE = "unparsable"
+
+
+class AmazonHtmlParser:
+    """Reads the fields of ``AmazonScrapingLogic`` out of server-rendered /dp/ HTML.
+
+    ``parse`` returns the same result dict as ``_run_scraper``, or ``None``
+    together with the reason when the page needs a real browser (captcha,
+    interstitials, content that is only rendered by JavaScript).
+    """
+
+    def __init__(self, html: str, asin: str, url: str):
+        self.asin = asin
+        self.url = url
+        self.doc = lxml.html.fromstring(html) if html and html.strip() else None
+
+    def _first(self, selector: str):
+        found = self.doc.cssselect(selector)
+        return found[0] if found else None
+
+    def _text(self, selector: str):
+        element = self._first(selector)
+        return self._inner_text(element) if element is not None else None
+
+    @staticmethod
+    def _inner_text(element) -> str:
+        return "".join(
+            element.xpath(".//text()[not(ancestor::script) and not(ancestor::style)]")
+        )
+
+    def _status(self) -> Tuple[str | None, str | None]:
+        center = self._first("center")
+        if center is not None and is_rush_hour(self._inner_text(center)):
+            return "Rush Hour", None
+        if "dp" not in self.url:
+            return "Suppressed", None
+        if self._first(".h1") is not None:
+            return "Suppressed", None
+        card = self._first(TELL_AMAZON_ASIN_SELECTOR)
+        if card is None:
+            # The browser waits for this card to render; without it we cannot
+            # tell a removed page from a slow one.
+            return None, NO_STATUS_CARD
+        if card.get("data-asin") == self.asin:
+            return "Live", None
+        return "Suppressed Asin Changed", None
+
+    def _bsr_spans(self):
+        table = self._first(BSR_TABLE_SELECTOR)
+        if table is not None:
+            for th in table.cssselect("th"):
+                if (th.text_content() or "").strip() == "Best Sellers Rank":
+                    td = th.getnext()
+                    if td is not None:
+                        return [
+                            span.text_content().strip()
+                            for span in td.cssselect("li span.a-list-item span")
+                        ]
+                    break
+        return []
+
+    def _main_images(self):
+        for selector in MAIN_IMAGE_LIST_SELECTORS:
+            ul = self._first(selector)
+            if ul is not None:
+                return [img.get("src") for img in ul.cssselect("img")]
+        return None
+
+    def _raw(self) -> Dict[str, Any]:
+        """Same readings as ``EXTRACT_FIELDS_JS`` takes in the browser."""
+        byline = self._first("a#bylineInfo")
+        reviews = self._first("span#acrPopover")
+        bullets = self._first(BULLET_POINTS_SELECTOR)
+        return {
+            "byline_text": byline.text_content() if byline is not None else None,
+            "byline_href": byline.get("href") if byline is not None else None,
+            "breadcrumbs": [
+                self._inner_text(a) for a in self.doc.cssselect(BROWSE_NODE_SELECTOR)
+            ],
+            "title": self._text("span#productTitle"),
+            "reviews_title": reviews.get("title") if reviews is not None else None,
+            "ratings_text": self._text("span#acrCustomerReviewText"),
+            "variations": bool(self.doc.cssselect(VARIATIONS_SELECTOR)),
+            "deal": self._text("span.dealBadgeTextColor"),
+            "seller": self._text("#sellerProfileTriggerId"),
+            "image_len": len(self.doc.cssselect("#altImages img")),
+            "video": bool(self.doc.cssselect("li.videoThumbnail img")),
+            "main_images": self._main_images(),
+            "bullet_point_len": len(bullets.cssselect("li")) if bullets is not None else 0,
+            "bsr_spans": self._bsr_spans(),
+            "price": self._text("span.a-price-whole"),
+            "mrp": self._text(".basisPrice > span > span"),
+            "availability": self._text("div#availability"),
+            "description": self._text("#productDescription"),
+            "aplus": self._first("#aplus") is not None,
+        }
+
+    def parse(self) -> Tuple[Dict[str, Any] | None, str | None]:
+        if self.doc is None:
+            return None, UNPARSABLE
+        if self._first("input#captchacharacters") is not None:
+            return None, CAPTCHA
+        for button in self.doc.cssselect("button"):
+            if re.search(r"continue shopping", button.text_content(), re.IGNORECASE):
+                return None, CONTINUE_SHOPPING
+
+        status, reason = self._status()
+        if status is None:
+            return None, reason
+
+        result = empty_result(self.asin)
+        result["status"] = status
+        if status in ["Suppressed", "Rush Hour"]:
+            return result, None
+
+        result.update(fields_from_raw(self._raw()))
+        if result["title"] == "N/A":
+            return None, MISSING_TITLE
+        return result, None
+
+
+def extract_from_html(html: str, asin: str, url: str):
+    """Module-level entry point so it can be shipped to a process pool."""
+    return AmazonHtmlParser(html, asin, url).parse()
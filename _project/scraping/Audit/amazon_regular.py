@@ -1,22 +1,252 @@
 import gc
 import re
+import time
 
 import logging
 
-from .save_csv import csv_audit_general
 from playwright.async_api import Page
 
 
 from typing import Literal, Dict, Any
+from django.conf import settings
 from .bowser_config import ScrapingLogic
+from .deadline import PageDeadline
+from .pacing import PRODUCT_READY_SELECTOR, wait_for_content
 
 logger = logging.getLogger("scraping")
 
+RUSH_HOUR_MESSAGE = "Oops! It's rush hour and traffic is piling up on that page."
+TELL_AMAZON_ASIN_SELECTOR = (
+    'div[data-card-metrics-id^="tell-amazon-desktop_DetailPage_"] div[data-asin]'
+)
+VARIATIONS_SELECTOR = (
+    "#twister-plus-inline-twister, "
+    "#variation_color_name, "
+    "#variation_size_name, "
+    "#inline-twister-row-pattern_name, "
+    "#variation_style_name"
+)
+BROWSE_NODE_SELECTOR = (
+    "div#wayfinding-breadcrumbs_feature_div ul.a-unordered-list.a-horizontal.a-size-small a"
+)
+MAIN_IMAGE_LIST_SELECTORS = (
+    "ul.a-unordered-list.a-nostyle.a-button-list.a-vertical.a-spacing-top-micro.gridAltImageViewLayoutIn1x7",
+    "ul.a-unordered-list.a-nostyle.a-button-list.a-vertical.a-spacing-top-extra-large.regularAltImageViewLayout",
+)
+BULLET_POINTS_SELECTOR = "div#feature-bullets ul.a-unordered-list.a-vertical.a-spacing-mini"
+BSR_TABLE_SELECTOR = "table#productDetails_detailBullets_sections1"
+
+
+# === Field post-processing shared by every extraction path ===
+def is_rush_hour(text: str) -> bool:
+    clean_text = " ".join(line.strip() for line in (text or "").splitlines() if line.strip())
+    return clean_text.startswith(RUSH_HOUR_MESSAGE)
+
+
+def clean_brand_name(raw_brand: str) -> str:
+    return re.sub(r"^(Visit the\s+)?(.*?)(\s+Store)?$", r"\2", raw_brand.strip()).strip()
+
+
+def clean_price(price_text: str) -> str:
+    return price_text.replace(",", "").strip()
+
+
+def parse_mrp(mrp_text: str) -> float:
+    if mrp_text:
+        mrp_text = mrp_text.replace("₹", "").replace(",", "").strip()
+        try:
+            return float(mrp_text)
+        except Exception as e:
+            print("error in mrp", e)
+    return 0
+
+
+def parse_reviews(reviews_title: str) -> str:
+    return reviews_title.split(" ")[0].strip() if reviews_title else "0"
+
+
+def parse_ratings(ratings_text: str) -> str:
+    return ratings_text.split(" ")[0].replace(",", "").strip() if ratings_text else "0"
+
+
+def clean_availability(availability_text: str) -> str:
+    if availability_text:
+        return " ".join(availability_text.replace("\n", " ").split())
+    return "N/A"
+
+
+def main_image_from_sources(sources) -> str:
+    for src in sources:
+        if src and src.endswith(".jpg"):
+            return src.replace("SS100", "SS500")
+    return "N/A"
+
+
+def best_seller_rank_from_spans(span_texts) -> str:
+    bsr1, bsr2 = "Not Available", "Not Available"
+    if span_texts:
+        ranks = list(span_texts[:2])
+        if len(ranks) < 2:
+            ranks += ["Not Available"] * (2 - len(ranks))
+        bsr1 = re.sub(r"\s*\(.*?\)", "", ranks[0]).strip()
+        bsr2 = re.sub(r"\s*\(.*?\)", "", ranks[1]).strip()
+    return f"{bsr1}, {bsr2}"
+
+
+def store_link_from_href(href: str) -> str:
+    return f"http://amazon.in{href}" if href else "N/A"
+
+
+def fields_from_raw(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn raw DOM readings into result fields.
+
+    ``raw`` is what ``EXTRACT_FIELDS_JS`` returns in the browser, and what
+    ``AmazonHtmlParser`` builds from static HTML; missing elements are None.
+    """
+    breadcrumbs = raw.get("breadcrumbs") or []
+    main_images = raw.get("main_images")
+    return {
+        "brand_name": clean_brand_name(raw["byline_text"]) if raw.get("byline_text") is not None else "N/A",
+        "browse_node": " > ".join(text.strip() for text in breadcrumbs) if breadcrumbs else "N/A",
+        "title": raw["title"].strip() if raw.get("title") else "N/A",
+        "reviews": parse_reviews(raw.get("reviews_title")),
+        "ratings": parse_ratings(raw.get("ratings_text")),
+        "variations": "Available" if raw.get("variations") else "N/A",
+        "deal": raw["deal"].strip() if raw.get("deal") else "N/A",
+        "seller": raw["seller"].strip() if raw.get("seller") is not None else "N/A",
+        "image_len": raw.get("image_len", 0),
+        "video": "Available" if raw.get("video") else "Not Available",
+        "main_img_url": main_image_from_sources(main_images) if main_images is not None else "N/A",
+        "bullet_point_len": raw.get("bullet_point_len", 0),
+        "bestSellerRank": best_seller_rank_from_spans(raw.get("bsr_spans") or []),
+        "price": clean_price(raw["price"]) if raw.get("price") is not None else 0,
+        "MRP": parse_mrp(raw.get("mrp")),
+        "availability": clean_availability(raw["availability"]) if raw.get("availability") is not None else "N/A",
+        "description": raw["description"].strip() if raw.get("description") else "Not Available",
+        "A_plus": "Available" if raw.get("aplus") else "N/A",
+        "store_link": store_link_from_href(raw.get("byline_href")),
+    }
+
+
+EXTRACT_SELECTORS = {
+    "browseNode": BROWSE_NODE_SELECTOR,
+    "variations": VARIATIONS_SELECTOR,
+    "mainImages": list(MAIN_IMAGE_LIST_SELECTORS),
+    "bullets": BULLET_POINTS_SELECTOR,
+    "bsrTable": BSR_TABLE_SELECTOR,
+}
+
+# Reads every field in one pass; mirrors the per-field locator methods below.
+EXTRACT_FIELDS_JS = """
+(sel) => {
+    const q = (s) => document.querySelector(s);
+    const text = (s) => { const e = q(s); return e ? e.textContent : null; };
+    const byline = q("a#bylineInfo");
+    const reviews = q("span#acrPopover");
+    const availability = q("div#availability");
+    const bullets = q(sel.bullets);
+    const mainList = q(sel.mainImages[0]) || q(sel.mainImages[1]);
+
+    let bsrSpans = [];
+    const table = q(sel.bsrTable);
+    if (table) {
+        for (const th of table.querySelectorAll("th")) {
+            if ((th.textContent || "").trim() === "Best Sellers Rank") {
+                const td = th.nextElementSibling;
+                if (td) {
+                    bsrSpans = Array.from(
+                        td.querySelectorAll("li span.a-list-item span"),
+                        (e) => e.textContent.trim()
+                    );
+                }
+                break;
+            }
+        }
+    }
+
+    return {
+        byline_text: byline ? byline.textContent : null,
+        byline_href: byline ? byline.getAttribute("href") : null,
+        breadcrumbs: Array.from(document.querySelectorAll(sel.browseNode), (a) => a.innerText),
+        title: text("span#productTitle"),
+        reviews_title: reviews ? reviews.getAttribute("title") : null,
+        ratings_text: text("span#acrCustomerReviewText"),
+        variations: !!q(sel.variations),
+        deal: text("span.dealBadgeTextColor"),
+        seller: text("#sellerProfileTriggerId"),
+        image_len: document.querySelectorAll("#altImages img").length,
+        video: !!q("li.videoThumbnail img"),
+        main_images: mainList
+            ? Array.from(mainList.querySelectorAll("img"), (img) => img.getAttribute("src"))
+            : null,
+        bullet_point_len: bullets ? bullets.querySelectorAll("li").length : 0,
+        bsr_spans: bsrSpans,
+        price: text("span.a-price-whole"),
+        mrp: text(".basisPrice > span > span"),
+        availability: availability ? availability.innerText : null,
+        description: text("#productDescription"),
+        aplus: !!q("#aplus"),
+    };
+}
+"""
+
+
+def empty_result(asin: str) -> Dict[str, Any]:
+    """Result dict with every field at its 'not found' value."""
+    return {
+        "asin": asin,
+        "status": "Suppressed",
+        "brand_name": "N/A",
+        "browse_node": "N/A",
+        "title": "N/A",
+        "reviews": "0",
+        "ratings": "0",
+        "variations": "N/A",
+        "deal": "N/A",
+        "seller": "N/A",
+        "image_len": 0,
+        "video": "N/A",
+        "main_img_url": "N/A",
+        "bullet_point_len": 0,
+        "bestSellerRank": "",
+        "price": "N/A",
+        "MRP": 0,
+        "availability": "N/A",
+        "description": "N/A",
+        "A_plus": "N/A",
+        "store_link": "N/A",
+    }
+
+
+# Result field and the method reading it, in extraction order.
+LOCATOR_FIELDS = (
+    ("brand_name", "_brand_name"),
+    ("browse_node", "_browse_node"),
+    ("title", "_title"),
+    ("reviews", "_reviews"),
+    ("ratings", "_ratings"),
+    ("variations", "_variations"),
+    ("deal", "_deal"),
+    ("seller", "_seller"),
+    ("image_len", "_image_length"),
+    ("video", "_video"),
+    ("main_img_url", "_main_img_url"),
+    ("bullet_point_len", "_bullet_point_len"),
+    ("bestSellerRank", "_best_seller_rank"),
+    ("price", "_price"),
+    ("MRP", "_mrp"),
+    ("availability", "_availability"),
+    ("description", "_description"),
+    ("A_plus", "_aplus"),
+    ("store_link", "_store_link"),
+)
+
 
 class StatusChecker:
-    def __init__(self, page: Page, asin: str):
+    def __init__(self, page: Page, asin: str, deadline: PageDeadline = None):
         self.page = page
         self.product_id = asin
+        self.deadline = deadline
 
     async def check(
         self,
@@ -30,16 +260,9 @@ class StatusChecker:
         status: str = "Suppressed"
         current_url: str = self.page.url
 
-        expected_message_start = (
-            "Oops! It's rush hour and traffic is piling up on that page."
-        )
         rush_hour_element = await self.page.query_selector("center")
         if rush_hour_element:
-            text_content = await rush_hour_element.text_content()
-            clean_text = " ".join(
-                [line.strip() for line in text_content.splitlines() if line.strip()]
-            )
-            if clean_text.startswith(expected_message_start):
+            if is_rush_hour(await rush_hour_element.text_content()):
                 return "Rush Hour"
 
         if "dp" in current_url:
@@ -47,11 +270,13 @@ class StatusChecker:
             if suppressed_element:
                 status = "Suppressed"
             else:
-                asin_element = self.page.locator(
-                    'div[data-card-metrics-id^="tell-amazon-desktop_DetailPage_"] div[data-asin]'
-                )
+                asin_element = self.page.locator(TELL_AMAZON_ASIN_SELECTOR)
                 try:
-                    await asin_element.wait_for(state="visible", timeout=20000)
+                    if self.deadline is not None:
+                        if not await self.deadline.wait(asin_element, "status_card"):
+                            raise TimeoutError("status card not found")
+                    else:
+                        await asin_element.wait_for(state="visible", timeout=20000)
                     main_data_asin_val = await asin_element.get_attribute("data-asin")
                     if main_data_asin_val == self.product_id:
                         status = "Live"
@@ -66,12 +291,13 @@ class StatusChecker:
 class AmazonScrapingLogic(ScrapingLogic):
 
     async def _status(self, page: Page, asin: str):
-        return await StatusChecker(page, asin).check()
+        return await StatusChecker(page, asin, self.deadline).check()
 
     async def _title(self) -> str:
         title_locator = self.page.locator("span#productTitle").first
         try:
-            await title_locator.wait_for(state="visible", timeout=5000)
+            if not await self.deadline.wait(title_locator, "title"):
+                return "N/A"
             title = await title_locator.text_content()
             print(f"title {title}")
             return title.strip() if title else "N/A"
@@ -81,54 +307,36 @@ class AmazonScrapingLogic(ScrapingLogic):
     async def _brand_name(self) -> str:
         brand_name_element = self.page.locator("a#bylineInfo").first
         if await brand_name_element.count() > 0:
-            await brand_name_element.wait_for(state="visible", timeout=10000)
-            raw_brand = (await brand_name_element.text_content()).strip()
-            return re.sub(
-                r"^(Visit the\s+)?(.*?)(\s+Store)?$", r"\2", raw_brand
-            ).strip()
+            await self.deadline.wait(brand_name_element, "brand_name")
+            return clean_brand_name(await brand_name_element.text_content())
         logger.info("brand name link not found")
         return "N/A"
 
     async def _price(self) -> str:
         price_loc = self.page.locator("span.a-price-whole")
         if await price_loc.count() > 0:
-            price_text = await price_loc.first.text_content()
-            price_text = price_text.replace(",","").strip()
-            return price_text 
+            return clean_price(await price_loc.first.text_content())
         return 0
 
     async def _mrp(self) -> float:
         try:
             mrp_label = self.page.locator(".basisPrice > span > span").first
-            await mrp_label.wait_for(timeout=10000)
-            if mrp_label:
-                mrp_text = await mrp_label.text_content()
-                if mrp_text:
-                    mrp_text = mrp_text.replace("₹", "").replace(",", "").strip()
-                    try:
-                        return float(mrp_text)
-                    except Exception as e:
-                        print("error in mrp", e)
+            if await self.deadline.wait(mrp_label, "mrp"):
+                return parse_mrp(await mrp_label.text_content())
         except Exception:
             logger.info(f"mrp not found {self.product_id}")
         return 0
 
     async def _variations(self) -> str:
-        variations_locator = self.page.locator(
-            "#twister-plus-inline-twister, "
-            "#variation_color_name, "
-            "#variation_size_name, "
-            "#inline-twister-row-pattern_name, "
-            "#variation_style_name"
-        )
+        variations_locator = self.page.locator(VARIATIONS_SELECTOR)
         return "Available" if await variations_locator.count() > 0 else "N/A"
 
     async def _reviews(self) -> str:
         reviews_locator = self.page.locator("span#acrPopover").first
         try:
-            await reviews_locator.wait_for(state="visible", timeout=10000)
-            reviews_title = await reviews_locator.get_attribute("title")
-            return reviews_title.split(" ")[0].strip() if reviews_title else "0"
+            if not await self.deadline.wait(reviews_locator, "reviews"):
+                raise TimeoutError("reviews not found")
+            return parse_reviews(await reviews_locator.get_attribute("title"))
         except Exception:
             logger.error(f"review 0")
             return "0"
@@ -136,12 +344,7 @@ class AmazonScrapingLogic(ScrapingLogic):
     async def _ratings(self) -> str:
         ratings_locator = self.page.locator("span#acrCustomerReviewText").first
         if await ratings_locator.count() > 0:
-            ratings_text = await ratings_locator.text_content()
-            return (
-                ratings_text.split(" ")[0].replace(",", "").strip()
-                if ratings_text
-                else "0"
-            )
+            return parse_ratings(await ratings_locator.text_content())
         return "0"
 
     async def _seller(self) -> str:
@@ -155,15 +358,11 @@ class AmazonScrapingLogic(ScrapingLogic):
     async def _availability(self) -> str:
         availability_locator = self.page.locator("div#availability").first
         if await availability_locator.count() > 0:
-            availability_text = await availability_locator.inner_text()
-            if availability_text:
-                return " ".join(availability_text.replace("\n", " ").split())
+            return clean_availability(await availability_locator.inner_text())
         return "N/A"
 
     async def _browse_node(self) -> str:
-        breadcrumb_locator = self.page.locator(
-            "div#wayfinding-breadcrumbs_feature_div ul.a-unordered-list.a-horizontal.a-size-small a"
-        )
+        breadcrumb_locator = self.page.locator(BROWSE_NODE_SELECTOR)
         if await breadcrumb_locator.count() > 0:
             browse_node_list = await breadcrumb_locator.all_inner_texts()
             return " > ".join(text.strip() for text in browse_node_list)
@@ -188,29 +387,23 @@ class AmazonScrapingLogic(ScrapingLogic):
 
     async def _main_img_url(self) -> str:
         try:
-            ul_locator = self.page.locator(
-                "ul.a-unordered-list.a-nostyle.a-button-list.a-vertical.a-spacing-top-micro.gridAltImageViewLayoutIn1x7"
-            ).first
+            ul_locator = self.page.locator(MAIN_IMAGE_LIST_SELECTORS[0]).first
             if await ul_locator.count() == 0:
-                ul_locator = self.page.locator(
-                    "ul.a-unordered-list.a-nostyle.a-button-list.a-vertical.a-spacing-top-extra-large.regularAltImageViewLayout"
-                ).first
+                ul_locator = self.page.locator(MAIN_IMAGE_LIST_SELECTORS[1]).first
             if await ul_locator.count() > 0:
                 img_locators = ul_locator.locator("img")
                 count = await img_locators.count()
                 for i in range(count):
                     src = await img_locators.nth(i).get_attribute("src")
                     if src and src.endswith(".jpg"):
-                        return src.replace("SS100", "SS500")
+                        return main_image_from_sources([src])
         except Exception as e:
             logger.warning(f"Error fetching main image URL: {e}")
         return "N/A"
 
     async def _bullet_point_len(self) -> int:
         try:
-            ul_locator = self.page.locator(
-                "div#feature-bullets ul.a-unordered-list.a-vertical.a-spacing-mini"
-            ).first
+            ul_locator = self.page.locator(BULLET_POINTS_SELECTOR).first
             if await ul_locator.count() > 0:
                 return await ul_locator.locator("li").count()
         except Exception as e:
@@ -218,11 +411,9 @@ class AmazonScrapingLogic(ScrapingLogic):
         return 0
 
     async def _best_seller_rank(self) -> str:
-        bsr1, bsr2 = "Not Available", "Not Available"
+        span_texts = []
         try:
-            table = self.page.locator(
-                "table#productDetails_detailBullets_sections1"
-            ).first
+            table = self.page.locator(BSR_TABLE_SELECTOR).first
             if await table.count() > 0:
                 th_elements = await table.locator("th").all()
                 best_sellers_th = None
@@ -240,15 +431,9 @@ class AmazonScrapingLogic(ScrapingLogic):
                             "li span.a-list-item span",
                             "els => els.map(e => e.textContent.trim())",
                         )
-                        if span_texts:
-                            ranks = span_texts[:2]
-                            if len(ranks) < 2:
-                                ranks += ["Not Available"] * (2 - len(ranks))
-                            bsr1 = re.sub(r"\s*\(.*?\)", "", ranks[0]).strip()
-                            bsr2 = re.sub(r"\s*\(.*?\)", "", ranks[1]).strip()
         except Exception as e:
             print(f"Error extracting Best Sellers Rank: {e}")
-        return f"{bsr1}, {bsr2}"
+        return best_seller_rank_from_spans(span_texts)
 
     async def _description(self) -> str:
         desc_loc = self.page.locator("#productDescription").first
@@ -265,9 +450,7 @@ class AmazonScrapingLogic(ScrapingLogic):
     async def _store_link(self) -> str:
         byline_info = self.page.locator("a#bylineInfo").first
         if await byline_info.count() > 0:
-            href = await byline_info.first.get_attribute("href")
-            if href:
-                return f"http://amazon.in{href}"
+            return store_link_from_href(await byline_info.first.get_attribute("href"))
         return "N/A"
 
     async def _handle_continue_shopping(self) -> bool:
@@ -284,7 +467,8 @@ class AmazonScrapingLogic(ScrapingLogic):
                 logger.info(f"'Continue Shopping' button found for {self.product_id}")
                 try:
                     await button.click()
-                    await self.page.wait_for_timeout(1000)  # small wait after click
+                    await self.page.wait_for_load_state("domcontentloaded")
+                    await wait_for_content(self.page, PRODUCT_READY_SELECTOR)
                     return True
                 except Exception as e:
                     logger.error(
@@ -300,73 +484,64 @@ class AmazonScrapingLogic(ScrapingLogic):
             return False
 
     def _scrape_result(self) -> Dict[str, Any]:
-        return {
-            "asin": self.product_id,
-            "status": "Suppressed",
-            "brand_name": "N/A",
-            "browse_node": "N/A",
-            "title": "N/A",
-            "reviews": "0",
-            "ratings": "0",
-            "variations": "N/A",
-            "deal": "N/A",
-            "seller": "N/A",
-            "image_len": 0,
-            "video": "N/A",
-            "main_img_url": "N/A",
-            "bullet_point_len": 0,
-            "bestSellerRank": "",
-            "price": "N/A",
-            "MRP": 0,
-            "availability": "N/A",
-            "description": "N/A",
-            "A_plus": "N/A",
-            "store_link": "N/A",
-        }
+        return empty_result(self.product_id)
+
+    async def _extract_with_locators(self, skip=()) -> Dict[str, Any]:
+        """One Playwright round-trip (or more) per field not in ``skip``."""
+        fields = {}
+        for field, method in LOCATOR_FIELDS:
+            if field in skip:
+                continue
+            started = time.monotonic()
+            fields[field] = await getattr(self, method)()
+            self.field_latency[field] = time.monotonic() - started
+        return fields
+
+    async def _extract_in_page(self) -> Dict[str, Any]:
+        """Collect every field with a single ``page.evaluate`` round-trip."""
+        started = time.monotonic()
+        raw = await self.page.evaluate(EXTRACT_FIELDS_JS, EXTRACT_SELECTORS)
+        self.field_latency["evaluate"] = time.monotonic() - started
+        return fields_from_raw(raw)
 
     async def _run_scraper(self) -> Dict[str, Any]:
         self.result = self._scrape_result()
         self.result["asin"] = self.product_id
+        self.deadline = PageDeadline(self.page)
 
         if not await self._handle_continue_shopping():
             return self.result
 
+        started = time.monotonic()
         status = await self._status(self.page, self.product_id)
+        self.field_latency["status"] = time.monotonic() - started
+        if settings.AUDIT_PAGE_ARCHIVE and status != "Rush Hour":
+            try:
+                self.snapshot = (await self.page.content(), self.page.url)
+            except Exception as e:
+                logger.info(f"could not snapshot {self.product_id}: {e}")
         if status in ["Suppressed", "Rush Hour"]:
             self.result["status"] = status
-            await csv_audit_general(self.result, self.file_name)
             return self.result
 
         try:
-            self.result.update(
-                {
-                    "status": status,
-                    "brand_name": await self._brand_name(),
-                    "browse_node": await self._browse_node(),
-                    "title": await self._title(),
-                    "reviews": await self._reviews(),
-                    "ratings": await self._ratings(),
-                    "variations": await self._variations(),
-                    "deal": await self._deal(),
-                    "seller": await self._seller(),
-                }
-            )
-            self.result["image_len"] = await self._image_length()
-            self.result["video"] = await self._video()
-            self.result["main_img_url"] = await self._main_img_url()
-            self.result["bullet_point_len"] = await self._bullet_point_len()
-            self.result["bestSellerRank"] = await self._best_seller_rank()
-            self.result["price"] = await self._price()
-            self.result["MRP"] = await self._mrp()
-            self.result["availability"] = await self._availability()
-            self.result["description"] = await self._description()
-            self.result["A_plus"] = await self._aplus()
-            self.result["store_link"] = await self._store_link()
-
-            try:
-                await csv_audit_general(self.result, self.file_name)
-            except Exception as e:
-                logger.info(f"error at the end of csv file {e}")
+            captured, trusted = {}, {}
+            if self.capture is not None:
+                started = time.monotonic()
+                captured = await self.capture.collect()
+                self.field_latency["capture"] = time.monotonic() - started
+                trusted = self.capture.trusted_fields(captured)
+            if settings.AUDIT_EXTRACTION_MODE == "evaluate":
+                fields = await self._extract_in_page()
+            else:
+                fields = await self._extract_with_locators(skip=trusted)
+                if self.capture is not None:
+                    self.capture.skipped_probes(trusted)
+            # Trusted captured fields stand in for the DOM; the rest only fill gaps.
+            if self.capture is not None:
+                fields = self.capture.merge({**fields, **trusted}, captured)
+            self.result.update(fields)
+            self.result["status"] = status
 
             await self.page.close()
             gc.collect()
@@ -375,7 +550,6 @@ class AmazonScrapingLogic(ScrapingLogic):
         except Exception as e:
             logger.info(f"error {e}")
             self.result["status"] = "Suppressed"
-            await csv_audit_general(self.result, self.file_name)
             await self.page.close()
             gc.collect()
             return self.result
@@ -0,0 +1,180 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .amazon_html import extract_from_html
+
+logger = logging.getLogger("scraping")
+
+
+def content_hash(html: str) -> str:
+    return hashlib.blake2b(html.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def blob_path(root, digest: str) -> Path:
+    return Path(root) / digest[:2] / f"{digest}.html.gz"
+
+
+class PageArchive:
+    """Raw HTML of the pages an audit extracted, for re-extraction without the network.
+
+    Pages are stored once per distinct content as ``<dir>/<ab>/<hash>.html.gz``;
+    an ``ArchivedPage`` row per (task, product) points at the blob. Storing a
+    page whose content is already archived only refreshes the blob's mtime,
+    which ``prune_archive`` uses to evict the least recently seen pages first.
+    """
+
+    def __init__(self, task_id: str, platform: str, product_list_id: int, directory=None, flush_rows: int = 200):
+        self.task_id = task_id
+        self.platform = platform
+        self.product_list_id = product_list_id
+        self.directory = Path(directory or settings.AUDIT_ARCHIVE_DIR)
+        self.flush_rows = flush_rows
+        self.pending: list = []
+        self.pages = 0
+        self.deduplicated = 0
+        self.bytes_written = 0
+
+    def _write_blob(self, digest: str, html: str) -> int:
+        path = blob_path(self.directory, digest)
+        if path.exists():
+            os.utime(path)
+            return 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = gzip.compress(html.encode("utf-8"))
+        # Write-then-rename so a reader never sees half a blob.
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    async def store(self, product_id: str, html: str, url: str):
+        if not html:
+            return
+        digest = content_hash(html)
+        try:
+            written = await asyncio.to_thread(self._write_blob, digest, html)
+        except OSError as e:
+            logger.warning(f"could not archive page of {product_id}: {e}")
+            return
+        self.pages += 1
+        if written:
+            self.bytes_written += written
+        else:
+            self.deduplicated += 1
+        self.pending.append((product_id, digest, url))
+        if len(self.pending) >= self.flush_rows:
+            await self.flush()
+
+    @sync_to_async
+    def _save_index(self, rows: list):
+        from scraping.models import ArchivedPage
+
+        ArchivedPage.objects.bulk_create(
+            [
+                ArchivedPage(
+                    task_id=self.task_id,
+                    product_list_id=self.product_list_id,
+                    platform=self.platform,
+                    product_id=product_id,
+                    content_hash=digest,
+                    url=url[:500],
+                )
+                for product_id, digest, url in rows
+            ],
+            update_conflicts=True,
+            unique_fields=["task_id", "product_id"],
+            update_fields=["content_hash", "url", "created_at"],
+        )
+
+    async def flush(self):
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        # A product retried within the task keeps only its last page.
+        rows = list({product_id: (product_id, d, u) for product_id, d, u in rows}.values())
+        try:
+            await self._save_index(rows)
+        except Exception as e:
+            logger.error(f"could not index {len(rows)} archived pages of {self.task_id}: {e}")
+
+    async def close(self):
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pages": self.pages,
+            "deduplicated": self.deduplicated,
+            "bytes_written": self.bytes_written,
+        }
+
+
+def load_page(path) -> str:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def extract_archived(path: str, asin: str, url: str):
+    """Re-run the HTML extractor on one archived page (process pool entry point)."""
+    try:
+        return asin, *extract_from_html(load_page(path), asin, url)
+    except OSError as e:
+        return asin, None, f"unreadable: {e}"
+
+
+def reextract(pages, directory=None, workers=None):
+    """Yield ``(asin, result, reason)`` for each ``ArchivedPage`` in ``pages``.
+
+    Only blob paths cross the process boundary; each worker reads and parses
+    its pages itself.
+    """
+    root = directory or settings.AUDIT_ARCHIVE_DIR
+    jobs = [(str(blob_path(root, p.content_hash)), p.product_id, p.url) for p in pages]
+    if not jobs:
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(extract_archived, *zip(*jobs), chunksize=32)
+
+
+def prune_archive(directory=None, max_bytes=None) -> int:
+    """Evict least recently seen blobs until the archive fits ``max_bytes``; returns how many."""
+    from scraping.models import ArchivedPage
+
+    root = Path(directory or settings.AUDIT_ARCHIVE_DIR)
+    max_bytes = settings.AUDIT_ARCHIVE_MAX_BYTES if max_bytes is None else max_bytes
+    if not root.is_dir():
+        return 0
+
+    blobs = []
+    for path in root.glob("*/*.html.gz"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        blobs.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in blobs)
+    if total <= max_bytes:
+        return 0
+
+    evicted = []
+    for _, size, path in sorted(blobs, key=lambda b: b[0]):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError as e:
+            logger.warning(f"could not prune archived page {path}: {e}")
+            continue
+        total -= size
+        evicted.append(path.name.split(".", 1)[0])
+
+    for start in range(0, len(evicted), 500):
+        ArchivedPage.objects.filter(content_hash__in=evicted[start:start + 500]).delete()
+    return len(evicted)
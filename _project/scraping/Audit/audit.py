@@ -1,173 +1,286 @@
 import asyncio
-import aioredis
 import logging
+import time
+from datetime import timedelta
+from functools import partial
 from asgiref.sync import sync_to_async
-from .bowser_config import AmazonPageManager, BrowserManager
-from scraping.models import ProductInfo
-from .utils import TaskProgress 
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .archive import PageArchive, prune_archive
+from .bowser_config import AmazonPageManager
+from .browser_pool import BrowserPool
+from .captcha import CaptchaService
+from .capture import ResponseCapture, allowed_urls, rules_for
+from .deadline import FieldTimings
+from .concurrency import AIMDController, CAPTCHA, OK, RUSH_HOUR, load_concurrency_bounds
+from .http_fetcher import AmazonHttpFetcher
+from .identity import IdentityPool
+from .checkpoint import AuditCheckpoint
+from .journal import AuditJournal, prune_journals
+from .interception import RequestInterceptor, profile_for
+from .limiter import BrowserLimiter
+from .pacing import HumanPacer
+from .retry import NAVIGATION, TIMEOUT, RetryQueue, gave_up_status
+from .persistence import ResultSaver
+from .result_cache import ResultCache
+from .scheduler import WorkQueueScheduler
+from .utils import AsyncTaskProgress, TaskProgress
 logger = logging.getLogger("scraping")
-from queue import Queue
-
-class ResultSaver:
-    def __init__(self, product_list, user, batch_size: int = 20):
-        self.product_list = product_list
-        self.user = user
-        self.batch_size = batch_size
-        self.buffer = []
-
-    async def add_result(self, result: dict):
-        self.buffer.append(
-            ProductInfo(
-                user=self.user,
-                product_list=self.product_list,
-                product_id=result.get("asin"),
-                status=result.get("status"),
-                title=result.get("title"),
-                reviews=result.get("reviews"),
-                ratings=result.get("ratings"),
-                browse_node=result.get("browse_node"),
-                brand_name=result.get("brand_name"),
-                variations=result.get("variations"),
-                deal=result.get("deal"),
-                seller=result.get("seller"),
-                image_len=result.get("image_len"),
-                video=result.get("video"),
-                main_img_url=result.get("main_img_url"),
-                bullet_point_len=result.get("bullet_point_len"),
-                bsr1=result.get("bestSellerRank", ""),
-                bsr2="",  # optional fallback
-                price=result.get("price"),
-                mrp=result.get("MRP"),
-                availability=result.get("availability"),
-                description=result.get("description"),
-                a_plus=result.get("A_plus"),
-                store_link=result.get("store_link"),
-            )
-        )
-        if len(self.buffer) >= self.batch_size:
-            await self.flush()
-
-    async def flush(self):
-        if not self.buffer:
-            return
-        await sync_to_async(ProductInfo.objects.bulk_create)(
-            self.buffer,
-            batch_size=self.batch_size,
-            update_conflicts=True,
-            update_fields=[
-                "status", "title", "reviews", "ratings", "browse_node",
-                "brand_name", "variations", "deal", "seller", "image_len",
-                "video", "main_img_url", "bullet_point_len", "bsr1", "bsr2",
-                "price", "mrp", "availability", "description", "a_plus",
-                "store_link", "updated_at",
-            ],
-            unique_fields=["product_list", "product_id"],
-        )
-        self.buffer.clear()
-
-
-class BrowserLimiter:
-    def __init__(self, redis_url="redis://localhost", max_browsers=20):
-        self.redis_url = redis_url
-        self.max_browsers = max_browsers
-        self.redis = None
-
-    async def _get_redis(self):
-        if not self.redis:
-            self.redis = await aioredis.from_url(self.redis_url)
-        return self.redis
-
-    async def acquire(self):
-        redis = await self._get_redis()
-        while True:
-            count = await redis.incr("browser_count")
-            if count <= self.max_browsers:
-                return
-            await redis.decr("browser_count")
-            await asyncio.sleep(1)
-
-    async def release(self):
-        redis = await self._get_redis()
-        await redis.decr("browser_count")
-
-
-
-from asyncio import Queue, create_task, gather
 
 class AuditWorkers:
-    """Worker that processes a list of products using asyncio and browser limiter."""
-    def __init__(self, product_infos, total_products, browser_instances, product_list, user, task_id, batch_size=20, max_browsers=20):
+    """Processes products from one shared queue with a resizable number of browser slots."""
+    def __init__(self, product_infos, total_products, browser_instances, product_list, user, task_id, batch_size=None, item_timeout=None, shard=False, adaptive=None, completed=None, clock=time.monotonic):
         self.product_infos = product_infos
+        # A shard reports into its parent's progress, which the parent task
+        # initialises and marks done.
+        self.shard = shard
         self.browser_instances = browser_instances
-        self.saver = ResultSaver(product_list=product_list, user=user, batch_size=batch_size)
-        self.limiter = BrowserLimiter(max_browsers=max_browsers)
-        self.task_progress = TaskProgress(task_id) if task_id else None
+        # Products already committed by an earlier run of this task (resume).
+        self.completed = completed
+        self.checkpoint = AuditCheckpoint(task_id) if task_id else None
+        self.journal = AuditJournal(task_id, product_list.id) if task_id else None
+        self.saver = ResultSaver(
+            product_list=product_list,
+            user=user,
+            batch_size=batch_size,
+            on_commit=self.checkpoint.mark_done if self.checkpoint else None,
+            dead_letter=self.journal.dead_letter if self.journal else None,
+            clock=clock,
+        )
+        self.limiter = BrowserLimiter(task_id=task_id)
+        self.task_progress = AsyncTaskProgress(task_id) if task_id else None
+        self.archive = (
+            PageArchive(task_id, product_list.platform, product_list.id)
+            if task_id and settings.AUDIT_PAGE_ARCHIVE
+            else None
+        )
         self.total_products = total_products
+        self.pool = BrowserPool.for_current_loop()
+        self.http = AmazonHttpFetcher.for_current_loop() if settings.AUDIT_HTTP_FIRST else None
+        self.platform = product_list.platform
+        self.capture = (
+            ResponseCapture(rules_for(self.platform))
+            if settings.AUDIT_RESPONSE_CAPTURE and rules_for(self.platform)
+            else None
+        )
+        # The capture rules' endpoints get through even a dom-only profile.
+        self.interceptor = RequestInterceptor(
+            profile_for(self.platform),
+            allow=allowed_urls(self.capture.rules) if self.capture else (),
+        )
+        self.cache = ResultCache.for_current_loop(self.platform) if settings.AUDIT_RESULT_CACHE else None
+        self.served_from_cache = 0
+        # Adaptive concurrency: browser_instances is only the starting point.
+        self.adaptive = settings.AUDIT_ADAPTIVE_CONCURRENCY if adaptive is None else adaptive
+        self.controller = None
+        self.scheduler = WorkQueueScheduler(
+            self.process_product,
+            concurrency=browser_instances,
+            item_timeout=item_timeout or settings.AUDIT_ITEM_TIMEOUT,
+            on_failure=self.record_failure,
+            clock=clock,
+        )
+        self.retries = RetryQueue(self.scheduler)
+
+    def set_concurrency(self, browser_instances: int):
+        self.scheduler.resize(browser_instances)
+
+    async def scrape_product(self, product):
+        """Scrape over plain HTTP when the page allows it, otherwise in a browser.
+
+        Returns ``(result, captcha_seen, latency)``. Both describe the browser
+        page only, since browser slots are what the controller sizes: an HTTP
+        result has no latency, and a captcha that sent the product from HTTP
+        to the browser does not count.
+        """
+        on_page = partial(self._archive_page, product) if self.archive else None
+        if self.http:
+            result, _ = await self.http.scrape(product, on_page)
+            if result is not None:
+                return result, False, None
+
+        identities = IdentityPool.for_current_loop()
+        async with identities.borrow() as identity:
+            # Pace the identity before taking a fleet slot and a context, so
+            # the wait holds neither.
+            await HumanPacer.for_current_loop().before_navigation(identity.name)
+            async with self.limiter.slot():
+                async with self.pool.lease(self.interceptor, identity) as (context, context_settings):
+                    page_manager = AmazonPageManager(context, context_settings, self.capture)
+                    started = time.monotonic()
+                    result = await page_manager._navigate(product)
+                    await identities.record(identity.name, page_manager.captcha_seen)
+                    if on_page and page_manager.snapshot:
+                        await on_page(*page_manager.snapshot)
+                    return result, page_manager.captcha_seen, time.monotonic() - started
+
+    async def _archive_page(self, product, html, url):
+        await self.archive.store(product, html, url)
+
+    async def fetch_product(self, product):
+        """``scrape_product`` behind the shared result cache.
+
+        ``latency`` is None when the result came from the cache or from a
+        fetch another audit had in flight, since no browser page was loaded for it.
+        """
+        if not self.cache:
+            return await self.scrape_product(product)
+
+        scraped = None
+
+        async def fetch():
+            nonlocal scraped
+            scraped = await self.scrape_product(product)
+            return scraped[0]
+
+        result = await self.cache.get_or_fetch(product, fetch)
+        if scraped is None:
+            self.served_from_cache += 1
+            return result, False, None
+        return scraped
+
+    async def process_product(self, product):
+        result, captcha_seen, latency = await self.fetch_product(product)
+
+        if self.controller and latency is not None:
+            if result is None or captcha_seen:
+                outcome = CAPTCHA
+            elif result.get("status") == "Rush Hour":
+                outcome = RUSH_HOUR
+            else:
+                outcome = OK
+            self.controller.record(outcome, latency)
+
+        # Transient failures go back on the queue instead of being saved.
+        reason = None
+        if result is None:
+            reason = CAPTCHA
+        elif result.get("status") == "Rush Hour":
+            reason = RUSH_HOUR
+        elif result.get("status") == "error":
+            reason = NAVIGATION
+        if reason:
+            if self.retries.retry(product, reason):
+                return
+            result = {**(result or {"asin": product}), "status": gave_up_status(reason)}
 
-    async def worker(self, queue: Queue):
-        while True:
-            product = await queue.get()
-            if product is None:
-                queue.task_done()
-                break
-
-            await self.limiter.acquire()
-            try:
-                browser = BrowserManager()
-                context, context_settings = await browser.start()
-                page_manager = AmazonPageManager(context, context_settings)
-                result = await page_manager._navigate(product)
-
-                if isinstance(result, dict):
-                    await self.saver.add_result(result)
-                else:
-                    await self.saver.add_result({"asin": product, "status": "no_data"})
-
-                # Increment progress (sync call is fine)
-                if self.task_progress:
-                    self.task_progress.increment()
-
-            finally:
-                await browser.close()
-                await self.limiter.release()
-                queue.task_done()
-
-    async def run(self):
-        queue = asyncio.Queue()
-        # Fill queue
-        for product in self.product_infos:
-            await queue.put(product)
+        await self.save_result(result)
 
-        # Initialize task progress (sync)
+    async def record_failure(self, product, error: Exception):
+        if isinstance(error, asyncio.TimeoutError):
+            if self.retries.retry(product, TIMEOUT):
+                return
+            result = {"asin": product, "status": gave_up_status(TIMEOUT)}
+        else:
+            result = {"asin": product, "status": "error", "error": str(error)}
+        await self.save_result(result)
+
+    async def save_result(self, result: dict):
+        await self.saver.add_result(result)
+        if self.journal:
+            self.journal.write(result)
+        # Coalesced: published by the progress flusher a few times a second.
         if self.task_progress:
-            self.task_progress.init_task(total=self.total_products, user_id=self.saver.user.id)
-
-        # Start workers
-        tasks = [create_task(self.worker(queue)) for _ in range(self.browser_instances)]
-
-        # Wait until queue is fully processed
-        await queue.join()
+            self.task_progress.increment()
 
-        # Stop workers
-        for _ in range(self.browser_instances):
-            await queue.put(None)
-        await gather(*tasks, return_exceptions=True)
+    async def concurrency_bounds(self):
+        return await load_concurrency_bounds(self.platform)
 
-        # Flush saved results
-        await self.saver.flush()
+    async def watch_concurrency(self, interval: float = 5):
+        """Apply slot counts requested through ``TaskProgress.set_slots`` while the audit runs."""
+        while True:
+            await asyncio.sleep(interval)
+            slots = await self.task_progress.aget_slots()
+            if slots and slots != self.scheduler.concurrency:
+                self.set_concurrency(slots)
 
-        # Mark task as done (sync)
+    async def run(self):
+        background = []
+        await asyncio.to_thread(prune_journals)
+        if self.archive:
+            await sync_to_async(prune_archive)()
+        # Initialize task progress (sync)
         if self.task_progress:
-            self.task_progress.set_status("done")
-
-        return {"status": "success", "processed_count": len(self.product_infos)}
+            if not self.shard:
+                if self.completed is not None:
+                    self.task_progress.resume_task(count=self.completed)
+                else:
+                    self.task_progress.init_task(
+                        total=self.total_products,
+                        user_id=self.saver.user.id,
+                        product_list_id=self.saver.product_list.id,
+                    )
+            background.append(asyncio.create_task(self.watch_concurrency()))
+
+        # What other workers learned about field latencies since the last audit.
+        await FieldTimings.for_current_loop().load()
+
+        if self.adaptive:
+            min_slots, max_slots = await self.concurrency_bounds()
+            self.controller = AIMDController(self.scheduler, min_slots, max_slots, clock=self.scheduler.clock)
+            self.scheduler.resize(min(max(self.browser_instances, min_slots), max_slots))
+            background.append(asyncio.create_task(self.controller.run()))
+
+        try:
+            stats = await self.scheduler.run(self.product_infos)
+        finally:
+            for task in background:
+                task.cancel()
+            # Drain the write-behind queue even when the audit is cancelled.
+            await asyncio.shield(self.saver.close())
+            if self.task_progress:
+                await asyncio.shield(self.task_progress.close())
+            if self.journal:
+                await asyncio.shield(self.journal.close())
+            if self.archive:
+                await asyncio.shield(self.archive.close())
+            if self.checkpoint:
+                await self.checkpoint.close()
+
+        if self.controller:
+            stats["concurrency"] = self.controller.snapshot()
+        stats["retries"] = self.retries.stats()
+        if self.http:
+            stats["http"] = self.http.stats()
+        stats["interception"] = self.interceptor.stats()
+        if self.capture:
+            stats["capture"] = self.capture.stats()
+        stats["captcha"] = CaptchaService.for_current_loop().stats()
+        stats["identities"] = IdentityPool.for_current_loop().stats()
+        if self.archive:
+            stats["archive"] = self.archive.stats()
+        if self.cache:
+            stats["result_cache"] = {"served": self.served_from_cache, **self.cache.stats()}
+        # Keep what this run learned about field latencies for the next one.
+        field_timings = FieldTimings.for_current_loop()
+        await field_timings.save()
+        stats["field_timings"] = field_timings.stats()
+        stats["persistence"] = self.saver.stats()
+        if self.journal:
+            stats["journal"] = self.journal.stats()
+        logger.info(f"scheduler stats: {stats}")
+        logger.info(f"browser pool after run: {self.pool.stats()}")
+
+        # Mark task as done; a shard's parent is marked by its finalizer.
+        if self.task_progress and not self.shard:
+            await self.task_progress.aset_status("done")
+            await self.task_progress.close()
+
+        # Count what an earlier run of this task committed as well, so a resumed
+        # run (or shard) reports the same total as an uninterrupted one.
+        processed = (self.completed or 0) + len(self.product_infos)
+        return {"status": "success", "processed_count": processed, "scheduler": stats}
 
 
 class RunAudit:
+    workers_class = AuditWorkers
+
     def __init__(self, product_list_id, task_id):
         self.product_list_id = product_list_id
         self.product_list = None
         self.task_id = task_id
+        self.workers = None
 
     async def load_product_list(self):
         from scraping.models import ProductList
@@ -176,7 +289,9 @@ class RunAudit:
     async def get_user(self):
         return await sync_to_async(lambda: self.product_list.user)()
 
-    async def get_product_infos(self, reaudit=False):
+    async def get_product_infos(self, reaudit=False, incremental=False):
+        if incremental:
+            return await sync_to_async(self.get_stale_product_ids)()
         if reaudit:
             status = ['Live','Suppressed', 'Suppressed Asin Changed']
             return await sync_to_async(list)(
@@ -187,37 +302,72 @@ class RunAudit:
                 self.product_list.products_list.values_list("product_id", flat=True)
             )
 
-    async def run(self,reaudit, max_browsers, batch_size, ):
+    def get_stale_product_ids(self):
+        """Products not audited within AUDIT_FRESHNESS_HOURS, most urgent first.
+
+        Never-audited products come first; the rest are ranked by hours since
+        their last audit times (1 + how often an audit found them changed), so
+        volatile products are refreshed before stable ones of the same age.
+        """
+        now = timezone.now()
+        cutoff = now - timedelta(hours=settings.AUDIT_FRESHNESS_HOURS)
+        rows = self.product_list.products_list.filter(
+            Q(last_audited_at__isnull=True) | Q(last_audited_at__lt=cutoff)
+        ).values_list("product_id", "last_audited_at", "change_count")
+
+        def urgency(row):
+            _, last_audited_at, change_count = row
+            if last_audited_at is None:
+                return float("inf")
+            hours = (now - last_audited_at).total_seconds() / 3600
+            return hours * (1 + change_count)
+
+        ranked = [row[0] for row in sorted(rows, key=urgency, reverse=True)]
+        limit = settings.AUDIT_INCREMENTAL_LIMIT
+        return ranked[:limit] if limit else ranked
+
+    def set_concurrency(self, max_browsers: int):
+        if self.workers:
+            self.workers.set_concurrency(max_browsers)
+
+    async def run(self,reaudit, max_browsers, batch_size=None, product_ids=None, shard=False, resume=False, incremental=False):
         await self.load_product_list()
-        product_infos = await self.get_product_infos(reaudit)
-        print(f"product infos {len(product_infos)} reAudit is {reaudit}")
+        if product_ids is not None:
+            product_infos = list(product_ids)
+        else:
+            product_infos = await self.get_product_infos(reaudit, incremental)
+        print(f"product infos {len(product_infos)} reAudit is {reaudit} incremental is {incremental}")
         if not product_infos:
             return {"status": "error", "message": "No products found in this list"}
 
+        completed = None
+        if resume:
+            # Skip everything this task already committed and keep its counters.
+            done = await asyncio.to_thread(AuditCheckpoint(self.task_id).completed)
+            # Shards share their parent's checkpoint; each counts only its own products.
+            completed = sum(1 for p in product_infos if p in done) if shard else len(done)
+            product_infos = [p for p in product_infos if p not in done]
+            print(f"resuming {self.task_id}: {completed} done, {len(product_infos)} left")
+            if not product_infos:
+                if not shard:
+                    progress = TaskProgress(self.task_id)
+                    progress.set_count(completed)
+                    progress.set_status("done")
+                return {"status": "success", "processed_count": completed, "resumed": completed}
+
         user = await self.get_user()
-      
-        
-        import math
-        total_products = len(product_infos)
-        chunk_size = math.ceil(total_products / max_browsers)
-        product_chunks = [
-            product_infos[i:i + chunk_size] for i in range(0, total_products, chunk_size)
-        ]
-
-
-        workers = [
-            AuditWorkers(
-                product_infos=chunk,
-                total_products = total_products,
-                browser_instances=1,
-                product_list=self.product_list,
-                user=user,
-                task_id = self.task_id,
-                batch_size=batch_size,
-                max_browsers=max_browsers,
-            )
-            for chunk in product_chunks
-        ]
 
-        await asyncio.gather(*(w.run() for w in workers))
-        return {"status": "success", "processed_count": total_products}
+        # One shared queue for the whole list; every browser slot pulls the
+        # next product as soon as it is free.
+        self.workers = self.workers_class(
+            product_infos=product_infos,
+            total_products=len(product_infos),
+            browser_instances=max_browsers,
+            product_list=self.product_list,
+            user=user,
+            task_id=self.task_id,
+            batch_size=batch_size,
+            shard=shard,
+            completed=completed,
+        )
+        return await self.workers.run()
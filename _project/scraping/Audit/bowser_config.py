@@ -1,16 +1,15 @@
 import logging
-import random
-import asyncio
 
 from typing import Dict, Any
-from playwright.async_api import Page, Browser, BrowserContext, Response
+from django.conf import settings
+from playwright.async_api import Page, Browser, BrowserContext
 from playwright.async_api import async_playwright
 
+from .pacing import wait_for_content
 from .utils import (
     handle_captcha,
-    handle_network_response,
+    is_captcha_present,
     create_spoofed_context,
-    spoof_browser_fingerprint,
 )
 
 logger = logging.getLogger("scraping")
@@ -22,6 +21,12 @@ class ScrapingLogic:
         self.product_id = product_id
         self.file_name = f"./scraping.csv"
         self.context_settings = context_settings
+        # (html, url) of the page, kept for the page archive.
+        self.snapshot = None
+        # Seconds spent on the status check and on each extracted field.
+        self.field_latency: dict = {}
+        # PageCapture of the page's JSON responses, if capture is on.
+        self.capture = None
 
     def _status(self):
         raise NotImplementedError
@@ -69,7 +74,7 @@ class BrowserManager:
     async def start(self):
         self.playwright = await async_playwright().start()
         self.browser = await self.playwright.chromium.launch(
-            headless=self.headless, slow_mo=50
+            headless=self.headless, slow_mo=settings.AUDIT_BROWSER_SLOW_MO
         )
         self.context, self.context_settings = await create_spoofed_context(self.browser)
         return self.context, self.context_settings
@@ -84,17 +89,24 @@ class BrowserManager:
 
 
 class PageManager:
-    def __init__(self, context: BrowserContext, context_settings: dict):
+    def __init__(self, context: BrowserContext, context_settings: dict, capture=None):
         self.context = context
         self.context_settings = context_settings
+        # ResponseCapture shared by the audit; each page gets its own PageCapture.
+        self.capture = capture
         self.page: Page | None = None
-
-    async def change_browser_fingerprints(self, page, context_settings):
-        return await spoof_browser_fingerprint(page, context_settings)
+        self.captcha_seen = False
+        self.snapshot = None
+        self.field_latency: dict = {}
 
 
 class AmazonPageManager(PageManager):
     async def _handle_captcha(self) -> bool:
+        # Even a solved captcha means Amazon is pushing back; the concurrency
+        # controller counts it.
+        self.captcha_seen = await is_captcha_present(self.page)
+        if not self.captcha_seen:
+            return True
         captcha_result = await handle_captcha(self.page)
         if not captcha_result:
             logger.info(f"captcha not solved")
@@ -107,23 +119,24 @@ class AmazonPageManager(PageManager):
         self.page = None
         try:
             self.page = await self.context.new_page()
-            self.page.on("response", handle_network_response)
-            await self.change_browser_fingerprints(self.page, self.context_settings)
+            page_capture = self.capture.attach(self.page, asin) if self.capture else None
 
-            url = f"https://www.amazon.in/dp/{asin}"
+            url = f"{settings.AMAZON_BASE_URL}/dp/{asin}"
             logger.warning(f"Navigating to {url}")
             await self.page.goto(url, timeout=20000, wait_until="domcontentloaded")
-            await self.page.wait_for_load_state("domcontentloaded")
-            await asyncio.sleep(random.uniform(3, 5))
+            await wait_for_content(self.page)
 
             if not await self._handle_captcha():
                 return None
 
             logger.warning(f"Page loaded for {asin}")
             scraping_logic = AmazonScrapingLogic(self.page, asin, self.context_settings)
+            scraping_logic.capture = page_capture
 
             # IMPORTANT: get the dict result from your scraper
             result: Dict[str, Any] = await scraping_logic._run_scraper()
+            self.snapshot = scraping_logic.snapshot
+            self.field_latency = scraping_logic.field_latency
             # ensure the result at least carries the asin
             if isinstance(result, dict) and "asin" not in result:
                 result["asin"] = asin
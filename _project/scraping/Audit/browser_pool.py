@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from playwright.async_api import Browser, async_playwright
+
+from .identity import IdentityPool
+from .utils import create_spoofed_context
+
+logger = logging.getLogger("scraping")
+
+
+class PooledBrowser:
+    """A warm Chromium instance plus the bookkeeping needed to recycle it."""
+
+    def __init__(self, browser: Browser, index: int):
+        self.browser = browser
+        self.index = index
+        self.launched_at = time.monotonic()
+        self.pages_served = 0
+        self.active = 0
+        self.retiring = False
+
+    def is_expired(self, max_pages: int, max_age: float) -> bool:
+        if not self.browser.is_connected():
+            return True
+        if max_pages and self.pages_served >= max_pages:
+            return True
+        if max_age and time.monotonic() - self.launched_at >= max_age:
+            return True
+        return False
+
+
+class BrowserPool:
+    """Keeps N Chromium instances warm and leases a fresh context per product.
+
+    A browser is recycled once it has served ``max_pages`` pages or is older
+    than ``max_age`` seconds; the replacement is launched straight away and the
+    old instance is closed as soon as its last lease is returned.
+    """
+
+    _pools: dict = {}
+
+    def __init__(self, size=None, max_pages=None, max_age=None, headless=True):
+        self.size = size or settings.AUDIT_BROWSER_POOL_SIZE
+        self.max_pages = (
+            settings.AUDIT_BROWSER_MAX_PAGES if max_pages is None else max_pages
+        )
+        self.max_age = settings.AUDIT_BROWSER_MAX_AGE if max_age is None else max_age
+        self.headless = headless
+        self.playwright = None
+        self.browsers: list[PooledBrowser] = []
+        self.retiring: list[PooledBrowser] = []
+        self.recycled = 0
+        self.leases_served = 0
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def for_current_loop(cls) -> "BrowserPool":
+        """Return the pool bound to the running event loop, creating it if needed.
+
+        Playwright objects cannot move between event loops, so a pool lives as
+        long as the loop it was created on (one per Celery worker process).
+        """
+        loop = asyncio.get_running_loop()
+        pool = cls._pools.get(loop)
+        if pool is None:
+            pool = cls._pools[loop] = cls()
+        return pool
+
+    async def start(self):
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        while len(self.browsers) < self.size:
+            self.browsers.append(await self._launch(len(self.browsers)))
+        logger.info(f"browser pool started with {len(self.browsers)} browsers")
+
+    async def _launch(self, index: int) -> PooledBrowser:
+        browser = await self.playwright.chromium.launch(
+            headless=self.headless, slow_mo=settings.AUDIT_BROWSER_SLOW_MO
+        )
+        return PooledBrowser(browser, index)
+
+    async def _checkout(self) -> PooledBrowser:
+        async with self._lock:
+            if self.playwright is None or not self.browsers:
+                await self.start()
+
+            for i, pooled in enumerate(self.browsers):
+                if pooled.is_expired(self.max_pages, self.max_age):
+                    pooled.retiring = True
+                    self.retiring.append(pooled)
+                    self.browsers[i] = await self._launch(i)
+                    self.recycled += 1
+                    logger.info(
+                        f"recycling browser {i} after {pooled.pages_served} pages"
+                    )
+                    await self._close_idle_retired()
+
+            pooled = min(self.browsers, key=lambda b: b.active)
+            pooled.active += 1
+            pooled.pages_served += 1
+            self.leases_served += 1
+            return pooled
+
+    async def _checkin(self, pooled: PooledBrowser):
+        async with self._lock:
+            pooled.active -= 1
+            await self._close_idle_retired()
+
+    async def _close_idle_retired(self):
+        for pooled in [b for b in self.retiring if b.active == 0]:
+            self.retiring.remove(pooled)
+            try:
+                await pooled.browser.close()
+            except Exception as e:
+                logger.warning(f"error closing retired browser {pooled.index}: {e}")
+
+    @asynccontextmanager
+    async def lease(self, interceptor=None, identity=None):
+        """Lease a fresh context from the least busy browser.
+
+        The context presents an identity from ``IdentityPool`` and starts with
+        that identity's cookies; the cookies it ends with are handed back.
+
+        Args:
+            interceptor (RequestInterceptor, optional): installed on the context
+                before it is handed out.
+            identity (Identity, optional): an identity the caller has already
+                borrowed from ``IdentityPool``; one is checked out otherwise.
+
+        Yields:
+            Tuple[BrowserContext, Dict[str, Any]]: the context and its settings.
+        """
+        pooled = await self._checkout()
+        identities = IdentityPool.for_current_loop()
+        owned = identity is None
+        if owned:
+            identity = await identities.checkout()
+        context = None
+        storage_state = None
+        try:
+            context, context_settings = await create_spoofed_context(pooled.browser, identity)
+            if interceptor is not None:
+                await interceptor.attach(context)
+            yield context, context_settings
+        finally:
+            if context is not None:
+                try:
+                    storage_state = await context.storage_state()
+                except Exception as e:
+                    logger.info(f"could not read cookies of identity {identity.name}: {e}")
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"error closing leased context: {e}")
+            if owned:
+                await identities.checkin(identity, storage_state)
+            elif storage_state is not None:
+                identities.store(identity, storage_state)
+            await self._checkin(pooled)
+
+    def stats(self) -> dict:
+        """Current pool occupancy."""
+        return {
+            "browsers": len(self.browsers),
+            "retiring": len(self.retiring),
+            "active_leases": sum(b.active for b in self.browsers + self.retiring),
+            "leases_served": self.leases_served,
+            "recycled": self.recycled,
+            "pages_per_browser": [b.pages_served for b in self.browsers],
+        }
+
+    async def close(self):
+        async with self._lock:
+            for pooled in self.browsers + self.retiring:
+                try:
+                    await pooled.browser.close()
+                except Exception:
+                    pass
+            self.browsers.clear()
+            self.retiring.clear()
+            if self.playwright is not None:
+                await self.playwright.stop()
+                self.playwright = None
+        for loop, pool in list(self._pools.items()):
+            if pool is self:
+                del self._pools[loop]
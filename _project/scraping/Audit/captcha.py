@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import aiohttp
+import billiard
+from amazoncaptcha import AmazonCaptcha
+from django.conf import settings
+from playwright.async_api import Page
+
+logger = logging.getLogger("scraping")
+
+# What AmazonCaptcha.solve() returns when it cannot read the letters.
+NOT_SOLVED = "Not solved"
+
+
+def solve_image(data: bytes) -> str:
+    """Solve one captcha image (process pool entry point)."""
+    return AmazonCaptcha(BytesIO(data)).solve()
+
+
+class CaptchaService:
+    """Solves Amazon captchas without blocking the event loop.
+
+    The image is downloaded once through a pooled aiohttp session and solved
+    from memory in a process pool shared by every loop of the process. The
+    pool forks through billiard, which unlike multiprocessing lets the
+    daemonic Celery prefork children have children of their own. Solutions
+    are cached by image hash, since Amazon serves the same images over and
+    over; one the page rejects is dropped from the cache again.
+    """
+
+    _services: dict = {}
+    _executor: ProcessPoolExecutor | None = None
+    _threads_only = False
+
+    def __init__(self, workers=None, cache_size=None, timeout=None):
+        self.workers = workers or settings.AUDIT_CAPTCHA_WORKERS
+        self.cache_size = cache_size or settings.AUDIT_CAPTCHA_CACHE_SIZE
+        self.timeout = timeout or settings.AUDIT_CAPTCHA_TIMEOUT
+        self.session: aiohttp.ClientSession | None = None
+        self.solutions: OrderedDict = OrderedDict()
+        self.latencies: deque = deque(maxlen=500)
+        self.requests = 0
+        self.cache_hits = 0
+        self.solved = 0
+        self.unsolved = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.fetch_failures = 0
+
+    @classmethod
+    def for_current_loop(cls) -> "CaptchaService":
+        loop = asyncio.get_running_loop()
+        service = cls._services.get(loop)
+        if service is None:
+            service = cls._services[loop] = cls()
+        return service
+
+    def _get_executor(self):
+        if CaptchaService._executor is None and not CaptchaService._threads_only:
+            try:
+                CaptchaService._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=billiard.get_context("fork")
+                )
+            except (OSError, ValueError) as e:
+                self._use_threads(e)
+        return CaptchaService._executor
+
+    @staticmethod
+    def shutdown_pool():
+        """Stop the solver processes; a worker exiting without this leaves them orphaned."""
+        executor, CaptchaService._executor = CaptchaService._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _use_threads(reason):
+        # A thread still keeps the solve off the event loop.
+        logger.warning(f"captcha process pool unavailable, solving in threads: {reason}")
+        CaptchaService._threads_only = True
+        executor, CaptchaService._executor = CaptchaService._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _solve_image(self, data: bytes) -> str:
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        if executor is not None:
+            try:
+                return await loop.run_in_executor(executor, solve_image, data)
+            except (AssertionError, OSError, BrokenProcessPool) as e:
+                # The pool's workers start on the first submit, which is
+                # where forking fails.
+                self._use_threads(e)
+        return await loop.run_in_executor(None, solve_image, data)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self.session
+
+    async def fetch(self, src: str) -> bytes | None:
+        try:
+            async with self._get_session().get(src) as response:
+                if response.status == 200:
+                    return await response.read()
+                logger.info(f"captcha image {src} returned {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.info(f"could not fetch captcha image {src}: {e}")
+        self.fetch_failures += 1
+        return None
+
+    async def solve(self, src: str) -> str | None:
+        """Text of the captcha image at ``src``, or None if it can't be read."""
+        return (await self._solve(src))[1]
+
+    async def _solve(self, src: str):
+        """``(image hash, text)`` of the captcha image at ``src``."""
+        self.requests += 1
+        started = time.monotonic()
+        data = await self.fetch(src)
+        if data is None:
+            return None, None
+
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        solution = self.solutions.get(digest)
+        if solution is not None:
+            self.solutions.move_to_end(digest)
+            self.cache_hits += 1
+            self.solved += 1
+            return digest, solution
+
+        try:
+            solution = await self._solve_image(data)
+        except Exception as e:
+            logger.warning(f"captcha solver failed: {e}")
+            solution = None
+        self.latencies.append(time.monotonic() - started)
+
+        if not solution or solution == NOT_SOLVED:
+            self.unsolved += 1
+            return digest, None
+        self.solved += 1
+        self.solutions[digest] = solution
+        if len(self.solutions) > self.cache_size:
+            self.solutions.popitem(last=False)
+        return digest, solution
+
+    async def solve_page(self, page: Page) -> bool:
+        """Solve the captcha shown on ``page`` and submit it.
+
+        True only if the page that loads afterwards no longer asks for a captcha.
+        """
+        captcha_image = await page.query_selector("img[src*='captcha']")
+        if not captcha_image:
+            logger.info("no captcha image found")
+            return False
+
+        digest, solution = await self._solve(await captcha_image.get_attribute("src"))
+        if solution is None:
+            return False
+
+        captcha_input = await page.query_selector("#captchacharacters")
+        await captcha_input.click()
+        await captcha_input.type(solution, delay=100)
+        submit_button = await page.query_selector('button[type="submit"]')
+        await submit_button.click()
+        await page.wait_for_load_state("load", timeout=60000)
+        if await page.query_selector("#captchacharacters"):
+            self.rejected += 1
+            self.solutions.pop(digest, None)
+            return False
+        self.accepted += 1
+        return True
+
+    def stats(self) -> dict:
+        # Solver output only counts as a success once the page accepted it.
+        attempted = self.solved + self.unsolved
+        ordered = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "solved": self.solved,
+            "unsolved": self.unsolved,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "fetch_failures": self.fetch_failures,
+            "cache_hits": self.cache_hits,
+            "success_rate": round(self.accepted / attempted, 3) if attempted else None,
+            "p50_solve_latency": round(ordered[len(ordered) // 2], 3) if ordered else None,
+            "p95_solve_latency": round(ordered[int(len(ordered) * 0.95) - 1], 3) if len(ordered) >= 20 else None,
+        }
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        for loop, service in list(self._services.items()):
+            if service is self:
+                del self._services[loop]
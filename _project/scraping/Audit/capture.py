@@ -0,0 +1,289 @@
+import asyncio
+import json
+import logging
+import re
+
+from django.conf import settings
+from playwright.async_api import Page, Response
+
+from .amazon_regular import clean_availability
+
+logger = logging.getLogger("scraping")
+
+JSON_TYPES = ("application/json", "text/json", "application/x-javascript", "text/javascript")
+# Amazon's twister endpoints stream several JSON documents separated by this.
+CHUNK_SEPARATOR = "&&&"
+
+
+def json_payloads(body: bytes) -> list:
+    """Every JSON document in ``body``: a single document, or ``&&&``-separated chunks."""
+    text = body.decode("utf-8", errors="replace").strip()
+    chunks = text.split(CHUNK_SEPARATOR) if CHUNK_SEPARATOR in text else [text]
+    payloads = []
+    for chunk in chunks:
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        try:
+            payloads.append(json.loads(chunk))
+        except json.JSONDecodeError:
+            continue
+    return payloads
+
+
+def find_key(payload, keys):
+    """First value stored under one of ``keys`` anywhere in ``payload``."""
+    pending = [payload]
+    while pending:
+        current = pending.pop(0)
+        if isinstance(current, dict):
+            for key in keys:
+                if current.get(key) not in (None, "", [], {}):
+                    return current[key]
+            pending.extend(current.values())
+        elif isinstance(current, list):
+            pending.extend(current)
+    return None
+
+
+def asin_nodes(payload, asin: str):
+    """Every object in ``payload`` that describes ``asin`` itself.
+
+    Twister and buy-box payloads also carry sibling variants, sponsored items
+    and accessories; only objects whose own ``asin`` is the audited one count.
+    """
+    pending = [payload]
+    while pending:
+        current = pending.pop(0)
+        if isinstance(current, dict):
+            if current.get("asin") == asin:
+                yield current
+            pending.extend(current.values())
+        elif isinstance(current, list):
+            pending.extend(current)
+
+
+def _amount(value):
+    if isinstance(value, dict):
+        value = find_key(value, ("priceAmount", "amount", "value"))
+    if isinstance(value, str):
+        value = re.sub(r"[^\d.]", "", value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def twister_fields(payloads, asin: str) -> dict:
+    """``variations`` from the twister (variation picker) payloads."""
+    for payload in payloads:
+        dimension_map = find_key(payload, ("dimensionToAsinMap",))
+        # The map lists the variants of the family the page belongs to.
+        if isinstance(dimension_map, dict) and asin in dimension_map.values() and len(dimension_map) > 1:
+            return {"variations": "Available"}
+        for node in asin_nodes(payload, asin):
+            if find_key(node, ("dimensionValuesDisplayData", "variationValues")):
+                return {"variations": "Available"}
+    return {}
+
+
+def offer_fields(payloads, asin: str) -> dict:
+    """``price``, ``MRP`` and ``availability`` of ``asin`` from the buy-box price data."""
+    fields = {}
+    for payload in payloads:
+        for node in asin_nodes(payload, asin):
+            price = _amount(find_key(node, ("priceAmount", "buyingPrice")))
+            if price is not None and "price" not in fields:
+                # Same shape as the a-price-whole text the DOM path cleans.
+                fields["price"] = f"{int(price)}."
+            mrp = _amount(find_key(node, ("basisPrice", "strikePrice", "listPrice")))
+            if mrp is not None and "MRP" not in fields:
+                fields["MRP"] = mrp
+            availability = find_key(node, ("availability",))
+            if isinstance(availability, dict):
+                availability = find_key(availability, ("primaryMessage", "message", "text"))
+            if isinstance(availability, str) and "availability" not in fields:
+                fields["availability"] = clean_availability(availability)
+    return fields
+
+
+# What extraction leaves in a field it could not read.
+MISSING_VALUES = (None, "", "N/A", 0, "0")
+
+
+def fill_gaps(fields: dict, captured: dict) -> tuple:
+    """``fields`` with captured values only where the DOM found nothing.
+
+    Returns the merged fields and the names of fields where the DOM and the
+    captured value disagree, for cross-checking the capture rules.
+    """
+    merged = dict(fields)
+    mismatches = []
+    for field, value in captured.items():
+        current = merged.get(field)
+        if current in MISSING_VALUES:
+            merged[field] = value
+        elif str(current) != str(value):
+            mismatches.append(field)
+    return merged, mismatches
+
+
+class CaptureRule:
+    """Which responses to buffer and how to turn their JSON into result fields.
+
+    ``url_pattern`` is a regex searched in the response URL; only responses of
+    ``resource_types`` whose content type starts with one of ``content_types``
+    have their body read.
+    """
+
+    def __init__(self, name, url_pattern, parser, content_types=JSON_TYPES, resource_types=("xhr", "fetch")):
+        self.name = name
+        self.url_pattern = re.compile(url_pattern)
+        self.parser = parser
+        self.content_types = content_types
+        self.resource_types = resource_types
+
+    def matches(self, response: Response) -> bool:
+        if response.status != 200 or not self.url_pattern.search(response.url):
+            return False
+        if response.request.resource_type not in self.resource_types:
+            return False
+        content_type = response.headers.get("content-type", "").lower()
+        return content_type.startswith(self.content_types)
+
+
+CAPTURE_RULES = {
+    "amazon": (
+        CaptureRule("twister", r"/gp/product/ajax/twisterDimensionSlots|/gp/twister/ajaxv2\b", twister_fields),
+        CaptureRule("offers", r"/gp/product/ajax/buying-options-price-data\b|/gp/buybox/ajax/", offer_fields),
+    ),
+}
+
+
+def rules_for(platform: str) -> tuple:
+    return CAPTURE_RULES.get(platform, ())
+
+
+def allowed_urls(rules) -> tuple:
+    """URL patterns the interceptor must let through for ``rules`` to see anything."""
+    return tuple(rule.url_pattern for rule in rules)
+
+
+class ResponseCapture:
+    """Reads product data out of the JSON responses a page receives.
+
+    One capture lives per audit, like ``RequestInterceptor``, so its counters
+    cover every page. ``attach`` returns a ``PageCapture`` holding what one
+    page yielded; responses no rule matches are never read. Fields in
+    ``trusted`` are taken from the responses and their DOM probes skipped;
+    other captured values only fill fields the DOM left empty, and
+    disagreements are counted per field in ``mismatches`` so the rules can be
+    checked before a field is trusted.
+    """
+
+    def __init__(self, rules, max_bytes=None, trusted=None):
+        self.rules = rules
+        self.max_bytes = max_bytes or settings.AUDIT_CAPTURE_MAX_BYTES
+        self.trusted = frozenset(settings.AUDIT_CAPTURE_TRUSTED_FIELDS if trusted is None else trusted)
+        self.responses = 0
+        self.buffered = 0
+        self.buffered_bytes = 0
+        self.skipped_large = 0
+        self.parse_failures = 0
+        self.fields_captured = 0
+        self.fields_filled = 0
+        self.probes_skipped = 0
+        self.mismatches: dict = {}
+
+    def attach(self, page: Page, asin: str) -> "PageCapture":
+        return PageCapture(self, page, asin)
+
+    def trusted_fields(self, captured: dict) -> dict:
+        """The captured fields that replace their DOM probes."""
+        return {field: value for field, value in captured.items() if field in self.trusted}
+
+    def merge(self, fields: dict, captured: dict) -> dict:
+        """Fill the DOM's gaps from ``captured`` and count disagreements."""
+        merged, mismatches = fill_gaps(fields, captured)
+        self.fields_filled += sum(1 for f in captured if merged.get(f) != fields.get(f))
+        for field in mismatches:
+            self.mismatches[field] = self.mismatches.get(field, 0) + 1
+        return merged
+
+    def stats(self) -> dict:
+        return {
+            "rules": [rule.name for rule in self.rules],
+            "responses": self.responses,
+            "buffered": self.buffered,
+            "buffered_bytes": self.buffered_bytes,
+            "skipped_large": self.skipped_large,
+            "parse_failures": self.parse_failures,
+            "fields_captured": self.fields_captured,
+            "fields_filled": self.fields_filled,
+            "probes_skipped": self.probes_skipped,
+            "mismatches": dict(self.mismatches),
+        }
+
+
+class PageCapture:
+    def __init__(self, capture: ResponseCapture, page: Page, asin: str):
+        self.capture = capture
+        self.asin = asin
+        self.fields: dict = {}
+        self.pending: set = set()
+        page.on("response", self._on_response)
+
+    def _on_response(self, response: Response):
+        # Synchronous on purpose: unmatched responses cost no task and no read.
+        capture = self.capture
+        capture.responses += 1
+        for rule in capture.rules:
+            if rule.matches(response):
+                try:
+                    length = int(response.headers.get("content-length", 0))
+                except ValueError:
+                    length = 0
+                if length > capture.max_bytes:
+                    capture.skipped_large += 1
+                    return
+                task = asyncio.ensure_future(self._read(rule, response))
+                self.pending.add(task)
+                task.add_done_callback(self.pending.discard)
+                return
+
+    async def _read(self, rule: CaptureRule, response: Response):
+        capture = self.capture
+        try:
+            body = await response.body()
+        except Exception as e:
+            logger.info(f"could not read {rule.name} response {response.url}: {e}")
+            return
+        capture.buffered += 1
+        capture.buffered_bytes += len(body)
+        try:
+            fields = rule.parser(json_payloads(body), self.asin)
+        except Exception as e:
+            capture.parse_failures += 1
+            logger.info(f"could not parse {rule.name} response {response.url}: {e}")
+            return
+        for field, value in fields.items():
+            if field not in self.fields:
+                self.fields[field] = value
+                capture.fields_captured += 1
+
+    def trusted_fields(self, captured: dict) -> dict:
+        return self.capture.trusted_fields(captured)
+
+    def skipped_probes(self, fields: dict):
+        self.capture.probes_skipped += len(fields)
+
+    def merge(self, fields: dict, captured: dict) -> dict:
+        return self.capture.merge(fields, captured)
+
+    async def collect(self, timeout=None) -> dict:
+        """Fields captured so far, after waiting up to ``timeout`` seconds for
+        bodies still being read."""
+        if self.pending:
+            timeout = settings.AUDIT_CAPTURE_WAIT if timeout is None else timeout
+            await asyncio.wait(set(self.pending), timeout=timeout)
+        return dict(self.fields)
@@ -0,0 +1,46 @@
+import logging
+
+import aioredis
+import redis
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+
+class AuditCheckpoint:
+    """The product IDs of an audit run whose results are committed to the database.
+
+    IDs are added by the result writer only after their batch has committed, so
+    a run resumed under the same task id can skip exactly those products. The
+    set expires ``ttl`` seconds after the last write.
+    """
+
+    def __init__(self, task_id: str, redis_url="redis://localhost:6379", ttl=None):
+        self.task_id = task_id
+        self.redis_url = redis_url
+        self.key = f"task_done:{task_id}"
+        self.ttl = ttl or settings.AUDIT_CHECKPOINT_TTL
+        self.async_redis = None
+
+    async def _get_redis(self):
+        if self.async_redis is None:
+            self.async_redis = await aioredis.from_url(self.redis_url, decode_responses=True)
+        return self.async_redis
+
+    async def mark_done(self, product_ids):
+        if not product_ids:
+            return
+        redis_client = await self._get_redis()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.sadd(self.key, *product_ids)
+        pipe.expire(self.key, self.ttl)
+        await pipe.execute()
+
+    def completed(self) -> set:
+        r = redis.Redis.from_url(self.redis_url, decode_responses=True)
+        return r.smembers(self.key)
+
+    async def close(self):
+        if self.async_redis is not None:
+            await self.async_redis.close()
+            self.async_redis = None
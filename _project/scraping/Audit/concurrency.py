@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+OK = "ok"
+CAPTCHA = "captcha"
+RUSH_HOUR = "rush_hour"
+BLOCK_OUTCOMES = (CAPTCHA, RUSH_HOUR)
+
+
+async def load_concurrency_bounds(platform: str):
+    """(min, max) browser slots for ``platform`` from the admin preferences."""
+    from scraping.models import AdminPref
+
+    pref = await sync_to_async(AdminPref.objects.order_by("id").first)()
+    if pref is None:
+        return settings.AUDIT_MIN_BROWSERS, settings.AUDIT_MAX_BROWSERS
+    return (
+        getattr(pref, f"{platform}_min_browsers", settings.AUDIT_MIN_BROWSERS),
+        getattr(pref, f"{platform}_max_browsers", settings.AUDIT_MAX_BROWSERS),
+    )
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease control of browser slots.
+
+    Outcomes and latencies of browser navigations are kept over a sliding
+    ``window``. While the block rate (captchas + Rush Hour pages) stays under
+    ``low_block_rate`` and latency has not degraded, one slot is added per
+    tick; when it goes over ``high_block_rate`` the slot count is cut by
+    ``decrease_factor`` and the window is cleared so the cut is judged on
+    fresh samples only.
+
+    The baseline latency follows a faster p50 at once and a slower one by
+    ``baseline_recovery`` of the gap per decision, so one unusually fast
+    window does not make every later page look congested.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        min_slots: int,
+        max_slots: int,
+        window: float = 60,
+        interval: float = 10,
+        min_samples: int = 10,
+        low_block_rate: float = 0.02,
+        high_block_rate: float = 0.10,
+        decrease_factor: float = 0.5,
+        latency_slack: float = 1.5,
+        baseline_recovery: float = 0.1,
+        clock=time.monotonic,
+    ):
+        self.scheduler = scheduler
+        self.min_slots = max(1, min_slots)
+        self.max_slots = max(self.min_slots, max_slots)
+        self.window = window
+        self.interval = interval
+        self.min_samples = min_samples
+        self.low_block_rate = low_block_rate
+        self.high_block_rate = high_block_rate
+        self.decrease_factor = decrease_factor
+        self.latency_slack = latency_slack
+        self.baseline_recovery = baseline_recovery
+        self.clock = clock
+        self.samples: deque = deque()
+        self.baseline_latency = None
+        self.increases = 0
+        self.decreases = 0
+
+    def record(self, outcome: str, latency: float):
+        self.samples.append((self.clock(), outcome, latency))
+
+    def _trim(self):
+        cutoff = self.clock() - self.window
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+
+    def snapshot(self) -> dict:
+        self._trim()
+        total = len(self.samples)
+        blocked = sum(1 for _, outcome, _ in self.samples if outcome in BLOCK_OUTCOMES)
+        latencies = sorted(latency for _, _, latency in self.samples)
+        return {
+            "slots": self.scheduler.concurrency,
+            "samples": total,
+            "block_rate": blocked / total if total else 0.0,
+            "p50_latency": latencies[total // 2] if total else None,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+    def adjust(self):
+        """Take one control decision; returns the new slot count."""
+        stats = self.snapshot()
+        current = self.scheduler.concurrency
+        if stats["samples"] < self.min_samples:
+            return current
+
+        latency = stats["p50_latency"]
+        if self.baseline_latency is None or latency < self.baseline_latency:
+            self.baseline_latency = latency
+        else:
+            self.baseline_latency += (latency - self.baseline_latency) * self.baseline_recovery
+
+        target = current
+        if stats["block_rate"] > self.high_block_rate:
+            target = max(self.min_slots, int(current * self.decrease_factor))
+            self.decreases += 1
+            self.samples.clear()
+        elif (
+            stats["block_rate"] <= self.low_block_rate
+            and latency <= self.baseline_latency * self.latency_slack
+        ):
+            target = min(self.max_slots, current + 1)
+            if target != current:
+                self.increases += 1
+
+        if target != current:
+            logger.info(
+                f"AIMD {current} -> {target} slots "
+                f"(block rate {stats['block_rate']:.2%}, p50 {latency:.1f}s)"
+            )
+            self.scheduler.resize(target)
+        return target
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.adjust()
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import aioredis
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+TIMEOUTS_KEY = "audit_field_p95"
+PRESENCE_KEY = "audit_field_presence:{layout}"
+
+# How long each probe used to wait before any latency had been learned.
+DEFAULT_TIMEOUTS = {
+    "status_card": 20,
+    "title": 5,
+    "brand_name": 10,
+    "mrp": 10,
+    "reviews": 10,
+}
+
+# Fields whose absence decides the page's status. A wait cut short here turns a
+# slow live page into "Suppressed Detail Page Removed", so their learned
+# timeout never drops below these and they are never skipped as absent.
+STATUS_FIELD_FLOORS = {
+    "status_card": 10,
+}
+
+# Reads the layout the page was rendered with, e.g. "en_IN fashion".
+LAYOUT_JS = "() => { const dp = document.querySelector('#dp'); return dp ? dp.className : ''; }"
+
+
+class FieldTimings:
+    """Learned per-field wait times and per-layout field presence.
+
+    Every probe that finds its element records how long it took to appear; the
+    timeout for that field becomes ``margin`` times the p95 of those latencies,
+    clamped between ``floor`` and the old fixed timeout. Presence is counted
+    per page layout, so a field that practically never exists on a layout is
+    not waited for there. Both survive restarts in Redis; ``load`` reads them
+    once at the start of an audit so probes never wait on Redis.
+    """
+
+    _timings: dict = {}
+
+    def __init__(
+        self,
+        redis_url="redis://localhost:6379",
+        samples: int = 200,
+        min_samples: int = 20,
+        margin: float = 1.5,
+        floor: float = 1.0,
+        absent_rate: float = 0.02,
+    ):
+        self.redis_url = redis_url
+        self.redis = None
+        self.samples_per_field = samples
+        self.min_samples = min_samples
+        self.margin = margin
+        self.floor = floor
+        self.absent_rate = absent_rate
+        self.latencies: dict = {}
+        self.learned: dict = {}
+        self.presence: dict = {}
+        self.pending_presence: dict = {}
+        self.short_circuits = 0
+
+    @classmethod
+    def for_current_loop(cls) -> "FieldTimings":
+        loop = asyncio.get_running_loop()
+        timings = cls._timings.get(loop)
+        if timings is None:
+            timings = cls._timings[loop] = cls()
+        return timings
+
+    async def _get_redis(self):
+        if self.redis is None:
+            self.redis = await aioredis.from_url(self.redis_url, decode_responses=True)
+        return self.redis
+
+    async def load(self):
+        """Read the learned timeouts and every layout's presence counts."""
+        try:
+            redis = await self._get_redis()
+            learned = await redis.hgetall(TIMEOUTS_KEY)
+            stored = {}
+            async for key in redis.scan_iter(match=PRESENCE_KEY.format(layout="*")):
+                stored[key.split(":", 1)[1]] = await redis.hgetall(key)
+        except aioredis.RedisError as e:
+            logger.warning(f"could not load learned field timings: {e}")
+            return
+        self.learned = {f: float(v) for f, v in learned.items()}
+        # Counts not saved yet stay on top of what Redis has.
+        self.presence = {key: list(counts) for key, counts in self.pending_presence.items()}
+        for layout, counts in stored.items():
+            for key, value in counts.items():
+                field, _, kind = key.rpartition(":")
+                presence = self.presence.setdefault((layout, field), [0, 0])
+                presence[0 if kind == "seen" else 1] += int(value)
+
+    def timeout(self, field: str) -> float:
+        ceiling = DEFAULT_TIMEOUTS.get(field, 10)
+        observed = self.latencies.get(field)
+        if observed and len(observed) >= self.min_samples:
+            ordered = sorted(observed)
+            p95 = ordered[int(len(ordered) * 0.95) - 1]
+        else:
+            p95 = self.learned.get(field)
+        if p95 is None:
+            return ceiling
+        floor = max(self.floor, STATUS_FIELD_FLOORS.get(field, 0))
+        return min(ceiling, max(floor, p95 * self.margin))
+
+    def is_absent(self, layout: str, field: str) -> bool:
+        """True when ``field`` has (almost) never been seen on ``layout``."""
+        if field in STATUS_FIELD_FLOORS:
+            return False
+        seen, present = self.presence.get((layout, field), (0, 0))
+        return seen >= self.min_samples and present / seen < self.absent_rate
+
+    def observe(self, layout: str, field: str, present: bool, latency: float = None):
+        counts = self.presence.setdefault((layout, field), [0, 0])
+        pending = self.pending_presence.setdefault((layout, field), [0, 0])
+        for c in (counts, pending):
+            c[0] += 1
+            c[1] += int(present)
+        if present and latency is not None:
+            self.latencies.setdefault(
+                field, deque(maxlen=self.samples_per_field)
+            ).append(latency)
+
+    async def save(self):
+        """Persist the current p95s and the presence counted since the last save."""
+        # Pages observed while the pipeline runs belong to the next save.
+        pending, self.pending_presence = self.pending_presence, {}
+        try:
+            redis = await self._get_redis()
+            pipe = redis.pipeline(transaction=False)
+            for field, observed in self.latencies.items():
+                if len(observed) >= self.min_samples:
+                    ordered = sorted(observed)
+                    pipe.hset(TIMEOUTS_KEY, field, ordered[int(len(ordered) * 0.95) - 1])
+            for (layout, field), (seen, present) in pending.items():
+                key = PRESENCE_KEY.format(layout=layout)
+                pipe.hincrby(key, f"{field}:seen", seen)
+                pipe.hincrby(key, f"{field}:present", present)
+            await pipe.execute()
+        except aioredis.RedisError as e:
+            for key, (seen, present) in pending.items():
+                counts = self.pending_presence.setdefault(key, [0, 0])
+                counts[0] += seen
+                counts[1] += present
+            logger.warning(f"could not save learned field timeouts: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "timeouts": {f: round(self.timeout(f), 2) for f in DEFAULT_TIMEOUTS},
+            "short_circuits": self.short_circuits,
+        }
+
+
+class PageDeadline:
+    """One time budget shared by every probe on a page.
+
+    Each probe waits at most its learned timeout and never past the page's
+    deadline; once the budget is spent the remaining probes only check
+    whether their element is already there.
+    """
+
+    def __init__(self, page, budget=None, timings: FieldTimings = None):
+        self.page = page
+        self.deadline = time.monotonic() + (budget or settings.AUDIT_PAGE_BUDGET)
+        self.timings = timings or FieldTimings.for_current_loop()
+        self.layout = None
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    async def _layout(self) -> str:
+        if self.layout is None:
+            try:
+                self.layout = (await self.page.evaluate(LAYOUT_JS)).strip() or "default"
+            except Exception:
+                self.layout = "default"
+        return self.layout
+
+    async def wait(self, locator, field: str, state: str = "visible") -> bool:
+        """Wait for ``locator`` within the field's budget; True if it showed up."""
+        layout = await self._layout()
+        if self.timings.is_absent(layout, field) and await locator.count() == 0:
+            self.timings.short_circuits += 1
+            return False
+
+        timeout = min(self.timings.timeout(field), self.remaining())
+        started = time.monotonic()
+        try:
+            if timeout <= 0:
+                found = await locator.count() > 0
+            else:
+                await locator.wait_for(state=state, timeout=timeout * 1000)
+                found = True
+        except Exception:
+            found = False
+        self.timings.observe(layout, field, found, time.monotonic() - started)
+        return found
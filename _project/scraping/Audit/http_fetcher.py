@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import random
+
+import aiohttp
+from django.conf import settings
+
+from .amazon_html import extract_from_html
+from .pacing import HumanPacer
+
+logger = logging.getLogger("scraping")
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
+]
+
+
+class AmazonHttpFetcher:
+    """Scrapes /dp/ pages over plain HTTP with one pooled aiohttp session.
+
+    ``scrape`` returns ``(result, None)`` with the same dict as
+    ``AmazonScrapingLogic._run_scraper``, or ``(None, reason)`` when the page
+    has to be rendered by the browser instead. The session is one client to
+    Amazon, so its requests are spaced out by a ``HumanPacer`` of their own,
+    drawn from ``AUDIT_HTTP_DELAY``.
+    """
+
+    _fetchers: dict = {}
+
+    def __init__(self, base_url=None, limit=None, timeout=None, delay=None):
+        self.base_url = base_url or settings.AMAZON_BASE_URL
+        self.limit = limit or settings.AUDIT_HTTP_CONNECTIONS
+        self.timeout = timeout or settings.AUDIT_HTTP_TIMEOUT
+        self.pacer = HumanPacer(*(settings.AUDIT_HTTP_DELAY if delay is None else delay))
+        self.session: aiohttp.ClientSession | None = None
+        self.parsed = 0
+        self.fallbacks: dict = {}
+
+    @classmethod
+    def for_current_loop(cls) -> "AmazonHttpFetcher":
+        loop = asyncio.get_running_loop()
+        fetcher = cls._fetchers.get(loop)
+        if fetcher is None:
+            fetcher = cls._fetchers[loop] = cls()
+        return fetcher
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
+                    "User-Agent": random.choice(USER_AGENTS),
+                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                    "Accept-Language": "en-IN,en;q=0.9",
+                },
+            )
+        return self.session
+
+    async def fetch(self, asin: str):
+        """Return ``(status, html, final_url)`` for the product page of ``asin``."""
+        await self.pacer.before_navigation("http")
+        async with self._get_session().get(f"{self.base_url}/dp/{asin}") as response:
+            return response.status, await response.text(errors="replace"), str(response.url)
+
+    def _fallback(self, reason: str):
+        self.fallbacks[reason] = self.fallbacks.get(reason, 0) + 1
+
+    async def scrape(self, asin: str, on_page=None):
+        """``on_page(html, url)`` is awaited for every page that parsed."""
+        try:
+            status, html, url = await self.fetch(asin)
+        except Exception as e:
+            logger.info(f"http fetch failed for {asin}: {e}")
+            self._fallback("network")
+            return None, "network"
+        if not 200 <= status < 300:
+            # Throttling (503), blocks and error pages are left to the browser.
+            reason = f"http_{status}"
+            self._fallback(reason)
+            return None, reason
+
+        # lxml releases the GIL while parsing, so keep it off the event loop.
+        result, reason = await asyncio.to_thread(extract_from_html, html, asin, url)
+        if result is None:
+            self._fallback(reason)
+        else:
+            self.parsed += 1
+            if on_page:
+                await on_page(html, url)
+        return result, reason
+
+    def stats(self) -> dict:
+        return {"parsed": self.parsed, "fallbacks": dict(self.fallbacks), "pacing": self.pacer.stats()}
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        for loop, fetcher in list(self._fetchers.items()):
+            if fetcher is self:
+                del self._fetchers[loop]
@@ -0,0 +1,381 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import aioredis
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+CHROME_VERSIONS = (122, 123, 124, 125, 126)
+
+# (user agent template, navigator.platform, userAgentData platform, viewports)
+DESKTOPS = {
+    "windows": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{version}.0.0.0 Safari/537.36",
+        "Win32",
+        "Windows",
+        ({"width": 1366, "height": 768}, {"width": 1536, "height": 864}, {"width": 1920, "height": 1080}),
+    ),
+    "mac": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{version}.0.0.0 Safari/537.36",
+        "MacIntel",
+        "macOS",
+        ({"width": 1440, "height": 900}, {"width": 1512, "height": 982}, {"width": 1680, "height": 1050}),
+    ),
+}
+# Most amazon.in desktop traffic is Windows.
+DESKTOP_WEIGHTS = {"windows": 4, "mac": 1}
+
+# City centres in India; each identity sits a short distance from one.
+CITIES = (
+    (12.971599, 77.594566),  # Bengaluru
+    (19.076090, 72.877426),  # Mumbai
+    (28.613939, 77.209023),  # Delhi
+    (17.385044, 78.486671),  # Hyderabad
+    (13.082680, 80.270721),  # Chennai
+    (18.520430, 73.856743),  # Pune
+    (22.572645, 88.363892),  # Kolkata
+)
+
+# Shared by every worker: page and captcha counts per identity, and the
+# identities retired for drawing too many captchas.
+COUNTERS_KEY = "audit_identity:{name}"
+RETIRED_KEY = "audit_identity_retired:{name}"
+
+LANGUAGES = (
+    ["en-IN", "en-GB", "en-US", "en"],
+    ["en-IN", "en"],
+    ["en-IN", "en", "hi"],
+)
+
+
+def accept_language(languages) -> str:
+    return ",".join(
+        language if i == 0 else f"{language};q={max(0.1, 1 - i / 10):.1f}"
+        for i, language in enumerate(languages)
+    )
+
+
+def compile_init_script(identity: "Identity") -> str:
+    """The navigator overrides for ``identity``, built once and installed per context."""
+    return f"""
+        Object.defineProperty(navigator, 'webdriver', {{
+            get: () => false
+        }});
+
+        Object.defineProperty(navigator, 'languages', {{
+            get: () => {json.dumps(identity.languages)}
+        }});
+
+        Object.defineProperty(navigator, 'platform', {{
+            get: () => '{identity.platform}'
+        }});
+
+        Object.defineProperty(navigator, 'hardwareConcurrency', {{
+            get: () => {identity.hardware_concurrency}
+        }});
+
+        Object.defineProperty(navigator, 'deviceMemory', {{
+            get: () => {identity.device_memory}
+        }});
+
+        if (navigator.userAgentData) {{
+            Object.defineProperty(navigator, 'userAgentData', {{
+                value: {{
+                    brands: {json.dumps(identity.brands)},
+                    mobile: false,
+                    platform: '{identity.ua_platform}'
+                }}
+            }});
+        }}
+
+        Object.defineProperty(window, 'chrome', {{
+            value: {{
+                runtime: {{}}
+            }}
+        }});
+
+        const originalQuery = window.navigator.permissions.query;
+        window.navigator.permissions.query = (parameters) => (
+            parameters.name === 'notifications' ?
+                Promise.resolve({{ state: Notification.permission }}) :
+                originalQuery(parameters)
+        );
+    """
+
+
+class Identity:
+    """One consistent browser persona for amazon.in: an Indian desktop Chrome
+    with matching user agent, platform, locale, timezone and location.
+
+    Everything is drawn once from a generator seeded by ``index``, so identity
+    ``in-0007`` is the same persona in every worker and after restarts, and
+    its cookies (``storage_state``) can be carried from one product to the next.
+    """
+
+    def __init__(self, index: int):
+        rng = random.Random(f"identity:{index}")
+        self.index = index
+        self.name = f"in-{index:04d}"
+        desktop = rng.choices(list(DESKTOP_WEIGHTS), weights=list(DESKTOP_WEIGHTS.values()))[0]
+        template, self.platform, self.ua_platform, viewports = DESKTOPS[desktop]
+        version = rng.choice(CHROME_VERSIONS)
+        self.user_agent = template.format(version=version)
+        self.brands = [
+            {"brand": "Chromium", "version": str(version)},
+            {"brand": "Google Chrome", "version": str(version)},
+            {"brand": "Not-A.Brand", "version": "99"},
+        ]
+        self.viewport = dict(rng.choice(viewports))
+        self.locale = "en-IN"
+        self.languages = list(rng.choice(LANGUAGES))
+        self.timezone = "Asia/Kolkata"
+        latitude, longitude = rng.choice(CITIES)
+        self.geolocation = {
+            "latitude": round(latitude + rng.uniform(-0.05, 0.05), 6),
+            "longitude": round(longitude + rng.uniform(-0.05, 0.05), 6),
+        }
+        self.hardware_concurrency = rng.choice((4, 8, 12, 16))
+        self.device_memory = rng.choice((4, 8))
+        self.init_script = compile_init_script(self)
+
+        self.storage_state = None
+        # Fleet-wide totals, as of this process's last page with the identity.
+        self.pages = 0
+        self.captchas = 0
+        self.active = 0
+        self.last_used = 0
+
+    @property
+    def captcha_rate(self) -> float:
+        return self.captchas / self.pages if self.pages else 0.0
+
+    def context_options(self) -> dict:
+        """Keyword arguments for ``browser.new_context``."""
+        return {
+            "user_agent": self.user_agent,
+            "viewport": self.viewport,
+            "timezone_id": self.timezone,
+            "locale": self.locale,
+            "geolocation": self.geolocation,
+            "permissions": ["geolocation"],
+            "extra_http_headers": {"Accept-Language": accept_language(self.languages)},
+            "storage_state": self.storage_state,
+            "bypass_csp": True,
+        }
+
+    def context_settings(self) -> dict:
+        return {
+            "identity": self.name,
+            "user_agent": self.user_agent,
+            "viewport": self.viewport,
+            "timezone": self.timezone,
+            "locale": self.locale,
+            "geolocation": self.geolocation,
+        }
+
+
+class IdentityPool:
+    """The identities the browser pool's contexts are created with.
+
+    Contexts go to the identity with the fewest open contexts, least recently
+    used first. Page and captcha counts are kept in Redis, so every worker
+    adds to the same totals; once an identity has loaded ``min_pages`` pages
+    and more than ``max_captcha_rate`` of them were captchas, it is marked
+    retired in Redis for good and each pool replaces it with the next index.
+
+    Cookies stay in memory between products and are written to ``directory``
+    every ``save_interval`` seconds and on ``close``, so they survive worker
+    restarts without a file write per product.
+    """
+
+    _pools: dict = {}
+
+    def __init__(
+        self,
+        size=None,
+        directory=None,
+        min_pages=None,
+        max_captcha_rate=None,
+        save_interval=None,
+        redis_url="redis://localhost:6379",
+    ):
+        self.size = size or settings.AUDIT_IDENTITY_POOL_SIZE
+        self.directory = Path(directory or settings.AUDIT_IDENTITY_DIR)
+        self.min_pages = settings.AUDIT_IDENTITY_MIN_PAGES if min_pages is None else min_pages
+        self.max_captcha_rate = (
+            settings.AUDIT_IDENTITY_MAX_CAPTCHA_RATE if max_captcha_rate is None else max_captcha_rate
+        )
+        self.save_interval = settings.AUDIT_IDENTITY_SAVE_INTERVAL if save_interval is None else save_interval
+        self.redis_url = redis_url
+        self.redis = None
+        self.identities: dict = {}
+        self.next_index = 0
+        self.retired = 0
+        self.checkouts = 0
+        self.dirty: set = set()
+        self.last_save = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def for_current_loop(cls) -> "IdentityPool":
+        loop = asyncio.get_running_loop()
+        pool = cls._pools.get(loop)
+        if pool is None:
+            pool = cls._pools[loop] = cls()
+        return pool
+
+    async def _get_redis(self):
+        if self.redis is None:
+            self.redis = await aioredis.from_url(self.redis_url, decode_responses=True)
+        return self.redis
+
+    def _path(self, identity: Identity) -> Path:
+        return self.directory / f"{identity.name}.json"
+
+    def _read(self, identities: list):
+        for identity in identities:
+            try:
+                identity.storage_state = json.loads(self._path(identity).read_text())
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"ignoring unreadable cookies of identity {identity.name}: {e}")
+
+    def _write(self, identities: list):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for identity in identities:
+            path = self._path(identity)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(identity.storage_state))
+            os.replace(tmp, path)
+
+    async def _retired(self, names: list) -> list:
+        try:
+            redis = await self._get_redis()
+            flags = await redis.mget([RETIRED_KEY.format(name=name) for name in names])
+            return [bool(flag) for flag in flags]
+        except aioredis.RedisError as e:
+            logger.warning(f"could not check retired identities: {e}")
+            return [False] * len(names)
+
+    async def _top_up(self):
+        """Fill the pool up to ``size`` live identities, skipping retired ones."""
+        async with self._lock:
+            while len(self.identities) < self.size:
+                candidates = [
+                    Identity(index)
+                    for index in range(self.next_index, self.next_index + self.size - len(self.identities))
+                ]
+                self.next_index += len(candidates)
+                retired = await self._retired([identity.name for identity in candidates])
+                fresh = [identity for identity, gone in zip(candidates, retired) if not gone]
+                await asyncio.to_thread(self._read, fresh)
+                for identity in fresh:
+                    self.identities[identity.name] = identity
+
+    async def checkout(self) -> Identity:
+        if len(self.identities) < self.size:
+            await self._top_up()
+        identity = min(self.identities.values(), key=lambda i: (i.active, i.last_used))
+        identity.active += 1
+        self.checkouts += 1
+        identity.last_used = self.checkouts
+        return identity
+
+    def store(self, identity: Identity, storage_state):
+        """Keep the cookies a context of ``identity`` ended with, for the next save."""
+        identity.storage_state = storage_state
+        self.dirty.add(identity)
+
+    async def checkin(self, identity: Identity, storage_state=None):
+        """Return ``identity`` with the cookies its context ended with."""
+        identity.active -= 1
+        if storage_state is not None:
+            self.store(identity, storage_state)
+        if time.monotonic() - self.last_save >= self.save_interval:
+            await self.save()
+
+    @asynccontextmanager
+    async def borrow(self):
+        """Check an identity out for the duration of the block."""
+        identity = await self.checkout()
+        try:
+            yield identity
+        finally:
+            await self.checkin(identity)
+
+    async def save(self):
+        """Write the cookies that changed since the last save."""
+        self.last_save = time.monotonic()
+        if not self.dirty:
+            return
+        identities, self.dirty = list(self.dirty), set()
+        try:
+            await asyncio.to_thread(self._write, identities)
+        except OSError as e:
+            self.dirty.update(identities)
+            logger.warning(f"could not save identity cookies: {e}")
+
+    async def record(self, name: str, captcha_seen: bool):
+        """Count one page loaded as identity ``name``; retire it if it draws too many captchas."""
+        identity = self.identities.get(name)
+        if identity is None:
+            return
+        key = COUNTERS_KEY.format(name=name)
+        retired_key = RETIRED_KEY.format(name=name)
+        redis = None
+        try:
+            redis = await self._get_redis()
+            pipe = redis.pipeline(transaction=False)
+            pipe.hincrby(key, "pages", 1)
+            pipe.hincrby(key, "captchas", int(bool(captcha_seen)))
+            pipe.exists(retired_key)
+            identity.pages, identity.captchas, retired = await pipe.execute()
+        except aioredis.RedisError as e:
+            logger.warning(f"identity counters unavailable, counting {name} locally: {e}")
+            redis = None
+            identity.pages += 1
+            identity.captchas += bool(captcha_seen)
+            retired = False
+
+        if not retired and identity.pages >= self.min_pages and identity.captcha_rate > self.max_captcha_rate:
+            retired = True
+            logger.warning(
+                f"retiring identity {name}: {identity.captchas} captchas in {identity.pages} pages"
+            )
+            if redis is not None:
+                try:
+                    await redis.set(retired_key, 1)
+                except aioredis.RedisError as e:
+                    logger.warning(f"could not mark identity {name} retired: {e}")
+        if retired and self.identities.pop(name, None) is not None:
+            # Retired here or by another worker: take it out of rotation.
+            self.retired += 1
+            await self._top_up()
+
+    async def close(self):
+        await self.save()
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+        for loop, pool in list(self._pools.items()):
+            if pool is self:
+                del self._pools[loop]
+
+    def stats(self) -> dict:
+        return {
+            "identities": len(self.identities),
+            "retired": self.retired,
+            "captcha_rates": {
+                name: round(identity.captcha_rate, 3)
+                for name, identity in sorted(self.identities.items())
+                if identity.pages
+            },
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+DOM_ONLY = "dom-only"
+DOM_XHR = "dom+xhr"
+FULL = "full"
+
+# Resource types each profile lets through; ``None`` means everything.
+PROFILES = {
+    DOM_ONLY: {"document", "script", "stylesheet"},
+    DOM_XHR: {"document", "script", "stylesheet", "xhr", "fetch"},
+    FULL: None,
+}
+
+# Ad, analytics and beacon hosts that never carry product data.
+TRACKER_HOSTS = (
+    "amazon-adsystem.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "facebook.net",
+    "scorecardresearch.com",
+    "fls-eu.amazon.in",
+    "fls-na.amazon.in",
+    "unagi.amazon.in",
+    "aax-eu.amazon.in",
+)
+
+
+def is_tracker(url: str) -> bool:
+    host = urlsplit(url).hostname or ""
+    return any(host == t or host.endswith("." + t) for t in TRACKER_HOSTS)
+
+
+def profile_for(platform: str) -> str:
+    """Interception profile configured for ``platform`` (defaults to dom-only)."""
+    profile = settings.AUDIT_INTERCEPTION_PROFILES.get(platform, DOM_ONLY)
+    if profile not in PROFILES:
+        logger.warning(f"unknown interception profile {profile!r}, using {FULL}")
+        return FULL
+    return profile
+
+
+class RequestInterceptor:
+    """Applies an interception profile to browser contexts and counts traffic.
+
+    One interceptor lives per audit, so its counters cover every context that
+    audit leases. Requests whose URL matches one of the ``allow`` patterns
+    (the endpoints ``ResponseCapture`` reads) go through whatever the
+    profile says about their resource type. Allowed bytes are the ``content-length`` of each response,
+    or its measured transfer size when the header is missing. Blocked requests
+    are aborted before anything is sent, so their bytes are estimated from the
+    average size of the same kind of response wherever this process has let
+    one through (a "full" or "dom+xhr" audit, or a benchmark); blocked requests
+    of a kind never seen are counted in ``blocked_unsized``.
+    """
+
+    # kind -> [responses, bytes], shared by every interceptor in the process.
+    _sizes: dict = {}
+
+    def __init__(self, profile: str = DOM_ONLY, allow=()):
+        self.profile = profile
+        self.allow = tuple(allow)
+        self.allowed_types = PROFILES[profile]
+        self.blocked: dict = {}
+        self.allowed = 0
+        self.allowed_bytes: dict = {}
+        self._measuring: set = set()
+
+    @staticmethod
+    def kind(resource_type: str, url: str) -> str:
+        return "tracker" if is_tracker(url) else resource_type
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if self.allowed_types is None:
+            return False
+        if is_tracker(url):
+            return True
+        if resource_type in self.allowed_types:
+            return False
+        return not any(pattern.search(url) for pattern in self.allow)
+
+    async def _route(self, route):
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            kind = self.kind(request.resource_type, request.url)
+            self.blocked[kind] = self.blocked.get(kind, 0) + 1
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    def _count(self, kind: str, size: int):
+        self.allowed_bytes[kind] = self.allowed_bytes.get(kind, 0) + size
+        seen = self._sizes.setdefault(kind, [0, 0])
+        seen[0] += 1
+        seen[1] += size
+
+    def _on_response(self, response):
+        self.allowed += 1
+        request = response.request
+        kind = self.kind(request.resource_type, response.url)
+        try:
+            self._count(kind, int(response.headers["content-length"]))
+            return
+        except (KeyError, ValueError):
+            pass
+        # Chunked and streamed responses: ask the browser once the body is in.
+        task = asyncio.ensure_future(self._measure(request, kind))
+        self._measuring.add(task)
+        task.add_done_callback(self._measuring.discard)
+
+    async def _measure(self, request, kind: str):
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        self._count(kind, sizes["responseBodySize"])
+
+    async def attach(self, context):
+        """Install the profile on ``context``; every page opened in it inherits it."""
+        context.on("response", self._on_response)
+        if self.allowed_types is not None:
+            await context.route("**/*", self._route)
+
+    def blocked_bytes(self) -> tuple:
+        """Estimated bytes not downloaded, and how many blocked requests had no estimate."""
+        estimated, unsized = 0, 0
+        for kind, count in self.blocked.items():
+            responses, size = self._sizes.get(kind, (0, 0))
+            if responses:
+                estimated += count * size // responses
+            else:
+                unsized += count
+        return estimated, unsized
+
+    def stats(self) -> dict:
+        blocked_bytes, blocked_unsized = self.blocked_bytes()
+        return {
+            "profile": self.profile,
+            "blocked": dict(self.blocked),
+            "blocked_requests": sum(self.blocked.values()),
+            "blocked_bytes_estimated": blocked_bytes,
+            "blocked_unsized": blocked_unsized,
+            "allowed_requests": self.allowed,
+            "allowed_bytes": sum(self.allowed_bytes.values()),
+            "allowed_bytes_by_type": dict(self.allowed_bytes),
+        }
@@ -0,0 +1,192 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+NDJSON = "ndjson"
+CSV_GZ = "csv.gz"
+# Which product list the task audited; task ids are not kept on the list.
+HEADER = "header.json"
+
+# Same columns as csv_audit_general.
+CSV_HEADERS = [
+    "index", "asin", "reviews", "ratings", "seller", "status", "variations",
+    "browse_node", "brand_name", "availability", "deal", "image_len", "video",
+    "main_img_url", "bullet_point_len", "bestSellerRank", "price", "MRP",
+    "title", "description", "A_plus", "store_link", "timestamp",
+]
+
+
+class AuditJournal:
+    """Append-only record of every result an audit produced, one directory per task.
+
+    ``write`` only buffers the row; the buffer is written out on a worker thread
+    once it holds ``flush_rows`` rows or every ``flush_interval`` seconds, and on
+    ``close``. Each process writes its own segment files
+    (``<host>-<pid>-<n>.<format>``) so the shards of one task never interleave,
+    and starts a new segment once the current one reaches ``max_bytes``.
+    ``header.json`` records the product list the task audits, so the journal
+    can be replayed after the list has moved on to other tasks.
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        product_list_id: int,
+        directory=None,
+        fmt=None,
+        flush_rows=None,
+        flush_interval=None,
+        max_bytes=None,
+    ):
+        self.task_id = task_id
+        self.product_list_id = product_list_id
+        self.directory = Path(directory or settings.AUDIT_JOURNAL_DIR) / str(task_id)
+        self.fmt = fmt or settings.AUDIT_JOURNAL_FORMAT
+        self.flush_rows = flush_rows or settings.AUDIT_JOURNAL_FLUSH_ROWS
+        self.flush_interval = flush_interval or settings.AUDIT_JOURNAL_FLUSH_INTERVAL
+        self.max_bytes = max_bytes or settings.AUDIT_JOURNAL_MAX_BYTES
+        self.prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.segment = 0
+        self.buffer: list = []
+        self.rows = 0
+        self._lock = asyncio.Lock()
+        self._flusher = None
+        self._flushes: set = set()
+
+    def _path(self) -> Path:
+        return self.directory / f"{self.prefix}-{self.segment:04d}.{self.fmt}"
+
+    def write(self, result: dict):
+        record = dict(result)
+        record["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.buffer.append(record)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+        if len(self.buffer) >= self.flush_rows:
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self.buffer:
+                return
+            records, self.buffer = self.buffer, []
+            try:
+                await asyncio.to_thread(self._append, records)
+                self.rows += len(records)
+            except OSError as e:
+                # Keep the rows for the next attempt rather than dropping them.
+                self.buffer[:0] = records
+                logger.error(f"journal write failed for {self.task_id}: {e}")
+
+    def _write_header(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        header = self.directory / HEADER
+        if not header.exists():
+            header.write_text(json.dumps({"task_id": self.task_id, "product_list_id": self.product_list_id}))
+
+    def _append(self, records: list):
+        self._write_header()
+        path = self._path()
+        while path.exists() and path.stat().st_size >= self.max_bytes:
+            self.segment += 1
+            path = self._path()
+        new_file = not path.exists()
+
+        if self.fmt == CSV_GZ:
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=CSV_HEADERS, extrasaction="ignore")
+            if new_file:
+                writer.writeheader()
+            writer.writerows(records)
+            # Every flush appends one gzip member; readers see a single stream.
+            with gzip.open(path, "at", encoding="utf-8", newline="") as f:
+                f.write(buf.getvalue())
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(r, default=str) + "\n" for r in records))
+
+    def dead_letter(self, records: list):
+        """Append results the database rejected; ``read_journal`` (and so
+        ``audit_journal --replay``) picks them up with the rest."""
+        self._write_header()
+        path = self.directory / f"{self.prefix}-dead-letter.{NDJSON}"
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r, default=str) + "\n" for r in records))
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"rows": self.rows, "buffered": len(self.buffer), "segments": self.segment + 1}
+
+
+def read_journal(task_id: str, directory=None):
+    """Yield every journalled result of ``task_id``, oldest segment first."""
+    task_dir = Path(directory or settings.AUDIT_JOURNAL_DIR) / str(task_id)
+    if not task_dir.is_dir():
+        return
+    for path in sorted(task_dir.iterdir(), key=lambda p: (p.stat().st_mtime, p.name)):
+        if path.name.endswith(CSV_GZ):
+            with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+                yield from csv.DictReader(f)
+        elif path.name.endswith(NDJSON):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def journal_product_list(task_id: str, directory=None):
+    """The id of the product list ``task_id`` audited, from its journal header."""
+    header = Path(directory or settings.AUDIT_JOURNAL_DIR) / str(task_id) / HEADER
+    try:
+        return json.loads(header.read_text())["product_list_id"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def prune_journals(directory=None, retention_days=None) -> int:
+    """Delete task journals untouched for ``retention_days``; returns how many."""
+    root = Path(directory or settings.AUDIT_JOURNAL_DIR)
+    retention_days = settings.AUDIT_JOURNAL_RETENTION_DAYS if retention_days is None else retention_days
+    if not root.is_dir():
+        return 0
+    cutoff = time.time() - retention_days * 86400
+    removed = 0
+    for task_dir in root.iterdir():
+        try:
+            if not task_dir.is_dir():
+                continue
+            last_write = max(
+                [p.stat().st_mtime for p in task_dir.iterdir()] + [task_dir.stat().st_mtime]
+            )
+            if last_write < cutoff:
+                shutil.rmtree(task_dir)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"could not prune journal {task_dir}: {e}")
+    return removed
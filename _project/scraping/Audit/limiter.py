@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+import aioredis
+import redis
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+
+# All scripts take the time from Redis itself so that clock skew between
+# worker hosts cannot shorten or stretch a lease.
+_REAP = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local dead = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)
+for _, lease in ipairs(dead) do
+    redis.call('ZREM', KEYS[1], lease)
+    redis.call('HDEL', KEYS[2], lease)
+end
+local gone = redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', now)
+for _, waiter in ipairs(gone) do
+    redis.call('ZREM', KEYS[3], waiter)
+    redis.call('ZREM', KEYS[4], waiter)
+end
+"""
+
+# KEYS: holders, holder_info, waiters, waiter_expiry, seq
+# ARGV: waiter_id, limit, lease_ttl_ms, waiter_ttl_ms, info
+ACQUIRE_SCRIPT = _REAP + """
+local waiter = ARGV[1]
+if not redis.call('ZSCORE', KEYS[3], waiter) then
+    redis.call('ZADD', KEYS[3], redis.call('INCR', KEYS[5]), waiter)
+end
+redis.call('ZADD', KEYS[4], now + tonumber(ARGV[4]), waiter)
+
+local free = tonumber(ARGV[2]) - redis.call('ZCARD', KEYS[1])
+local rank = redis.call('ZRANK', KEYS[3], waiter)
+if rank < free then
+    redis.call('ZREM', KEYS[3], waiter)
+    redis.call('ZREM', KEYS[4], waiter)
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[3]), waiter)
+    redis.call('HSET', KEYS[2], waiter, ARGV[5])
+    return -1
+end
+return rank
+"""
+
+# KEYS: holders, holder_info, waiters, waiter_expiry
+# ARGV: lease_id, limit, wake_prefix
+RELEASE_SCRIPT = _REAP + """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+local free = tonumber(ARGV[2]) - redis.call('ZCARD', KEYS[1])
+if free > 0 then
+    for _, waiter in ipairs(redis.call('ZRANGE', KEYS[3], 0, free - 1)) do
+        redis.call('RPUSH', ARGV[3] .. waiter, 1)
+        redis.call('PEXPIRE', ARGV[3] .. waiter, 60000)
+    end
+end
+"""
+
+# KEYS: holders   ARGV: lease_id, lease_ttl_ms
+HEARTBEAT_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[1])
+return 1
+"""
+
+
+class BrowserLimiter:
+    """Fleet-wide browser slot semaphore shared through Redis.
+
+    Waiters queue up FIFO and block on a per-waiter list until a release wakes
+    them, instead of polling a counter. Every granted slot is a lease that is
+    kept alive by a heartbeat; a lease whose holder died expires after
+    ``lease_ttl`` seconds and its slot is handed to the next waiter.
+    """
+
+    def __init__(
+        self,
+        redis_url="redis://localhost",
+        max_browsers=None,
+        task_id=None,
+        namespace="browser_slots",
+        lease_ttl=None,
+    ):
+        self.redis_url = redis_url
+        self.max_browsers = max_browsers or settings.AUDIT_GLOBAL_BROWSER_SLOTS
+        self.task_id = task_id
+        self.lease_ttl = lease_ttl or settings.AUDIT_SLOT_LEASE_TTL
+        self.redis = None
+        self.keys = [
+            f"{namespace}:holders",
+            f"{namespace}:holder_info",
+            f"{namespace}:waiters",
+            f"{namespace}:waiter_expiry",
+            f"{namespace}:seq",
+        ]
+        self.wake_prefix = f"{namespace}:wake:"
+        self._heartbeats: dict[str, asyncio.Task] = {}
+
+    async def _get_redis(self):
+        if not self.redis:
+            self.redis = await aioredis.from_url(self.redis_url)
+            self._acquire = self.redis.register_script(ACQUIRE_SCRIPT)
+            self._release = self.redis.register_script(RELEASE_SCRIPT)
+            self._heartbeat = self.redis.register_script(HEARTBEAT_SCRIPT)
+        return self.redis
+
+    async def acquire(self) -> str:
+        """Block until a slot is free and return its lease id."""
+        redis = await self._get_redis()
+        lease_id = uuid.uuid4().hex
+        info = json.dumps(
+            {
+                "host": socket.gethostname(),
+                "pid": os.getpid(),
+                "task_id": self.task_id,
+                "acquired_at": time.time(),
+            }
+        )
+        ttl_ms = int(self.lease_ttl * 1000)
+        # Re-check at least this often, so slots freed by an expired lease
+        # (whose holder will never send a release) are still picked up.
+        recheck = max(1, int(self.lease_ttl / 3))
+        try:
+            while True:
+                rank = await self._acquire(
+                    keys=self.keys,
+                    args=[lease_id, self.max_browsers, ttl_ms, ttl_ms, info],
+                )
+                if int(rank) < 0:
+                    break
+                await redis.blpop(self.wake_prefix + lease_id, timeout=recheck)
+        except BaseException:
+            # Cancelled or failed while queued: leave the queue (and give the
+            # slot back if the grant raced with the cancellation).
+            await asyncio.shield(self.release(lease_id))
+            raise
+        finally:
+            await redis.delete(self.wake_prefix + lease_id)
+
+        self._heartbeats[lease_id] = asyncio.create_task(self._keep_alive(lease_id))
+        return lease_id
+
+    async def _keep_alive(self, lease_id: str):
+        ttl_ms = int(self.lease_ttl * 1000)
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                alive = await self._heartbeat(keys=self.keys[:1], args=[lease_id, ttl_ms])
+                if not alive:
+                    logger.warning(f"browser slot lease {lease_id} expired before release")
+                    return
+            except Exception as e:
+                logger.warning(f"browser slot heartbeat failed for {lease_id}: {e}")
+
+    async def release(self, lease_id: str):
+        heartbeat = self._heartbeats.pop(lease_id, None)
+        if heartbeat:
+            heartbeat.cancel()
+        await self._get_redis()
+        await self._release(
+            keys=self.keys[:4], args=[lease_id, self.max_browsers, self.wake_prefix]
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        lease_id = await self.acquire()
+        try:
+            yield lease_id
+        finally:
+            await asyncio.shield(self.release(lease_id))
+
+    @staticmethod
+    def get_usage(redis_url="redis://localhost:6379", namespace="browser_slots"):
+        """Slots currently leased, grouped by host and by task."""
+        r = redis.Redis.from_url(redis_url, decode_responses=True)
+        holders = r.hgetall(f"{namespace}:holder_info")
+        by_host, by_task = {}, {}
+        for raw in holders.values():
+            info = json.loads(raw)
+            by_host[info["host"]] = by_host.get(info["host"], 0) + 1
+            task_id = info.get("task_id") or "unknown"
+            by_task[task_id] = by_task.get(task_id, 0) + 1
+        return {
+            "in_use": len(holders),
+            "waiting": r.zcard(f"{namespace}:waiters"),
+            "by_host": by_host,
+            "by_task": by_task,
+        }
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import random
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+# Any of these means a /dp/ page has rendered far enough to be classified: the
+# product title, a captcha form, the Rush Hour notice or the "page not found"
+# heading.
+PRODUCT_READY_SELECTOR = "span#productTitle, input#captchacharacters, center, .h1"
+# Straight after navigation the Continue Shopping interstitial counts as well.
+PAGE_READY_SELECTOR = f"{PRODUCT_READY_SELECTOR}, button:has-text('Continue shopping')"
+
+
+async def wait_for_content(page, selector: str = PAGE_READY_SELECTOR, timeout=None) -> bool:
+    """Wait until ``selector`` is attached instead of sleeping a fixed time.
+
+    Returns False when nothing matched within ``timeout`` seconds; callers carry
+    on and let the status check decide what the page is.
+    """
+    timeout = settings.AUDIT_CONTENT_TIMEOUT if timeout is None else timeout
+    try:
+        await page.wait_for_selector(selector, state="attached", timeout=timeout * 1000)
+        return True
+    except Exception:
+        return False
+
+
+class HumanPacer:
+    """Spaces out navigations per browser identity.
+
+    A delay is drawn from ``uniform(min_delay, max_delay)`` per navigation and
+    counted from that identity's previous navigation, so a product only waits
+    when its identity navigated recently; time spent loading and extracting the
+    last page already counts towards the gap, and other identities are never
+    held up. Callers wait before taking a browser slot and a context, so the
+    wait holds neither.
+    """
+
+    _pacers: dict = {}
+
+    def __init__(self, min_delay=None, max_delay=None):
+        delay = settings.AUDIT_HUMAN_DELAY
+        self.min_delay = delay[0] if min_delay is None else min_delay
+        self.max_delay = delay[1] if max_delay is None else max_delay
+        self.next_allowed: dict = {}
+        self.navigations = 0
+        self.waited = 0.0
+
+    @classmethod
+    def for_current_loop(cls) -> "HumanPacer":
+        loop = asyncio.get_running_loop()
+        pacer = cls._pacers.get(loop)
+        if pacer is None:
+            pacer = cls._pacers[loop] = cls()
+        return pacer
+
+    def reserve(self, identity: str) -> float:
+        """Book the next navigation slot for ``identity``; returns seconds to wait."""
+        now = time.monotonic()
+        start = max(now, self.next_allowed.get(identity, now))
+        self.next_allowed[identity] = start + random.uniform(self.min_delay, self.max_delay)
+        self.navigations += 1
+        return start - now
+
+    async def before_navigation(self, identity: str):
+        wait = self.reserve(identity)
+        if wait > 0:
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        return {
+            "identities": len(self.next_allowed),
+            "navigations": self.navigations,
+            "waited": round(self.waited, 2),
+        }
@@ -0,0 +1,444 @@
+import asyncio
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, connection, transaction
+from django.utils import timezone
+
+from scraping.models import ProductInfo
+
+logger = logging.getLogger("scraping")
+
+UPDATE_FIELDS = [
+    "status", "title", "reviews", "ratings", "browse_node",
+    "brand_name", "variations", "deal", "seller", "image_len",
+    "video", "main_img_url", "bullet_point_len", "bsr1", "bsr2",
+    "price", "mrp", "availability", "description", "a_plus",
+    "store_link", "updated_at", "last_audited_at", "content_hash",
+]
+
+# An audit counts as a change of the product when any of these differ.
+CHANGE_FIELDS = ["status", "title", "price", "mrp", "seller", "availability"]
+
+# Errors caused by the rows themselves, which a retry cannot fix but a
+# smaller batch can isolate. Anything else is taken as the database failing.
+ROW_ERRORS = (IntegrityError, DataError)
+
+
+class ResultRow(NamedTuple):
+    """One audit result as the column values of ``ProductInfo``, already coerced."""
+
+    product_id: str
+    status: str
+    title: str | None
+    reviews: float | None
+    ratings: float | None
+    browse_node: str | None
+    brand_name: str | None
+    variations: str | None
+    deal: str | None
+    seller: str | None
+    image_len: int | None
+    video: str | None
+    main_img_url: str | None
+    bullet_point_len: int | None
+    bsr1: str | None
+    bsr2: str | None
+    price: float | None
+    mrp: float | None
+    availability: str | None
+    description: str | None
+    a_plus: str | None
+    store_link: str | None
+    content_hash: str = ""
+
+
+def to_float(value):
+    """Float column value; "N/A" and other placeholders become NULL."""
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(str(value).replace(",", "").strip())
+    except ValueError:
+        return None
+
+
+def to_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def fingerprint(row: ResultRow) -> str:
+    """Hash of every audited value of ``row`` (not its product_id or hash)."""
+    return hashlib.blake2b(repr(tuple(row)[1:-1]).encode(), digest_size=16).hexdigest()
+
+
+def result_row(result: dict) -> ResultRow:
+    row = ResultRow(
+        product_id=result.get("asin"),
+        status=result.get("status"),
+        title=result.get("title"),
+        reviews=to_float(result.get("reviews")),
+        ratings=to_float(result.get("ratings")),
+        browse_node=result.get("browse_node"),
+        brand_name=result.get("brand_name"),
+        variations=result.get("variations"),
+        deal=result.get("deal"),
+        seller=result.get("seller"),
+        image_len=to_int(result.get("image_len")),
+        video=result.get("video"),
+        main_img_url=result.get("main_img_url"),
+        bullet_point_len=to_int(result.get("bullet_point_len")),
+        bsr1=result.get("bestSellerRank", ""),
+        bsr2="",
+        price=to_float(result.get("price")),
+        mrp=to_float(result.get("MRP")),
+        availability=result.get("availability"),
+        description=result.get("description"),
+        a_plus=result.get("A_plus"),
+        store_link=result.get("store_link"),
+    )
+    return row._replace(content_hash=fingerprint(row))
+
+
+def row_result(row: ResultRow) -> dict:
+    """``row`` back in the result dict shape ``result_row`` reads, for replay."""
+    values = row._asdict()
+    return {
+        "asin": values.pop("product_id"),
+        "bestSellerRank": values.pop("bsr1"),
+        "MRP": values.pop("mrp"),
+        "A_plus": values.pop("a_plus"),
+        **{k: v for k, v in values.items() if k not in ("bsr2", "content_hash")},
+    }
+
+
+# Columns written besides the ResultRow ones; generic_name gets the model default.
+EXTRA_COLUMNS = (
+    "user_id", "product_list_id", "generic_name", "updated_at", "last_audited_at", "change_count",
+)
+
+
+class RowUpserter:
+    """Multi-row ``INSERT ... ON CONFLICT DO UPDATE`` of ``ResultRow``s.
+
+    Skips model instances and the ORM's SQL compiler: statements are built
+    once per chunk size and run with plain cursor parameters. The syntax is
+    shared by SQLite (3.24+) and PostgreSQL. ``change_count`` goes up whenever
+    one of ``CHANGE_FIELDS`` differs from the stored row.
+    """
+
+    def __init__(self):
+        self.table = connection.ops.quote_name(ProductInfo._meta.db_table)
+        self.columns = list(EXTRA_COLUMNS) + list(ResultRow._fields)
+        quote = connection.ops.quote_name
+        # NULL-safe inequality: SQLite spells it IS NOT, PostgreSQL IS DISTINCT FROM.
+        differs = "IS NOT" if connection.vendor == "sqlite" else "IS DISTINCT FROM"
+        changed = " OR ".join(
+            f"{self.table}.{quote(c)} {differs} excluded.{quote(c)}" for c in CHANGE_FIELDS
+        )
+        self.updates = ", ".join(
+            [
+                f"{quote(c)} = excluded.{quote(c)}"
+                for c in self.columns
+                if c in UPDATE_FIELDS
+            ]
+            + [
+                f"{quote('change_count')} = {self.table}.{quote('change_count')}"
+                f" + CASE WHEN {changed} THEN 1 ELSE 0 END"
+            ]
+        )
+        self.column_list = ", ".join(quote(c) for c in self.columns)
+        self.row_placeholders = "(" + ", ".join(["%s"] * len(self.columns)) + ")"
+        # PostgreSQL reports no batch limit, but a statement takes at most
+        # 65535 parameters.
+        self.chunk_size = max(1, min(
+            connection.ops.bulk_batch_size(self.columns, [None] * 1000),
+            65535 // len(self.columns),
+        ))
+        self._statements: dict = {}
+
+    def _statement(self, rows: int) -> str:
+        sql = self._statements.get(rows)
+        if sql is None:
+            sql = self._statements[rows] = (
+                f"INSERT INTO {self.table} ({self.column_list}) "
+                f"VALUES {', '.join([self.row_placeholders] * rows)} "
+                f"ON CONFLICT ({connection.ops.quote_name('product_list_id')}, "
+                f"{connection.ops.quote_name('product_id')}) DO UPDATE SET {self.updates}"
+            )
+        return sql
+
+    def upsert(self, rows, product_list_id: int, user_id: int):
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        prefix = (user_id, product_list_id, "default_value", now, now, 0)
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.chunk_size):
+                chunk = rows[start:start + self.chunk_size]
+                params = [value for row in chunk for value in prefix + tuple(row)]
+                cursor.execute(self._statement(len(chunk)), params)
+
+
+class ResultSaver:
+    """Write-behind persistence of audit results.
+
+    ``add_result`` only puts the row on a bounded queue (waiting when the queue
+    is full, which slows scraping down to what the database can take). A writer
+    task takes up to ``batch_size`` rows, or whatever has arrived after
+    ``flush_interval`` seconds, and upserts them in one transaction on its own
+    thread, so database round-trips never run on the event loop or on the
+    thread shared by other ``sync_to_async`` calls.
+
+    ``on_commit`` is awaited with the product IDs of every committed batch.
+    A batch the database rejects (``ROW_ERRORS``) is split in halves until
+    the failing rows are isolated and the rest is written. Any other failure
+    retries the whole batch with backoff. Rows that can't be written either
+    way are handed to ``dead_letter`` as result dicts, so they can be
+    replayed later.
+
+    Rows whose fingerprint matches the stored ``content_hash`` are not
+    rewritten; only their ``last_audited_at`` is touched.
+    """
+
+    def __init__(
+        self,
+        product_list,
+        user,
+        batch_size=None,
+        flush_interval=None,
+        max_queue=None,
+        mode=None,
+        on_commit=None,
+        dead_letter=None,
+        retries=None,
+        retry_delay=None,
+        clock=time.monotonic,
+    ):
+        self.product_list = product_list
+        self.clock = clock
+        self.user = user
+        self.on_commit = on_commit
+        self.dead_letter = dead_letter
+        self.retries = settings.AUDIT_WRITE_RETRIES if retries is None else retries
+        self.retry_delay = settings.AUDIT_WRITE_RETRY_DELAY if retry_delay is None else retry_delay
+        # "sql" writes ResultRow tuples with RowUpserter, "orm" turns them into
+        # ProductInfo instances for bulk_create.
+        self.mode = mode or settings.AUDIT_WRITE_MODE
+        self.upserter = None
+        self.batch_size = batch_size or settings.AUDIT_WRITE_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.AUDIT_WRITE_INTERVAL
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue or settings.AUDIT_WRITE_QUEUE_SIZE)
+        self.executor = None
+        self.writer = None
+        self.rows_written = 0
+        self.flushes = 0
+        self.failed_rows = 0
+        self.write_retries = 0
+        self.dead_lettered = 0
+        self.rows_unchanged = 0
+        self.max_depth = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def _model(self, row: ResultRow, stored: dict, now) -> ProductInfo:
+        """``row`` as a ``ProductInfo`` for the ORM path, with ``change_count``
+        bumped the way ``RowUpserter`` does it."""
+        previous = stored.get(row.product_id)
+        change_count = 0
+        if previous is not None:
+            change_count = previous["change_count"] + any(
+                getattr(row, field) != previous[field] for field in CHANGE_FIELDS
+            )
+        return ProductInfo(
+            user=self.user,
+            product_list=self.product_list,
+            last_audited_at=now,
+            change_count=change_count,
+            **row._asdict(),
+        )
+
+    def start(self):
+        if self.writer is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit-writer")
+            self.writer = asyncio.create_task(self._write_loop())
+
+    async def add_result(self, result: dict):
+        self.start()
+        await self.queue.put(result_row(result))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def _next_batch(self):
+        """Up to ``batch_size`` rows, and whether the stop marker was reached."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                row = await self.queue.get()
+                deadline = self.clock() + self.flush_interval
+            else:
+                timeout = deadline - self.clock()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if row is None:
+                return batch, True
+            batch.append(row)
+        return batch, False
+
+    async def _write_loop(self):
+        while True:
+            batch, stop = await self._next_batch()
+            try:
+                if batch:
+                    await self._write(batch)
+            finally:
+                # Rows only count as done once they are committed, so that
+                # flush() really waits for the database.
+                for _ in range(len(batch) + stop):
+                    self.queue.task_done()
+            if stop:
+                return
+
+    async def _write(self, rows: list):
+        loop = asyncio.get_running_loop()
+        started = self.clock()
+        for attempt in range(self.retries + 1):
+            try:
+                unchanged = await loop.run_in_executor(self.executor, self._upsert, rows)
+                break
+            except ROW_ERRORS as e:
+                if len(rows) > 1:
+                    # Isolate the rows the database rejects; the others still go in.
+                    middle = len(rows) // 2
+                    await self._write(rows[:middle])
+                    await self._write(rows[middle:])
+                else:
+                    await self._dead_letter(rows, e)
+                return
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    self.write_retries += 1
+                    logger.warning(f"saving {len(rows)} audit results failed, retrying: {e}")
+                    await asyncio.sleep(self.retry_delay * 2**attempt)
+        else:
+            # Splitting would only multiply the round-trips to a failing database.
+            await self._dead_letter(rows, error)
+            return
+        latency = self.clock() - started
+        self.rows_written += len(rows)
+        self.rows_unchanged += unchanged
+        self.flushes += 1
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+        self.total_flush_latency += latency
+        if self.on_commit is not None:
+            try:
+                await self.on_commit([row.product_id for row in rows])
+            except Exception as e:
+                logger.warning(f"on_commit failed after saving {len(rows)} results: {e}")
+
+    async def _dead_letter(self, rows: list, error: Exception):
+        self.failed_rows += len(rows)
+        ids = [row.product_id for row in rows]
+        logger.error(f"failed to save audit results {ids}: {error}")
+        if self.dead_letter is None:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.dead_letter, [row_result(row) for row in rows]
+            )
+            self.dead_lettered += len(rows)
+        except Exception as e:
+            logger.error(f"could not dead-letter audit results {ids}: {e}")
+
+    def _stored(self, rows: list) -> dict:
+        """The stored values ``_upsert`` compares against, by product ID."""
+        fields = ["product_id", "content_hash"]
+        if self.mode != "sql":
+            fields += CHANGE_FIELDS + ["change_count"]
+        stored = {}
+        for start in range(0, len(rows), 500):
+            ids = [row.product_id for row in rows[start:start + 500]]
+            for values in ProductInfo.objects.filter(
+                product_list=self.product_list, product_id__in=ids
+            ).values(*fields):
+                stored[values["product_id"]] = values
+        return stored
+
+    def _split_unchanged(self, rows: list, stored: dict):
+        """Split ``rows`` into rows to upsert and product IDs whose values are unchanged."""
+        changed, unchanged = [], []
+        for row in rows:
+            previous = stored.get(row.product_id)
+            if row.content_hash and previous is not None and previous["content_hash"] == row.content_hash:
+                unchanged.append(row.product_id)
+            else:
+                changed.append(row)
+        return changed, unchanged
+
+    def _upsert(self, rows: list) -> int:
+        close_old_connections()
+        with transaction.atomic():
+            stored = self._stored(rows)
+            rows, unchanged = self._split_unchanged(rows, stored)
+            for start in range(0, len(unchanged), 500):
+                ProductInfo.objects.filter(
+                    product_list=self.product_list,
+                    product_id__in=unchanged[start:start + 500],
+                ).update(last_audited_at=timezone.now())
+            if rows and self.mode == "sql":
+                if self.upserter is None:
+                    self.upserter = RowUpserter()
+                self.upserter.upsert(rows, self.product_list.id, self.user.id)
+            elif rows:
+                now = timezone.now()
+                ProductInfo.objects.bulk_create(
+                    [self._model(row, stored, now) for row in rows],
+                    batch_size=self.batch_size,
+                    update_conflicts=True,
+                    update_fields=UPDATE_FIELDS + ["change_count"],
+                    unique_fields=["product_list", "product_id"],
+                )
+        return len(unchanged)
+
+    async def flush(self):
+        """Wait until every queued row has been written."""
+        if self.writer is not None:
+            await self.queue.join()
+
+    async def close(self):
+        """Write everything still queued, then stop the writer and its thread."""
+        if self.writer is None:
+            return
+        await self.queue.put(None)
+        await self.writer
+        self.executor.shutdown(wait=True)
+        self.writer = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "rows_written": self.rows_written,
+            "failed_rows": self.failed_rows,
+            "write_retries": self.write_retries,
+            "dead_lettered": self.dead_lettered,
+            "rows_unchanged": self.rows_unchanged,
+            "flushes": self.flushes,
+            "last_flush_latency": round(self.last_flush_latency, 3),
+            "max_flush_latency": round(self.max_flush_latency, 3),
+            "avg_flush_latency": round(self.total_flush_latency / self.flushes, 3) if self.flushes else 0.0,
+        }
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+import aioredis
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+# Only final answers are shared; Rush Hour, errors and give-ups are re-fetched.
+CACHEABLE_STATUSES = {
+    "Live",
+    "Suppressed",
+    "Suppressed Asin Changed",
+    "Suppressed Detail Page Removed",
+}
+
+# KEYS: lock   ARGV: token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class ResultCache:
+    """Audit results shared by every list and user, keyed by platform and product id.
+
+    A result scraped in the last ``ttl`` seconds is reused as is (a ``ttl`` of
+    0 only shares fetches that are in flight). Concurrent
+    requests for the same product share one fetch: inside a process through a
+    future, across processes through a ``SET NX`` lock whose holder publishes
+    on ``audit_cache_ready:{platform}:{product_id}`` once the result is cached.
+    Waiters give up after ``lock_ttl`` seconds and fetch the page themselves.
+    """
+
+    _caches: dict = {}
+
+    def __init__(self, platform: str, redis_url="redis://localhost", ttl=None, lock_ttl=None):
+        self.platform = platform
+        self.redis_url = redis_url
+        self.ttl = settings.AUDIT_RESULT_CACHE_TTL if ttl is None else ttl
+        self.lock_ttl = settings.AUDIT_RESULT_CACHE_LOCK_TTL if lock_ttl is None else lock_ttl
+        self.redis = None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    @classmethod
+    def for_current_loop(cls, platform: str) -> "ResultCache":
+        key = (asyncio.get_running_loop(), platform)
+        cache = cls._caches.get(key)
+        if cache is None:
+            cache = cls._caches[key] = cls(platform)
+        return cache
+
+    async def _get_redis(self):
+        if self.redis is None:
+            self.redis = await aioredis.from_url(self.redis_url, decode_responses=True)
+            self._release_lock = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+        return self.redis
+
+    def _keys(self, product_id: str):
+        suffix = f"{self.platform}:{product_id}"
+        return f"audit_cache:{suffix}", f"audit_cache_lock:{suffix}", f"audit_cache_ready:{suffix}"
+
+    async def get_or_fetch(self, product_id: str, fetch):
+        """Cached result for ``product_id``, or the result of ``await fetch()``."""
+        inflight = self._inflight.get(product_id)
+        if inflight is not None:
+            result = await asyncio.shield(inflight)
+            if result is not None:
+                self.shared += 1
+                return dict(result)
+            # The fetch we waited for came back empty or was cancelled.
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on it; don't warn about an unretrieved error.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[product_id] = future
+        try:
+            result = await self._get_or_fetch(product_id, fetch)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.set_result(None)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(product_id) is future:
+                del self._inflight[product_id]
+
+    async def _get_or_fetch(self, product_id: str, fetch):
+        key, lock_key, channel = self._keys(product_id)
+        try:
+            redis = await self._get_redis()
+            cached = await redis.get(key)
+            if cached:
+                self.hits += 1
+                return json.loads(cached)
+
+            token = uuid.uuid4().hex
+            if not await redis.set(lock_key, token, nx=True, px=int(self.lock_ttl * 1000)):
+                cached = await self._wait_for_other(redis, key, lock_key, channel)
+                if cached is not None:
+                    self.shared += 1
+                    return cached
+                token = None
+        except aioredis.RedisError as e:
+            logger.warning(f"result cache unavailable for {product_id}: {e}")
+            self.misses += 1
+            return await fetch()
+
+        self.misses += 1
+        try:
+            result = await fetch()
+            if self.ttl > 0 and result and result.get("status") in CACHEABLE_STATUSES:
+                try:
+                    await redis.set(key, json.dumps(result, default=str), ex=int(self.ttl))
+                    await redis.publish(channel, "1")
+                except aioredis.RedisError as e:
+                    logger.warning(f"could not cache result for {product_id}: {e}")
+            return result
+        finally:
+            # Released only after caching, so waiters never see a free lock
+            # and an empty cache in between.
+            if token is not None:
+                try:
+                    await self._release_lock(keys=[lock_key], args=[token])
+                except aioredis.RedisError:
+                    pass
+
+    async def _wait_for_other(self, redis, key, lock_key, channel):
+        """Wait for the process holding the lock to cache its result.
+
+        Returns None when it gave up without a cacheable result, died, or
+        the lock TTL passed; the caller then fetches the page itself.
+        """
+        pubsub = redis.pubsub()
+        await pubsub.subscribe(channel)
+        deadline = time.monotonic() + self.lock_ttl
+        try:
+            while True:
+                cached = await redis.get(key)
+                if cached:
+                    return json.loads(cached)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not await redis.exists(lock_key):
+                    return None
+                await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=min(remaining, 1.0)
+                )
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "shared": self.shared, "misses": self.misses}
@@ -0,0 +1,65 @@
+import logging
+import random
+
+from django.conf import settings
+
+from .concurrency import CAPTCHA, RUSH_HOUR
+
+logger = logging.getLogger("scraping")
+
+# Transient failure reasons and the label used in the final status when an
+# item still fails after its last attempt.
+NAVIGATION = "navigation"
+TIMEOUT = "timeout"
+
+GAVE_UP_LABELS = {
+    CAPTCHA: "Captcha",
+    RUSH_HOUR: "Rush Hour",
+    NAVIGATION: "Navigation Error",
+    TIMEOUT: "Timeout",
+}
+
+
+def gave_up_status(reason: str) -> str:
+    """Status stored for a product that exhausted its retries, e.g. ``Gave Up: Rush Hour``."""
+    return f"Gave Up: {GAVE_UP_LABELS.get(reason, reason)}"
+
+
+class RetryQueue:
+    """Per-audit retry bookkeeping on top of ``WorkQueueScheduler.defer``.
+
+    The n-th retry of an item waits ``min(max_delay, base_delay * 2 ** (n - 1))``
+    seconds with equal jitter; after ``max_attempts`` attempts the item is
+    given up on.
+    """
+
+    def __init__(self, scheduler, max_attempts=None, base_delay=None, max_delay=None):
+        self.scheduler = scheduler
+        self.max_attempts = settings.AUDIT_RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.base_delay = settings.AUDIT_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = settings.AUDIT_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.attempts: dict = {}
+        self.retried: dict = {}
+        self.gave_up: dict = {}
+
+    def backoff(self, attempt: int) -> float:
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def retry(self, item, reason: str) -> bool:
+        """Defer ``item`` for another attempt; False once its attempts are used up."""
+        attempt = self.attempts.get(item, 1)
+        if attempt >= self.max_attempts:
+            self.gave_up[reason] = self.gave_up.get(reason, 0) + 1
+            logger.warning(f"giving up on {item} after {attempt} attempts ({reason})")
+            return False
+
+        self.attempts[item] = attempt + 1
+        self.retried[reason] = self.retried.get(reason, 0) + 1
+        delay = self.backoff(attempt)
+        logger.info(f"retrying {item} in {delay:.0f}s ({reason}, attempt {attempt + 1})")
+        self.scheduler.defer(item, delay)
+        return True
+
+    def stats(self) -> dict:
+        return {"retried": dict(self.retried), "gave_up": dict(self.gave_up)}
@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("scraping")
+
+
+class WorkQueueScheduler:
+    """A single shared work queue that a resizable set of slots pull from.
+
+    Every slot takes the next item as soon as it is free, so one slow item only
+    ever holds up its own slot. ``item_timeout`` cancels an item that runs too
+    long and hands it to ``on_failure`` instead of letting it pin the slot.
+
+    Items handed back through ``defer`` are held until their delay has passed
+    and the main queue has run dry, so retries happen at the tail of the run
+    while browsers are still warm. ``clock`` measures those delays.
+    """
+
+    def __init__(self, handler, concurrency: int, item_timeout=None, on_failure=None, clock=time.monotonic):
+        self.handler = handler
+        self.clock = clock
+        self.on_failure = on_failure
+        self.item_timeout = item_timeout
+        self.concurrency = max(1, concurrency)
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._slots: dict[int, asyncio.Task] = {}
+        self._stopping: set[int] = set()
+        self._next_slot_id = 0
+        self._running = False
+        self._deferred: list = []
+        self._deferred_seq = itertools.count()
+        self._requeued = asyncio.Event()
+        self.busy = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def resize(self, concurrency: int):
+        """Change the number of slots while the queue is being worked."""
+        concurrency = max(1, concurrency)
+        if concurrency != self.concurrency:
+            logger.info(f"scheduler resized {self.concurrency} -> {concurrency}")
+        self.concurrency = concurrency
+        if self._running:
+            self._rebalance()
+
+    def defer(self, item, delay: float):
+        """Put ``item`` back for another pass after at least ``delay`` seconds."""
+        heapq.heappush(
+            self._deferred, (self.clock() + delay, next(self._deferred_seq), item)
+        )
+
+    async def _feed_deferred(self, poll: float = 0.5):
+        while True:
+            now = self.clock()
+            if self._deferred and self.queue.empty() and self._deferred[0][0] <= now:
+                # Everything that is due at once, so the retry tail runs on
+                # every idle slot rather than one item per poll.
+                while self._deferred and self._deferred[0][0] <= now:
+                    _, _, item = heapq.heappop(self._deferred)
+                    self.queue.put_nowait(item)
+                self._requeued.set()
+                continue
+            wait = poll
+            # A due item waits for the queue to drain; don't spin meanwhile.
+            if self._deferred and self.queue.empty():
+                wait = min(poll, max(0, self._deferred[0][0] - now))
+            await asyncio.sleep(wait)
+
+    def _rebalance(self):
+        active = sorted(i for i in self._slots if i not in self._stopping)
+        while len(active) < self.concurrency:
+            slot_id = self._next_slot_id
+            self._next_slot_id += 1
+            self._slots[slot_id] = asyncio.create_task(self._slot(slot_id))
+            active.append(slot_id)
+        # Surplus slots finish the item they hold and then exit.
+        for slot_id in active[self.concurrency:]:
+            self._stopping.add(slot_id)
+
+    async def _slot(self, slot_id: int):
+        try:
+            while slot_id not in self._stopping:
+                item = await self.queue.get()
+                try:
+                    if slot_id in self._stopping:
+                        self.queue.put_nowait(item)
+                        break
+                    await self._process(item)
+                finally:
+                    self.queue.task_done()
+        finally:
+            self._stopping.discard(slot_id)
+            self._slots.pop(slot_id, None)
+
+    async def _process(self, item):
+        self.busy += 1
+        try:
+            if self.item_timeout:
+                await asyncio.wait_for(self.handler(item), self.item_timeout)
+            else:
+                await self.handler(item)
+            self.completed += 1
+        except asyncio.TimeoutError as e:
+            self.timed_out += 1
+            logger.warning(f"{item} timed out after {self.item_timeout}s")
+            await self._fail(item, e)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"{item} failed: {e}")
+            await self._fail(item, e)
+        finally:
+            self.busy -= 1
+
+    async def _fail(self, item, error: Exception):
+        if self.on_failure is None:
+            return
+        try:
+            await self.on_failure(item, error)
+        except Exception as e:
+            logger.error(f"failure handler error for {item}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "slots": len(self._slots) - len(self._stopping),
+            "busy": self.busy,
+            "queued": self.queue.qsize(),
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "deferred": len(self._deferred),
+        }
+
+    async def run(self, items) -> dict:
+        """Work through ``items`` and return once every one has been handled."""
+        started = self.clock()
+        for item in items:
+            self.queue.put_nowait(item)
+
+        self._running = True
+        self._rebalance()
+        feeder = asyncio.create_task(self._feed_deferred())
+        try:
+            while True:
+                await self.queue.join()
+                # The feeder may have requeued retries since join() resolved.
+                if not self.queue.empty():
+                    continue
+                if not self._deferred:
+                    break
+                self._requeued.clear()
+                await self._requeued.wait()
+        finally:
+            self._running = False
+            slots = list(self._slots.values()) + [feeder]
+            for task in slots:
+                task.cancel()
+            await asyncio.gather(*slots, return_exceptions=True)
+
+        stats = self.stats()
+        stats["elapsed"] = round(self.clock() - started, 2)
+        return stats
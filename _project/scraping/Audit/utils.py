@@ -1,13 +1,11 @@
 import os
-import json
-import aiohttp
 import random
 import socket
-from PIL import Image
-from io import BytesIO
 from typing import Dict, Any, Tuple
-from amazoncaptcha import AmazonCaptcha
-from playwright.async_api import Response, Page, Browser, BrowserContext
+from playwright.async_api import Page, Browser, BrowserContext
+
+from .captcha import CaptchaService
+from .identity import Identity
 
 
 def check_internet() -> bool:
@@ -27,29 +25,6 @@ def check_internet() -> bool:
         return False
 
 
-async def handle_network_response(response: Response) -> None:
-    """
-    Handle network responses during page navigation.
-    If the response URL contains 'dp' and status is 200,
-    attempts to parse the response body as JSON.
-
-    Args:
-        response (Response): The network response object from Playwright.
-    """
-    try:
-        if "dp" in response.url and response.status == 200:
-            body = await response.body()
-
-            try:
-                json_data = json.loads(body)
-                # You can optionally do something with json_data here
-            except json.JSONDecodeError:
-                pass
-    except Exception as e:
-        # Optionally log the error if needed
-        pass
-
-
 async def is_captcha_present(page: Page) -> bool:
     """
     Checks whether a captcha input field is present on the given page.
@@ -73,49 +48,19 @@ async def solve_captcha(page: Page) -> bool:
     """
     Attempts to detect and solve an Amazon captcha on the given page.
 
-    This function locates the captcha image, downloads it, solves it using
-    the AmazonCaptcha library, and submits the solution. It waits for the
-    page to fully load afterward.
+    The image is downloaded once and solved in a process pool by
+    ``CaptchaService``, which then submits the solution and waits for the
+    page to fully load.
 
     Args:
         page (Page): The Playwright page instance to work with.
 
     Returns:
-        bool: True if the captcha was successfully solved and submitted,
+        bool: True if the captcha was solved, submitted and accepted,
               False otherwise.
     """
     try:
-        captcha_image = await page.query_selector("img[src*='captcha']")
-        if not captcha_image:
-            print("No captcha image found.")
-            return False
-
-        captcha_src = await captcha_image.get_attribute("src")
-        print(f"Captcha source URL: {captcha_src}")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(captcha_src) as response:
-                if response.status == 200:
-                    content = await response.read()
-                    img = Image.open(BytesIO(content))
-
-                    captcha = AmazonCaptcha.fromlink(captcha_src)
-                    solution = captcha.solve()
-                    print(f"Captcha solution: {solution}")
-
-                    captcha_input = await page.query_selector("#captchacharacters")
-                    await captcha_input.click()
-                    await captcha_input.type(solution, delay=100)
-
-                    submit_button = await page.query_selector('button[type="submit"]')
-                    await submit_button.click()
-
-                    await page.wait_for_load_state("load", timeout=60000)
-                    return True
-
-        print("Failed to fetch captcha image.")
-        return False
-
+        return await CaptchaService.for_current_loop().solve_page(page)
     except Exception as e:
         print(f"Failed to solve captcha: {e}")
         return False
@@ -156,167 +101,30 @@ async def handle_captcha(page: Page) -> bool:
         return False
 
 
-async def spoof_browser_fingerprint(
-    page: Page, context_settings: Dict[str, Any]
-) -> None:
-    """
-    Spoofs various browser fingerprint attributes via JavaScript injection on the given page.
-
-    This function alters properties such as user agent, platform, languages, hardware concurrency,
-    and device memory to simulate a realistic and randomized browser environment, reducing
-    the likelihood of bot detection.
-
-    Args:
-        page (Page): The Playwright page instance to apply fingerprint spoofing to.
-        context_settings (Dict[str, Any]): Dictionary containing browser context settings,
-                                           including the 'user_agent' key.
-
-    Returns:
-        None
-    """
-
-    ua = context_settings["user_agent"]
-    if "Windows" in ua:
-        platform = "Win32"
-    elif "Macintosh" in ua:
-        platform = "MacIntel"
-    else:
-        platform = "Linux x86_64"
-
-    languages = random.sample(
-        [["en-US", "en"], ["fr-FR", "fr"], ["de-DE", "de"], ["es-ES", "es"]], 1
-    )[0]
-    plugins = random.sample(range(1, 6), random.randint(1, 5))
-    hardware_concurrency = random.choice([2, 4, 8, 16])
-    device_memory = random.choice([2, 4, 8, 16])
-    brands = [{"brand": "Not-A.Brand", "version": str(random.randint(90, 120))}]
-    mobile = random.choice([True, False])
-
-    init_script = f"""
-        Object.defineProperty(navigator, 'webdriver', {{
-            get: () => false
-        }});
-
-        Object.defineProperty(navigator, 'languages', {{
-            get: () => {json.dumps(languages)}
-        }});
-
-        Object.defineProperty(navigator, 'platform', {{
-            get: () => '{platform}'
-        }});
-
-        Object.defineProperty(navigator, 'plugins', {{
-            get: () => {json.dumps(plugins)}
-        }});
-
-        Object.defineProperty(navigator, 'hardwareConcurrency', {{
-            get: () => {hardware_concurrency}
-        }});
-
-        Object.defineProperty(navigator, 'deviceMemory', {{
-            get: () => {device_memory}
-        }});
-
-        if (navigator.userAgentData) {{
-            Object.defineProperty(navigator, 'userAgentData', {{
-                value: {{
-                    brands: {json.dumps(brands)},
-                    mobile: {str(mobile).lower()},
-                    platform: '{platform}'
-                }}
-            }});
-        }}
-
-        Object.defineProperty(window, 'chrome', {{
-            value: {{
-                runtime: {{}}
-            }}
-        }});
-
-        const originalQuery = window.navigator.permissions.query;
-        window.navigator.permissions.query = (parameters) => (
-            parameters.name === 'notifications' ?
-                Promise.resolve({{ state: Notification.permission }}) :
-                originalQuery(parameters)
-        );
-
-        Object.defineProperty(navigator, 'mediaDevices', {{
-            value: {{
-                enumerateDevices: () => Promise.resolve([])
-            }}
-        }});
-    """
-
-    await page.add_init_script(init_script)
-
-
 async def create_spoofed_context(
-    browser: Browser,
+    browser: Browser, identity: Identity = None
 ) -> Tuple[BrowserContext, Dict[str, Any]]:
     """
-    Creates a new browser context with spoofed settings for user agent, viewport, timezone,
-    locale, and geolocation.
+    Creates a new browser context presenting one consistent identity: user agent,
+    viewport, en-IN locale, Asia/Kolkata timezone, an Indian geolocation and the
+    identity's saved cookies. Its navigator overrides are installed once, on the
+    context, so every page opened in it inherits them.
 
     Args:
         browser (Browser): The Playwright browser instance to create the context from.
+        identity (Identity, optional): The identity to present; a random one from
+            the same family when omitted.
 
     Returns:
         Tuple[BrowserContext, Dict[str, Any]]: A tuple containing the created browser context and
-        a dictionary with the spoofed context settings.
+        a dictionary with the identity's context settings.
     """
+    if identity is None:
+        identity = Identity(random.randrange(10**6))
 
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 12_3) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.1 Safari/605.1.15",
-        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36",
-    ]
-
-    viewports = [
-        {"width": 1366, "height": 768},
-        {"width": 1920, "height": 1080},
-        {"width": 1440, "height": 900},
-    ]
-
-    timezones = [
-        "America/New_York",
-        "Europe/London",
-        "Asia/Kolkata",
-        "Australia/Sydney",
-    ]
-
-    locales = ["en-US", "en-GB", "fr-FR", "de-DE"]
-
-    geolocations = [
-        {"longitude": -73.935242, "latitude": 40.730610},
-        {"longitude": -0.127758, "latitude": 51.507351},
-        {"longitude": 77.594566, "latitude": 12.971599},
-        {"longitude": 151.209900, "latitude": -33.865143},
-    ]
-
-    # Now pick one of each randomly
-    user_agent = random.choice(user_agents)
-    viewport = random.choice(viewports)
-    timezone = random.choice(timezones)
-    locale = random.choice(locales)
-    geolocation = random.choice(geolocations)
-
-    context = await browser.new_context(
-        user_agent=user_agent,
-        viewport=viewport,
-        timezone_id=timezone,
-        locale=locale,
-        geolocation=geolocation,
-        permissions=["geolocation"],
-        bypass_csp=True,
-    )
-
-    return context, {
-        "user_agent": user_agent,
-        "viewport": viewport,
-        "timezone": timezone,
-        "locale": locale,
-        "geolocation": geolocation,
-    }
+    context = await browser.new_context(**identity.context_options())
+    await context.add_init_script(identity.init_script)
+    return context, identity.context_settings()
 
 
 # === Global Task counter === 
@@ -327,68 +135,210 @@ import redis
 import redis
 import json
 
+import aioredis
+import logging
+from django.conf import settings
+
+logger = logging.getLogger("scraping")
+
+# One hash per task holds count, total, status, user_id and requested slots.
+# KEYS: task hash, updates channel, active_tasks
+# ARGV: task_id, count delta, status ('' keeps it), absolute count ('' keeps it)
+PROGRESS_SCRIPT = """
+if ARGV[4] ~= '' then
+    redis.call('HSET', KEYS[1], 'count', ARGV[4])
+elseif tonumber(ARGV[2]) ~= 0 then
+    redis.call('HINCRBY', KEYS[1], 'count', ARGV[2])
+end
+if ARGV[3] ~= '' then
+    redis.call('HSET', KEYS[1], 'status', ARGV[3])
+    if ARGV[3] == 'done' or ARGV[3] == 'failed' then
+        redis.call('SREM', KEYS[3], ARGV[1])
+    end
+end
+local f = redis.call('HMGET', KEYS[1], 'count', 'total', 'status', 'user_id')
+local payload = string.format(
+    '{"task_id": "%s", "count": %d, "total": %d, "status": "%s", "user_id": %s}',
+    ARGV[1], tonumber(f[1]) or 0, tonumber(f[2]) or 0, f[3] or 'running', f[4] or 'null'
+)
+redis.call('PUBLISH', KEYS[2], payload)
+return payload
+"""
+
+
+def _progress_from_fields(task_id, fields):
+    count, total, status, user_id = fields
+    return {
+        "task_id": task_id,
+        "count": int(count) if count else 0,
+        "total": int(total) if total else 0,
+        "status": status if status else "running",
+        "user_id": int(user_id) if user_id else None
+    }
+
+
 class TaskProgress:
+    """Progress of an audit task, kept in the ``task:{task_id}`` hash.
+
+    Every update changes the hash and publishes the new progress on
+    ``task_updates:{task_id}`` in a single round-trip.
+    """
+
     def __init__(self, task_id: str, redis_url="redis://localhost:6379"):
         self.task_id = task_id
         self.redis_url = redis_url
         self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.key = f"task:{task_id}"
+        self._script = self.redis.register_script(PROGRESS_SCRIPT)
 
-    def init_task(self, total: int, user_id: int):
+    def _update(self, delta: int = 0, status: str = "", count="", client=None):
+        return self._script(
+            keys=[self.key, f"task_updates:{self.task_id}", "active_tasks"],
+            args=[self.task_id, delta, status, count],
+            client=client,
+        )
+
+    def init_task(self, total: int, user_id: int, product_list_id=None):
         """Initialize a new task in Redis and mark it as active."""
-        self.redis.set(f"task_counter:{self.task_id}", 0)
-        self.redis.set(f"task_total:{self.task_id}", total)
-        self.redis.set(f"task_user:{self.task_id}", user_id)
-        self.redis.set(f"task_status:{self.task_id}", "running")
-        self.redis.sadd("active_tasks", self.task_id)
-        self.publish_update()
+        pipe = self.redis.pipeline()
+        pipe.delete(self.key)
+        fields = {"count": 0, "total": total, "status": "running", "user_id": user_id}
+        if product_list_id is not None:
+            fields["product_list_id"] = product_list_id
+        pipe.hset(self.key, mapping=fields)
+        pipe.sadd("active_tasks", self.task_id)
+        self._update(client=pipe)
+        pipe.execute()
         print(f"total product {total}")
 
+    def resume_task(self, count: int):
+        """Mark a resumed task as running again with ``count`` products done."""
+        pipe = self.redis.pipeline()
+        pipe.sadd("active_tasks", self.task_id)
+        self._update(status="running", count=count, client=pipe)
+        pipe.execute()
+
+    def exists(self) -> bool:
+        return bool(self.redis.exists(self.key))
+
+    def get_product_list_id(self):
+        """The product list the task audits, or None if it was never recorded."""
+        product_list_id = self.redis.hget(self.key, "product_list_id")
+        return int(product_list_id) if product_list_id else None
+
     def increment(self, amount: int = 1):
-        self.redis.incrby(f"task_counter:{self.task_id}", amount)
-        self.publish_update()
+        self._update(delta=amount)
 
     def set_status(self, status: str):
-        self.redis.set(f"task_status:{self.task_id}", status)
-        if status in ("done", "failed"):
-            self.redis.srem("active_tasks", self.task_id)
-        self.publish_update()
+        self._update(status=status)
+
+    def set_shards(self, shard_task_ids):
+        """Remember the shard subtasks of a sharded audit so they can be revoked."""
+        if shard_task_ids:
+            self.redis.sadd(f"task_shards:{self.task_id}", *shard_task_ids)
+
+    def get_shards(self):
+        return self.redis.smembers(f"task_shards:{self.task_id}")
+
+    def set_count(self, count: int):
+        self._update(count=count)
+
+    def set_slots(self, slots: int):
+        """Ask the running audit to resize its browser slots."""
+        self.redis.hset(self.key, "slots", slots)
+
+    def get_slots(self):
+        slots = self.redis.hget(self.key, "slots")
+        return int(slots) if slots else None
 
     def get_progress(self):
-        count = self.redis.get(f"task_counter:{self.task_id}")
-        total = self.redis.get(f"task_total:{self.task_id}")
-        status = self.redis.get(f"task_status:{self.task_id}")
-        user_id = self.redis.get(f"task_user:{self.task_id}")
-
-        return {
-            "task_id": self.task_id,
-            "count": int(count) if count else 0,
-            "total": int(total) if total else 0,
-            "status": status if status else "running",
-            "user_id": int(user_id) if user_id else None
-        }
+        fields = self.redis.hmget(self.key, "count", "total", "status", "user_id")
+        return _progress_from_fields(self.task_id, fields)
 
     def publish_update(self):
         """Publish task progress to a Redis Pub/Sub channel."""
-        progress = self.get_progress()
-        self.redis.publish(f"task_updates:{self.task_id}", json.dumps(progress))
+        self._update()
 
     @staticmethod
     def get_all_tasks(redis_url="redis://localhost:6379"):
         r = redis.Redis.from_url(redis_url, decode_responses=True)
-        task_ids = r.smembers("active_tasks")
-        tasks = []
+        task_ids = list(r.smembers("active_tasks"))
+        pipe = r.pipeline()
         for task_id in task_ids:
-            task = TaskProgress(task_id, redis_url)
-            tasks.append(task.get_progress())
-        return tasks
-
-if __name__ == "__main__":
-    # Example usage
-    async def main():
-        task = TaskProgress("task_123")
-        await task.init_task(total=100, user_id=1)
-        await task.increment(5)
-        progress = await task.get_progress()
-        print(progress)
-
-    asyncio.run(main())
+            pipe.hmget(f"task:{task_id}", "count", "total", "status", "user_id")
+        return [
+            _progress_from_fields(task_id, fields)
+            for task_id, fields in zip(task_ids, pipe.execute())
+        ]
+
+
+class AsyncTaskProgress(TaskProgress):
+    """``TaskProgress`` for the audit event loop.
+
+    ``increment`` only bumps a local counter; a background task applies the
+    accumulated count and publishes at most once per ``interval`` seconds, so
+    Redis traffic does not grow with the number of browser slots. ``close``
+    flushes whatever is left. The awaitable ``aset_status`` and ``aget_slots``
+    sit next to the blocking methods they replace inside the event loop.
+    """
+
+    def __init__(self, task_id: str, redis_url="redis://localhost:6379", interval=None):
+        super().__init__(task_id, redis_url)
+        self.interval = settings.AUDIT_PROGRESS_INTERVAL if interval is None else interval
+        self.async_redis = None
+        self.pending = 0
+        self._flusher = None
+        self.publishes = 0
+
+    async def _get_redis(self):
+        if self.async_redis is None:
+            self.async_redis = await aioredis.from_url(self.redis_url, decode_responses=True)
+            self._async_script = self.async_redis.register_script(PROGRESS_SCRIPT)
+        return self.async_redis
+
+    async def _async_update(self, delta: int = 0, status: str = "", count=""):
+        await self._get_redis()
+        self.publishes += 1
+        return await self._async_script(
+            keys=[self.key, f"task_updates:{self.task_id}", "active_tasks"],
+            args=[self.task_id, delta, status, count],
+        )
+
+    def increment(self, amount: int = 1):
+        self.pending += amount
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        delta, self.pending = self.pending, 0
+        try:
+            await self._async_update(delta=delta)
+        except Exception as e:
+            self.pending += delta
+            logger.warning(f"progress update failed for {self.task_id}: {e}")
+
+    async def aset_status(self, status: str):
+        await self.flush()
+        await self._async_update(status=status)
+
+    async def aget_slots(self):
+        redis = await self._get_redis()
+        slots = await redis.hget(self.key, "slots")
+        return int(slots) if slots else None
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+        if self.async_redis is not None:
+            await self.async_redis.close()
+            self.async_redis = None
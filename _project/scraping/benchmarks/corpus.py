@@ -0,0 +1,166 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, NamedTuple
+
+# Placeholder the server replaces with its own address, so captcha images and
+# other absolute links never leave the box.
+BASE_URL_TOKEN = "{{base_url}}"
+
+
+class CorpusPage(NamedTuple):
+    name: str
+    asin: str
+    html: str
+    # Expected result fields; None when the page must not produce a result
+    # (captcha). Fields left out are not scored.
+    golden: Dict[str, Any] | None
+
+
+def _status_card(asin: str) -> str:
+    return (
+        '<div data-card-metrics-id="tell-amazon-desktop_DetailPage_3">'
+        f'<div data-asin="{asin}"></div></div>'
+    )
+
+
+def _product_page(asin: str, card_asin: str = None, mrp: bool = True, variations: bool = True) -> str:
+    basis_price = (
+        '<div class="basisPrice"><span class="a-price a-text-price">'
+        '<span class="a-offscreen">₹1,999.00</span></span></div>'
+        if mrp else ""
+    )
+    twister = '<div id="variation_color_name"><span>Colour: Red</span></div>' if variations else ""
+    return f"""<!doctype html>
+<html lang="en-in"><head><title>Amazon.in: Acme Widget Pro</title></head>
+<body><div id="dp" class="en_IN kitchen">
+<div id="wayfinding-breadcrumbs_feature_div"><ul class="a-unordered-list a-horizontal a-size-small">
+<li><span><a href="/kitchen">Home &amp; Kitchen</a></span></li>
+<li><span><a href="/cookware">Cookware</a></span></li></ul></div>
+<div id="altImages"><ul class="a-unordered-list a-nostyle a-button-list a-vertical a-spacing-top-extra-large regularAltImageViewLayout">
+<li><img src="{BASE_URL_TOKEN}/images/I/61abc._SS100_.jpg"></li>
+<li><img src="{BASE_URL_TOKEN}/images/I/61def._SS100_.jpg"></li>
+<li class="videoThumbnail"><img src="{BASE_URL_TOKEN}/images/I/video.gif"></li></ul></div>
+<span id="productTitle">   Acme Widget Pro, 1.5 L, Stainless Steel   </span>
+<a id="bylineInfo" href="/stores/Acme/page/1A2B">Visit the Acme Store</a>
+<span id="acrPopover" title="4.3 out of 5 stars"></span>
+<span id="acrCustomerReviewText">1,234 ratings</span>
+{twister}
+<span class="a-price-whole">1,299<span class="a-price-decimal">.</span></span>
+{basis_price}
+<div id="availability"><span>
+    In stock
+</span></div>
+<a id="sellerProfileTriggerId" href="/seller">Acme Retail</a>
+<div id="feature-bullets"><ul class="a-unordered-list a-vertical a-spacing-mini">
+<li>Stainless steel body</li><li>1.5 litre capacity</li><li>Auto shut-off</li></ul></div>
+<div id="productDescription"><p> Boils water quickly. </p></div>
+<div id="aplus"><h2>From the manufacturer</h2></div>
+<table id="productDetails_detailBullets_sections1">
+<tr><th> ASIN </th><td>{asin}</td></tr>
+<tr><th> Best Sellers Rank </th><td><ul>
+<li><span class="a-list-item"><span>#1,024 in Home &amp; Kitchen (See Top 100 in Home &amp; Kitchen)</span></span></li>
+<li><span class="a-list-item"><span>#12 in Cookware</span></span></li></ul></td></tr></table>
+{_status_card(card_asin or asin)}
+</div></body></html>"""
+
+
+LIVE_FIELDS = {
+    "title": "Acme Widget Pro, 1.5 L, Stainless Steel",
+    "brand_name": "Acme",
+    "browse_node": "Home & Kitchen > Cookware",
+    "reviews": "4.3",
+    "ratings": "1234",
+    "variations": "Available",
+    "deal": "N/A",
+    "seller": "Acme Retail",
+    "image_len": 3,
+    "video": "Available",
+    "main_img_url": f"{BASE_URL_TOKEN}/images/I/61abc._SS500_.jpg",
+    "bullet_point_len": 3,
+    "bestSellerRank": "#1,024 in Home & Kitchen, #12 in Cookware",
+    "price": "1299.",
+    "MRP": 1999.0,
+    "availability": "In stock",
+    "description": "Boils water quickly.",
+    "A_plus": "Available",
+    "store_link": "http://amazon.in/stores/Acme/page/1A2B",
+}
+
+SUPPRESSED_FIELDS = {"title": "N/A", "price": "N/A", "MRP": 0}
+
+
+def build_corpus() -> list:
+    """One page per layout the audit has to tell apart."""
+    return [
+        CorpusPage("live", "B0BENCH001", _product_page("B0BENCH001"), {"status": "Live", **LIVE_FIELDS}),
+        CorpusPage(
+            "live_no_mrp",
+            "B0BENCH002",
+            _product_page("B0BENCH002", mrp=False, variations=False),
+            {"status": "Live", **LIVE_FIELDS, "MRP": 0, "variations": "N/A"},
+        ),
+        CorpusPage(
+            "suppressed",
+            "B0BENCH003",
+            '<html><body><div id="dp"><div class="h1">This item is currently unavailable</div>'
+            "</div></body></html>",
+            {"status": "Suppressed", **SUPPRESSED_FIELDS},
+        ),
+        CorpusPage(
+            "rush_hour",
+            "B0BENCH004",
+            "<html><body><center><p>Oops! It's rush hour and traffic is piling up on that page.</p>"
+            "<p>Please try again in a short while.</p></center></body></html>",
+            {"status": "Rush Hour", **SUPPRESSED_FIELDS},
+        ),
+        CorpusPage(
+            "captcha",
+            "B0BENCH005",
+            '<html><body><form action="/errors/validateCaptcha">'
+            f'<img src="{BASE_URL_TOKEN}/captcha/Captcha_benchmark.jpg">'
+            '<input id="captchacharacters" name="field-keywords">'
+            '<button type="submit">Continue shopping</button></form></body></html>',
+            None,
+        ),
+        CorpusPage(
+            "asin_changed",
+            "B0BENCH006",
+            _product_page("B0BENCH006", card_asin="B0BENCH999"),
+            {"status": "Suppressed Asin Changed", **LIVE_FIELDS},
+        ),
+    ]
+
+
+def load_corpus(directory) -> list:
+    """Recorded pages: ``golden.json`` maps each page name to its ``asin``,
+    ``file`` (relative to ``directory``) and ``expected`` fields or null."""
+    directory = Path(directory)
+    with open(directory / "golden.json", encoding="utf-8") as f:
+        index = json.load(f)
+    return [
+        CorpusPage(
+            name,
+            entry["asin"],
+            (directory / entry["file"]).read_text(encoding="utf-8"),
+            entry.get("expected"),
+        )
+        for name, entry in index.items()
+    ]
+
+
+def score(result, golden, base_url: str = "") -> Dict[str, bool]:
+    """Per-field match of ``result`` against ``golden``."""
+    if golden is None:
+        return {"result": result is None}
+    if result is None:
+        return {field: False for field in golden}
+    scores = {}
+    for field, expected in golden.items():
+        if isinstance(expected, str):
+            expected = expected.replace(BASE_URL_TOKEN, base_url)
+        actual = result.get(field)
+        try:
+            scores[field] = float(actual) == float(expected)
+        except (TypeError, ValueError):
+            scores[field] = str(actual) == str(expected)
+    return scores
@@ -0,0 +1,217 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.test.utils import override_settings
+
+from scraping.Audit.bowser_config import AmazonPageManager
+from scraping.Audit.browser_pool import BrowserPool
+from scraping.Audit.capture import ResponseCapture, allowed_urls, rules_for
+from scraping.Audit.http_fetcher import AmazonHttpFetcher
+from scraping.Audit.interception import RequestInterceptor, profile_for
+from scraping.Audit.scheduler import WorkQueueScheduler
+
+from .corpus import score
+from .server import CorpusServer
+
+BROWSER = "browser"
+HTML = "html"
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class ProcessTreeSampler:
+    """CPU time and resident memory of this process and its descendants (the
+    browsers), sampled from /proc every ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.25):
+        self.interval = interval
+        self.peak_rss = 0
+        self.cpu_start = None
+        self.cpu_end = None
+        self._task = None
+
+    @staticmethod
+    def _tree(pid: int) -> list:
+        pids, pending = [], [pid]
+        while pending:
+            current = pending.pop()
+            pids.append(current)
+            try:
+                for tid in os.listdir(f"/proc/{current}/task"):
+                    with open(f"/proc/{current}/task/{tid}/children") as f:
+                        pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return pids
+
+    def sample(self):
+        """Return ``(cpu_seconds, rss_bytes)`` summed over the process tree."""
+        cpu = rss = 0
+        for pid in self._tree(os.getpid()):
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                with open(f"/proc/{pid}/statm") as f:
+                    resident = int(f.read().split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            # utime and stime are fields 14 and 15, i.e. 11 and 12 after the name.
+            cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+            rss += resident * PAGE_SIZE
+        return cpu, rss
+
+    async def _run(self):
+        while True:
+            self.cpu_end, rss = self.sample()
+            self.peak_rss = max(self.peak_rss, rss)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self.cpu_start, self.peak_rss = self.sample()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.cpu_end, rss = self.sample()
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def stats(self) -> dict:
+        return {
+            "cpu_seconds": round(self.cpu_end - self.cpu_start, 2),
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1),
+        }
+
+
+def percentiles(samples) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    return {
+        "p50": round(pick(0.5), 3),
+        "p95": round(pick(0.95), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class ExtractionBenchmark:
+    """Runs the audit's extraction path over a page corpus served locally.
+
+    ``engine`` is ``"browser"`` (``AmazonPageManager._navigate`` in leased
+    pool contexts, exactly as an audit does) or ``"html"`` (the plain HTTP
+    fetcher and lxml parser). Every page is scraped ``repeat`` times by
+    ``concurrency`` slots; results are scored against the corpus goldens.
+    With ``capture`` the browser engine also reads the pages' JSON responses,
+    and the report shows where they disagreed with the DOM.
+    """
+
+    def __init__(self, pages, engine=BROWSER, repeat=3, concurrency=4, latency=0.0, extraction_mode=None, capture=False):
+        self.pages = pages
+        self.engine = engine
+        self.capture = ResponseCapture(rules_for("amazon")) if capture and engine == BROWSER else None
+        self.repeat = repeat
+        self.concurrency = concurrency
+        self.extraction_mode = extraction_mode or settings.AUDIT_EXTRACTION_MODE
+        self.server = CorpusServer(pages, latency=latency)
+        self.latencies: list = []
+        self.field_latency: dict = {}
+        self.field_scores: dict = {}
+        self.page_scores: dict = {}
+        self.mismatches: list = []
+
+    async def _scrape_browser(self, pool, interceptor, asin):
+        async with pool.lease(interceptor) as (context, context_settings):
+            page_manager = AmazonPageManager(context, context_settings, self.capture)
+            result = await page_manager._navigate(asin)
+            return result, page_manager.field_latency
+
+    async def _scrape_html(self, fetcher, asin):
+        result, _ = await fetcher.scrape(asin)
+        return result, {}
+
+    def _record(self, page, result, field_latency, elapsed):
+        self.latencies.append(elapsed)
+        for field, seconds in field_latency.items():
+            self.field_latency.setdefault(field, []).append(seconds)
+        for field, ok in score(result, page.golden, self.server.base_url).items():
+            counts = self.field_scores.setdefault(field, [0, 0])
+            counts[0] += ok
+            counts[1] += 1
+            page_counts = self.page_scores.setdefault(page.name, [0, 0])
+            page_counts[0] += ok
+            page_counts[1] += 1
+            if not ok and len(self.mismatches) < 50:
+                actual = None if result is None else result.get(field)
+                self.mismatches.append(f"{page.name}.{field}: got {actual!r}")
+
+    async def _run(self) -> dict:
+        pool = fetcher = None
+        if self.engine == BROWSER:
+            pool = BrowserPool.for_current_loop()
+            await pool.start()
+            interceptor = RequestInterceptor(
+                profile_for("amazon"),
+                allow=allowed_urls(self.capture.rules) if self.capture else (),
+            )
+            scrape = lambda asin: self._scrape_browser(pool, interceptor, asin)
+        else:
+            fetcher = AmazonHttpFetcher(base_url=self.server.base_url, limit=self.concurrency)
+            scrape = lambda asin: self._scrape_html(fetcher, asin)
+
+        async def handle(page):
+            started = time.monotonic()
+            result, field_latency = await scrape(page.asin)
+            self._record(page, result, field_latency, time.monotonic() - started)
+
+        sampler = ProcessTreeSampler()
+        sampler.start()
+        try:
+            scheduler = WorkQueueScheduler(handle, concurrency=self.concurrency)
+            stats = await scheduler.run(list(self.pages) * self.repeat)
+        finally:
+            await sampler.stop()
+            if pool is not None:
+                await pool.close()
+            if fetcher is not None:
+                await fetcher.close()
+
+        scored = [c for c in self.field_scores.values()]
+        correct, total = sum(c[0] for c in scored), sum(c[1] for c in scored)
+        return {
+            "engine": self.engine,
+            "extraction_mode": self.extraction_mode if self.engine == BROWSER else None,
+            "pages": len(self.latencies),
+            "failed": stats["failed"],
+            "elapsed": stats["elapsed"],
+            "pages_per_second": round(len(self.latencies) / stats["elapsed"], 2) if stats["elapsed"] else None,
+            "page_latency": percentiles(self.latencies),
+            "field_latency": {f: percentiles(s) for f, s in sorted(self.field_latency.items())},
+            **sampler.stats(),
+            "accuracy": round(correct / total, 4) if total else None,
+            "field_accuracy": {f: round(c[0] / c[1], 4) for f, c in sorted(self.field_scores.items())},
+            "page_accuracy": {p: round(c[0] / c[1], 4) for p, c in self.page_scores.items()},
+            "mismatches": self.mismatches,
+            "capture": self.capture.stats() if self.capture else None,
+        }
+
+    async def run(self) -> dict:
+        base_url = await self.server.start()
+        try:
+            # No human pacing and no archive: only extraction is measured.
+            # Identities start clean and their cookies are thrown away.
+            with tempfile.TemporaryDirectory() as identity_dir, override_settings(
+                AMAZON_BASE_URL=base_url,
+                AUDIT_HUMAN_DELAY=(0, 0),
+                AUDIT_HTTP_DELAY=(0, 0),
+                AUDIT_PAGE_ARCHIVE=False,
+                AUDIT_EXTRACTION_MODE=self.extraction_mode,
+                AUDIT_IDENTITY_DIR=identity_dir,
+            ):
+                return await self._run()
+        finally:
+            await self.server.stop()
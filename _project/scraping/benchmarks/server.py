@@ -0,0 +1,53 @@
+import asyncio
+
+from aiohttp import web
+
+from .corpus import BASE_URL_TOKEN
+
+
+class CorpusServer:
+    """Serves corpus pages at ``/dp/<asin>`` from 127.0.0.1 on a free port.
+
+    Everything else (images, captcha pictures) is answered with an empty 404
+    so that pages load completely without any outside request. ``latency``
+    seconds are added to every page response to stand in for the network.
+    """
+
+    def __init__(self, pages, latency: float = 0.0):
+        self.pages = {page.asin: page for page in pages}
+        self.latency = latency
+        self.base_url = None
+        self.requests = 0
+        self.runner = None
+
+    async def _product(self, request):
+        self.requests += 1
+        page = self.pages.get(request.match_info["asin"])
+        if page is None:
+            raise web.HTTPNotFound()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(
+            text=page.html.replace(BASE_URL_TOKEN, self.base_url),
+            content_type="text/html",
+        )
+
+    async def _missing(self, request):
+        return web.Response(status=404)
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_get("/dp/{asin}", self._product)
+        app.router.add_route("*", "/{tail:.*}", self._missing)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,287 @@
+import asyncio
+import functools
+import logging
+import math
+import random
+import selectors
+import tempfile
+import time
+import uuid
+
+import redis
+from django.contrib.auth.models import User
+from django.test.utils import override_settings
+
+from scraping.Audit.amazon_regular import empty_result
+from scraping.Audit.audit import AuditWorkers, RunAudit
+from scraping.Audit.limiter import BrowserLimiter
+
+from .harness import percentiles
+
+logger = logging.getLogger("scraping")
+
+
+class VirtualClockSelector:
+    """Wraps a real selector; when the loop would sleep until its next timer,
+    the virtual clock jumps there instead.
+
+    Real I/O (Redis replies, database threads finishing) is still polled for
+    ``idle_wait`` real seconds before each jump, so it is handled before
+    virtual time moves on.
+    """
+
+    def __init__(self, selector, loop, idle_wait: float):
+        self.selector = selector
+        self.loop = loop
+        self.idle_wait = idle_wait
+        self.jumps = 0
+
+    def select(self, timeout=None):
+        events = self.selector.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            # Nothing scheduled: only real I/O can wake the loop.
+            return self.selector.select(None)
+        events = self.selector.select(min(timeout, self.idle_wait))
+        if not events:
+            self.loop.virtual_now += timeout
+            self.jumps += 1
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """Event loop whose ``time()`` only advances when every task is waiting on a timer."""
+
+    def __init__(self, idle_wait: float = 0.0005):
+        self.virtual_now = 0.0
+        super().__init__(VirtualClockSelector(selectors.DefaultSelector(), self, idle_wait))
+
+    def time(self):
+        return self.virtual_now
+
+
+class FakePageLayer:
+    """Stands in for the browser: every page takes a log-normal time around
+    ``latency`` seconds and ends as a captcha, Rush Hour, Suppressed or Live
+    page with the configured probabilities."""
+
+    def __init__(
+        self,
+        latency: float = 8.0,
+        sigma: float = 0.5,
+        captcha_rate: float = 0.02,
+        rush_hour_rate: float = 0.01,
+        suppressed_rate: float = 0.05,
+        seed=None,
+    ):
+        self.mu = math.log(latency)
+        self.sigma = sigma
+        self.captcha_rate = captcha_rate
+        self.rush_hour_rate = rush_hour_rate
+        self.suppressed_rate = suppressed_rate
+        self.random = random.Random(seed)
+        self.outcomes: dict = {}
+
+    async def scrape(self, asin: str):
+        """Return ``(result, captcha_seen)`` like ``AmazonPageManager._navigate``."""
+        await asyncio.sleep(self.random.lognormvariate(self.mu, self.sigma))
+        draw = self.random.random()
+        if draw < self.captcha_rate:
+            outcome, result = "captcha", None
+        else:
+            draw -= self.captcha_rate
+            result = empty_result(asin)
+            if draw < self.rush_hour_rate:
+                outcome = result["status"] = "Rush Hour"
+            elif draw < self.rush_hour_rate + self.suppressed_rate:
+                outcome = "Suppressed"
+            else:
+                outcome = result["status"] = "Live"
+                result["title"] = f"Simulated product {asin}"
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        return result, result is None
+
+
+class SimulatedAuditWorkers(AuditWorkers):
+    """``AuditWorkers`` with the browser replaced by ``simulation.pages``.
+
+    Scheduling, retries, the Redis limiter, the write-behind saver and
+    progress reporting are the real ones; everything that measures time
+    reads the loop's virtual clock.
+    """
+
+    def __init__(self, *args, simulation, **kwargs):
+        self.clock = asyncio.get_running_loop().time
+        super().__init__(*args, adaptive=simulation.adaptive, clock=self.clock, **kwargs)
+        self.simulation = simulation
+        self.limiter = BrowserLimiter(
+            task_id=kwargs.get("task_id"),
+            max_browsers=simulation.slots,
+            namespace=simulation.namespace,
+        )
+
+    async def concurrency_bounds(self):
+        return self.simulation.min_slots, self.simulation.slots
+
+    async def scrape_product(self, product):
+        simulation = self.simulation
+        requested = self.clock()
+        if product not in simulation.started:
+            simulation.started.add(product)
+            simulation.queue_waits.append(requested - simulation.t0)
+        async with self.limiter.slot():
+            started = self.clock()
+            simulation.limiter_waits.append(started - requested)
+            result, captcha_seen = await simulation.pages.scrape(product)
+            return result, captcha_seen, self.clock() - started
+
+
+class SimulatedRunAudit(RunAudit):
+    def __init__(self, product_list_id, task_id, simulation):
+        super().__init__(product_list_id, task_id)
+        self.workers_class = functools.partial(SimulatedAuditWorkers, simulation=simulation)
+
+
+class AuditSimulation:
+    """Runs ``RunAudit`` over a throwaway list of ``products`` fake products on
+    a virtual clock and reports what the orchestration did.
+
+    The list, its products and the simulation user are deleted again when the
+    run ends, however it ends.
+    """
+
+    def __init__(self, products=10000, slots=200, min_slots=None, adaptive=False, pages=None, idle_wait=0.0005):
+        self.products = products
+        self.slots = slots
+        self.min_slots = min_slots or max(1, slots // 10)
+        self.adaptive = adaptive
+        self.pages = pages or FakePageLayer()
+        self.idle_wait = idle_wait
+        self.task_id = f"sim-{uuid.uuid4().hex[:12]}"
+        # Own slot pool, so a simulation never takes slots from real audits.
+        self.namespace = f"sim_browser_slots:{self.task_id}"
+        self.started: set = set()
+        self.queue_waits: list = []
+        self.limiter_waits: list = []
+        self.utilisation: list = []
+        self.t0 = 0.0
+
+    def _create_list(self):
+        from scraping.models import ProductInfo, ProductList
+
+        # Its own user, so deleting it takes nothing real along.
+        user = User.objects.create(username=f"audit_simulator_{self.task_id}")
+        product_list = ProductList.objects.create(user=user, name=f"simulation {self.task_id}", task_id=self.task_id)
+        ProductInfo.objects.bulk_create(
+            (
+                ProductInfo(user=user, product_list=product_list, product_id=f"SIM{i:08d}")
+                for i in range(self.products)
+            ),
+            batch_size=1000,
+        )
+        return product_list
+
+    def _cleanup(self, r):
+        # Cascades to the list, its products and anything the audit archived.
+        User.objects.filter(username=f"audit_simulator_{self.task_id}").delete()
+        try:
+            keys = [f"task:{self.task_id}", f"task_done:{self.task_id}"]
+            keys += list(r.scan_iter(f"{self.namespace}:*"))
+            r.delete(*keys)
+            r.srem("active_tasks", self.task_id)
+        except redis.RedisError as e:
+            logger.warning(f"could not clean up simulation {self.task_id} in Redis: {e}")
+
+    @staticmethod
+    def _redis_calls(r) -> dict:
+        """Calls per command so far, server-wide (other clients are counted too)."""
+        try:
+            commandstats = r.info("commandstats")
+        except redis.RedisError:
+            return {}
+        return {
+            name.removeprefix("cmdstat_"): stats["calls"]
+            for name, stats in commandstats.items()
+        }
+
+    async def _sample_utilisation(self, audit):
+        while True:
+            await asyncio.sleep(1)
+            if audit.workers is not None:
+                scheduler = audit.workers.scheduler
+                self.utilisation.append((scheduler.busy, scheduler.concurrency))
+
+    async def _run(self, product_list):
+        audit = SimulatedRunAudit(product_list.id, self.task_id, self)
+        sampler = asyncio.create_task(self._sample_utilisation(audit))
+        loop = asyncio.get_running_loop()
+        self.t0 = loop.time()
+        try:
+            result = await audit.run(reaudit=False, max_browsers=self.slots)
+        finally:
+            sampler.cancel()
+        return result, loop.time() - self.t0, audit.workers
+
+    def run(self) -> dict:
+        r = redis.Redis.from_url("redis://localhost:6379", decode_responses=True)
+        loop = VirtualClockLoop(self.idle_wait)
+        selector = loop._selector
+        real_started = time.perf_counter()
+        try:
+            product_list = self._create_list()
+            calls_before = self._redis_calls(r)
+            asyncio.set_event_loop(loop)
+            with tempfile.TemporaryDirectory() as journal_dir, override_settings(
+                AUDIT_HTTP_FIRST=False,
+                AUDIT_RESULT_CACHE=False,
+                AUDIT_PAGE_ARCHIVE=False,
+                AUDIT_JOURNAL_DIR=journal_dir,
+            ):
+                result, virtual_elapsed, workers = loop.run_until_complete(self._run(product_list))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            real_elapsed = time.perf_counter() - real_started
+            asyncio.set_event_loop(None)
+            loop.close()
+            calls_after = self._redis_calls(r)
+            self._cleanup(r)
+
+        redis_calls = {
+            name: calls - calls_before.get(name, 0)
+            for name, calls in calls_after.items()
+            if calls - calls_before.get(name, 0) > 0
+        }
+        redis_total = sum(redis_calls.values())
+        stats = result["scheduler"]
+        persistence = stats.get("persistence", {})
+        busy = sum(b for b, _ in self.utilisation)
+        capacity = sum(c for _, c in self.utilisation)
+        return {
+            "products": self.products,
+            "virtual_seconds": round(virtual_elapsed, 1),
+            "real_seconds": round(real_elapsed, 1),
+            "speedup": round(virtual_elapsed / real_elapsed, 1) if real_elapsed else None,
+            "products_per_virtual_second": round(self.products / virtual_elapsed, 2) if virtual_elapsed else None,
+            "queue_wait": percentiles(self.queue_waits),
+            "limiter_wait": percentiles(self.limiter_waits),
+            "slot_utilisation": round(busy / capacity, 3) if capacity else None,
+            "mean_slots": round(capacity / len(self.utilisation), 1) if self.utilisation else None,
+            "outcomes": dict(self.pages.outcomes),
+            "retries": stats.get("retries"),
+            "concurrency": stats.get("concurrency"),
+            "db_flushes": persistence.get("flushes"),
+            "db_flushes_per_virtual_minute": (
+                round(persistence["flushes"] / virtual_elapsed * 60, 2)
+                if virtual_elapsed and persistence.get("flushes") is not None
+                else None
+            ),
+            "persistence": persistence,
+            "redis_ops": redis_total,
+            "redis_ops_per_product": round(redis_total / self.products, 2),
+            "redis_top_commands": dict(sorted(redis_calls.items(), key=lambda c: -c[1])[:8]),
+            "clock_jumps": selector.jumps,
+        }
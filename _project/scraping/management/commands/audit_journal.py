@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scraping.Audit.journal import journal_product_list, read_journal
+from scraping.Audit.persistence import ResultSaver
+from scraping.models import ProductList
+
+
+class Command(BaseCommand):
+    help = "Print the journal of an audit task, or replay it into the product list's results."
+
+    def add_arguments(self, parser):
+        parser.add_argument("task_id")
+        parser.add_argument(
+            "--replay",
+            action="store_true",
+            help="Upsert the journalled results into the product list audited by the task.",
+        )
+
+    def handle(self, *args, **options):
+        task_id = options["task_id"]
+        if not options["replay"]:
+            for record in read_journal(task_id):
+                self.stdout.write(json.dumps(record, default=str))
+            return
+
+        product_list_id = journal_product_list(task_id)
+        if product_list_id is None:
+            raise CommandError(f"the journal of task {task_id} has no readable header")
+        product_list = ProductList.objects.select_related("user").filter(id=product_list_id).first()
+        if product_list is None:
+            raise CommandError(f"product list {product_list_id} of task {task_id} no longer exists")
+
+        # Later rows win, as they did when the audit saved them.
+        latest = {}
+        for record in read_journal(task_id):
+            latest[record.get("asin")] = record
+
+        async def replay():
+            saver = ResultSaver(product_list, product_list.user)
+            for record in latest.values():
+                await saver.add_result(record)
+            await saver.close()
+            return saver.stats()
+
+        stats = asyncio.run(replay())
+        self.stdout.write(f"replayed {stats['rows_written']} results into {product_list}")
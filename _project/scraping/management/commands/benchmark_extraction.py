@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand
+
+from scraping.benchmarks.corpus import build_corpus, load_corpus
+from scraping.benchmarks.harness import BROWSER, HTML, ExtractionBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure extraction speed and accuracy offline: serve a corpus of /dp/ pages "
+        "from 127.0.0.1 and scrape them the way an audit does."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--engine", choices=[BROWSER, HTML], default=BROWSER)
+        parser.add_argument(
+            "--corpus",
+            help="Directory of recorded pages with a golden.json (default: the built-in synthetic corpus).",
+        )
+        parser.add_argument("--repeat", type=int, default=3, help="Times every page is scraped.")
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every page response.")
+        parser.add_argument("--extraction-mode", choices=["evaluate", "locators"], default=None)
+        parser.add_argument(
+            "--capture",
+            action="store_true",
+            help="Also read fields from the pages' JSON responses and report disagreements with the DOM.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        pages = load_corpus(options["corpus"]) if options["corpus"] else build_corpus()
+        benchmark = ExtractionBenchmark(
+            pages,
+            engine=options["engine"],
+            repeat=options["repeat"],
+            concurrency=options["concurrency"],
+            latency=options["latency"],
+            extraction_mode=options["extraction_mode"],
+            capture=options["capture"],
+        )
+        report = asyncio.run(benchmark.run())
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        mode = f" ({report['extraction_mode']})" if report["extraction_mode"] else ""
+        self.stdout.write(
+            f"{report['engine']}{mode}: {report['pages']} pages in {report['elapsed']}s, "
+            f"{report['pages_per_second']} pages/s, page latency {report['page_latency']}"
+        )
+        self.stdout.write(f"cpu {report['cpu_seconds']}s, peak rss {report['peak_rss_mb']} MiB")
+        for field, latency in report["field_latency"].items():
+            self.stdout.write(f"  {field:<18} {latency}")
+        self.stdout.write(f"accuracy {report['accuracy']}")
+        for field, accuracy in report["field_accuracy"].items():
+            if accuracy < 1:
+                self.stdout.write(f"  {field:<18} {accuracy}")
+        for mismatch in report["mismatches"]:
+            self.stdout.write(f"  mismatch {mismatch}")
+        if report["capture"]:
+            self.stdout.write(f"capture {report['capture']}")
@@ -0,0 +1,73 @@
+import asyncio
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from scraping.Audit.amazon_regular import empty_result
+from scraping.Audit.persistence import ResultSaver
+from scraping.models import ProductList
+
+
+def synthetic_result(i: int) -> dict:
+    result = empty_result(f"BENCH{i:08d}")
+    result.update(
+        {
+            "status": "Live",
+            "title": f"Benchmark product {i} with a reasonably long title",
+            "reviews": "4.2",
+            "ratings": str(i % 5000),
+            "brand_name": "Acme",
+            "browse_node": "Home & Kitchen > Kitchen & Dining > Cookware",
+            "price": "1299.",
+            "MRP": 1999.0,
+            "availability": "In stock",
+            "bestSellerRank": "#1,234 in Home & Kitchen, #12 in Cookware",
+        }
+    )
+    return result
+
+
+class Command(BaseCommand):
+    help = "Compare the ORM and raw SQL result upsert paths on a throwaway product list."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--modes", default="orm,sql")
+
+    async def _save(self, saver, results):
+        for result in results:
+            await saver.add_result(result)
+        await saver.close()
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        results = [synthetic_result(i) for i in range(rows)]
+        user, _ = User.objects.get_or_create(username="result_saver_benchmark")
+
+        for mode in options["modes"].split(","):
+            product_list = ProductList.objects.create(user=user, name=f"benchmark {mode}")
+            try:
+                # First pass inserts every row, the second one hits ON CONFLICT.
+                for phase in ("insert", "update"):
+                    saver = ResultSaver(
+                        product_list, user, batch_size=options["batch_size"], mode=mode
+                    )
+                    tracemalloc.start()
+                    started_cpu = time.process_time()
+                    started = time.perf_counter()
+                    asyncio.run(self._save(saver, results))
+                    elapsed = time.perf_counter() - started
+                    cpu = time.process_time() - started_cpu
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    stats = saver.stats()
+                    self.stdout.write(
+                        f"{mode:>4} {phase:<6} {stats['rows_written']} rows in {elapsed:.2f}s "
+                        f"({stats['rows_written'] / elapsed:,.0f} rows/s, cpu {cpu:.2f}s, "
+                        f"peak {peak / 2**20:.1f} MiB, avg flush {stats['avg_flush_latency']}s)"
+                    )
+            finally:
+                product_list.delete()
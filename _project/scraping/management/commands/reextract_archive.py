@@ -0,0 +1,73 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scraping.Audit.archive import prune_archive, reextract
+from scraping.Audit.persistence import ResultSaver
+from scraping.models import ArchivedPage
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the current extractors over the pages archived by an audit task and "
+        "update the product list's results, without fetching anything."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("task_id", nargs="?")
+        parser.add_argument("--asin", action="append", help="Only these products (repeatable).")
+        parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count).")
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the re-extracted results instead of saving them.",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Only shrink the archive to AUDIT_ARCHIVE_MAX_BYTES.",
+        )
+
+    def handle(self, *args, **options):
+        if options["prune"]:
+            self.stdout.write(f"pruned {prune_archive()} archived pages")
+            return
+
+        task_id = options["task_id"]
+        if not task_id:
+            raise CommandError("a task_id is required")
+        pages = ArchivedPage.objects.filter(task_id=task_id, platform="amazon").select_related(
+            "product_list__user"
+        )
+        if options["asin"]:
+            pages = pages.filter(product_id__in=options["asin"])
+        pages = list(pages)
+        if not pages:
+            raise CommandError(f"no archived pages for task {task_id}")
+
+        product_list = pages[0].product_list
+
+        results, skipped = [], {}
+        for asin, result, reason in reextract(pages, workers=options["workers"]):
+            if result is None:
+                skipped[reason] = skipped.get(reason, 0) + 1
+            elif options["dry_run"]:
+                self.stdout.write(f"{asin}: {result}")
+            else:
+                results.append(result)
+
+        if results:
+            async def save():
+                saver = ResultSaver(product_list, product_list.user)
+                for result in results:
+                    await saver.add_result(result)
+                await saver.close()
+                return saver.stats()
+
+            stats = asyncio.run(save())
+            self.stdout.write(
+                f"re-extracted {len(results)} pages into {product_list} "
+                f"({stats['rows_unchanged']} unchanged)"
+            )
+        if skipped:
+            self.stdout.write(f"skipped: {skipped}")
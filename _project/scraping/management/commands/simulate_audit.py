@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from scraping.benchmarks.simulator import AuditSimulation, FakePageLayer
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a whole audit against fake product pages on a virtual clock, to load-test "
+        "scheduling, the Redis slot limiter, the result writer and progress reporting."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=10000)
+        parser.add_argument("--slots", type=int, default=200, help="Browser slots (and the fleet-wide limit).")
+        parser.add_argument("--min-slots", type=int, default=None)
+        parser.add_argument("--adaptive", action="store_true", help="Let the AIMD controller resize the slots.")
+        parser.add_argument("--latency", type=float, default=8.0, help="Median seconds per page.")
+        parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of page latency.")
+        parser.add_argument("--captcha-rate", type=float, default=0.02)
+        parser.add_argument("--rush-hour-rate", type=float, default=0.01)
+        parser.add_argument("--suppressed-rate", type=float, default=0.05)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument(
+            "--idle-wait",
+            type=float,
+            default=0.0005,
+            help="Real seconds to poll for Redis/database I/O before the virtual clock jumps.",
+        )
+
+    def handle(self, *args, **options):
+        pages = FakePageLayer(
+            latency=options["latency"],
+            sigma=options["latency_sigma"],
+            captcha_rate=options["captcha_rate"],
+            rush_hour_rate=options["rush_hour_rate"],
+            suppressed_rate=options["suppressed_rate"],
+            seed=options["seed"],
+        )
+        simulation = AuditSimulation(
+            products=options["products"],
+            slots=options["slots"],
+            min_slots=options["min_slots"],
+            adaptive=options["adaptive"],
+            pages=pages,
+            idle_wait=options["idle_wait"],
+        )
+        self.stdout.write(json.dumps(simulation.run(), indent=2, default=str))
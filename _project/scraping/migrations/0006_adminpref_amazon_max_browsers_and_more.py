@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraping", "0005_rename_is_audit_runnning_productlist_is_audit_running"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="adminpref",
+            name="amazon_max_browsers",
+            field=models.IntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name="adminpref",
+            name="amazon_min_browsers",
+            field=models.IntegerField(default=2),
+        ),
+        migrations.AddField(
+            model_name="adminpref",
+            name="flipkart_max_browsers",
+            field=models.IntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name="adminpref",
+            name="flipkart_min_browsers",
+            field=models.IntegerField(default=2),
+        ),
+        migrations.AddField(
+            model_name="adminpref",
+            name="myntra_max_browsers",
+            field=models.IntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name="adminpref",
+            name="myntra_min_browsers",
+            field=models.IntegerField(default=2),
+        ),
+    ]
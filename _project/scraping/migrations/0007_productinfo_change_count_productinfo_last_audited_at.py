@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraping", "0006_adminpref_amazon_max_browsers_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productinfo",
+            name="change_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="productinfo",
+            name="last_audited_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
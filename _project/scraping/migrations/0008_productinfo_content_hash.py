@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraping", "0007_productinfo_change_count_productinfo_last_audited_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productinfo",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=32),
+        ),
+    ]
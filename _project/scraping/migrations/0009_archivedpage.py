@@ -0,0 +1,45 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraping", "0008_productinfo_content_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedPage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("task_id", models.CharField(db_index=True, max_length=100)),
+                (
+                    "product_list",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_pages",
+                        to="scraping.productlist",
+                    ),
+                ),
+                ("platform", models.CharField(default="amazon", max_length=100)),
+                ("product_id", models.CharField(db_index=True, max_length=100)),
+                ("content_hash", models.CharField(db_index=True, max_length=32)),
+                ("url", models.CharField(blank=True, default="", max_length=500)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "unique_together": {("task_id", "product_id")},
+            },
+        ),
+    ]
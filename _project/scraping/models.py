@@ -70,6 +70,12 @@ class ProductInfo(models.Model):
     a_plus = models.CharField(max_length=100, default="default_value", null=True)
     store_link = models.CharField(max_length=500, default="default_value", null=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set only when an audit saves a result (updated_at also moves on uploads
+    # and edits); drives incremental audits together with change_count.
+    last_audited_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    change_count = models.PositiveIntegerField(default=0)
+    # Fingerprint of the audited values, so unchanged results are not rewritten.
+    content_hash = models.CharField(max_length=32, blank=True, default="")
 
     class Meta:
         unique_together = ("product_list", "product_id")
@@ -78,6 +84,27 @@ class ProductInfo(models.Model):
         return f"{self.product_id} ({self.product_list.name})"
 
 
+class ArchivedPage(models.Model):
+    """Index of the raw pages kept by the page archive (see Audit/archive.py)."""
+    task_id = models.CharField(max_length=100, db_index=True)
+    # The list the task audited; its task_id moves on with every new audit.
+    product_list = models.ForeignKey(
+        ProductList, on_delete=models.CASCADE, related_name="archived_pages"
+    )
+    platform = models.CharField(max_length=100, default="amazon")
+    product_id = models.CharField(max_length=100, db_index=True)
+    # Name of the compressed blob; pages with identical HTML share one.
+    content_hash = models.CharField(max_length=32, db_index=True)
+    url = models.CharField(max_length=500, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("task_id", "product_id")
+
+    def __str__(self):
+        return f"{self.product_id} ({self.task_id})"
+
+
 class UserPref(models.Model):
     user = models.OneToOneField(
         User, on_delete=models.CASCADE, related_name="user_preferences"
@@ -99,6 +126,13 @@ class AdminPref(models.Model):
     preferred_filetype = models.CharField(max_length=100, default=".xlsx")
     concurrent_amazon_users = models.IntegerField(default=5)
     audit_batches_per_user = models.IntegerField(default=5)
+    # Bounds for the adaptive browser concurrency of a single audit
+    amazon_min_browsers = models.IntegerField(default=2)
+    amazon_max_browsers = models.IntegerField(default=20)
+    flipkart_min_browsers = models.IntegerField(default=2)
+    flipkart_max_browsers = models.IntegerField(default=20)
+    myntra_min_browsers = models.IntegerField(default=2)
+    myntra_max_browsers = models.IntegerField(default=20)
 
     def __str__(self):
         return f"{self.user.username}'s Preferences"
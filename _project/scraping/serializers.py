@@ -1,4 +1,4 @@
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import BooleanField, ModelSerializer, Serializer
 from .models import ProductList, ProductInfo
 
 
@@ -14,3 +14,13 @@ class ProductInfoSerializer(ModelSerializer):
         model = ProductInfo
         fields = "__all__"
         read_only_fields = ["created_at", "updated_at"]
+
+
+class RunAuditOptionsSerializer(Serializer):
+    """The flags of a run_audit request; "false", "0" and "off" are False."""
+    reAudit = BooleanField(required=False, default=False)
+    # Only products not audited within AUDIT_FRESHNESS_HOURS.
+    incremental = BooleanField(required=False, default=False)
+    resume = BooleanField(required=False, default=False)
+    # Unset: shard lists larger than AUDIT_SHARD_THRESHOLD.
+    sharded = BooleanField(required=False, allow_null=True, default=None)
@@ -1,18 +1,65 @@
 import asyncio
-from celery import shared_task
+from celery import chord, group, shared_task
+from celery.signals import worker_process_shutdown
+from django.conf import settings
 from .models import ProductList
 from .Audit.audit import RunAudit
+from .Audit.browser_pool import BrowserPool
+from .Audit.captcha import CaptchaService
+from .Audit.http_fetcher import AmazonHttpFetcher
+from .Audit.identity import IdentityPool
+from .Audit.utils import TaskProgress
 
-@shared_task(bind=True)
-def run_audit_task(self, productlist_id, reaudit=False):
+# One event loop per worker process, so the browser pool bound to it stays warm
+# across audit tasks instead of being torn down by asyncio.run() every time.
+_worker_loop = None
+
+
+def run_in_worker_loop(coro):
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_worker_loop)
+    return _worker_loop.run_until_complete(coro)
+
+
+@worker_process_shutdown.connect
+def close_browser_pool(**kwargs):
+    CaptchaService.shutdown_pool()
+    if _worker_loop is None or _worker_loop.is_closed():
+        return
+    pool = BrowserPool._pools.get(_worker_loop)
+    if pool:
+        _worker_loop.run_until_complete(pool.close())
+    fetcher = AmazonHttpFetcher._fetchers.get(_worker_loop)
+    if fetcher:
+        _worker_loop.run_until_complete(fetcher.close())
+    captcha = CaptchaService._services.get(_worker_loop)
+    if captcha:
+        _worker_loop.run_until_complete(captcha.close())
+    identities = IdentityPool._pools.get(_worker_loop)
+    if identities:
+        _worker_loop.run_until_complete(identities.close())
+    _worker_loop.close()
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def run_audit_task(self, productlist_id, reaudit=False, resume_task_id=None, incremental=False):
     print(f"Running audit task for product list ID: {productlist_id}")
-    task_id = self.request.id
+    task_id = resume_task_id or self.request.id
+    # A task redelivered after its worker died picks up its own checkpoint.
+    redelivered = bool((self.request.delivery_info or {}).get("redelivered"))
+    resume = bool(resume_task_id) or (
+        redelivered and TaskProgress(task_id).exists()
+    )
 
     audit = RunAudit(productlist_id, task_id)
+    if resume:
+        ProductList.objects.filter(id=productlist_id).update(is_audit_running=True)
 
     try:
-        result = asyncio.run(
-            audit.run(max_browsers=10, batch_size=1, reaudit=reaudit)
+        result = run_in_worker_loop(
+            audit.run(max_browsers=10, reaudit=reaudit, resume=resume, incremental=incremental)
         )
 
         if result:
@@ -33,3 +80,91 @@ def run_audit_task(self, productlist_id, reaudit=False):
             is_audit_running=False
         )
 
+
+# === Sharded Audit ===
+@shared_task(bind=True)
+def run_sharded_audit_task(self, productlist_id, reaudit=False, shard_size=None, incremental=False):
+    """Split one list into shard subtasks that any free worker can pick up.
+
+    Every shard reports into this task's progress; ``finalize_sharded_audit``
+    runs once all of them have returned.
+    """
+    parent_task_id = self.request.id
+    shard_size = shard_size or settings.AUDIT_SHARD_SIZE
+    audit = RunAudit(productlist_id, parent_task_id)
+
+    try:
+        run_in_worker_loop(audit.load_product_list())
+        product_ids = run_in_worker_loop(audit.get_product_infos(reaudit, incremental))
+        if not product_ids:
+            ProductList.objects.filter(id=productlist_id).update(is_audit_running=False)
+            return {"status": "error", "message": "No products found in this list"}
+
+        shards = [
+            product_ids[i:i + shard_size] for i in range(0, len(product_ids), shard_size)
+        ]
+        progress = TaskProgress(parent_task_id)
+        progress.init_task(
+            total=len(product_ids), user_id=audit.product_list.user_id, product_list_id=productlist_id
+        )
+
+        header = group(
+            run_audit_shard_task.s(productlist_id, shard, parent_task_id, index)
+            for index, shard in enumerate(shards)
+        )
+        result = chord(header)(finalize_sharded_audit.s(productlist_id, parent_task_id))
+        progress.set_shards([r.id for r in result.parent.results])
+
+        return {"status": "dispatched", "shards": len(shards), "total": len(product_ids)}
+
+    except Exception as e:
+        ProductList.objects.filter(id=productlist_id).update(is_audit_running=False)
+        if isinstance(e, ProductList.DoesNotExist):
+            return {"status": "error", "message": f"ProductList {productlist_id} not found"}
+        return {"status": "error", "message": str(e)}
+
+
+@shared_task(bind=True, acks_late=True)
+def run_audit_shard_task(self, productlist_id, product_ids, parent_task_id, shard_index):
+    audit = RunAudit(productlist_id, parent_task_id)
+    try:
+        result = run_in_worker_loop(
+            audit.run(
+                max_browsers=settings.AUDIT_SHARD_BROWSERS,
+                reaudit=False,
+                product_ids=product_ids,
+                shard=True,
+                # A redelivered shard skips what it committed before the crash.
+                resume=bool((self.request.delivery_info or {}).get("redelivered")),
+            )
+        )
+    except Exception as e:
+        # Never fail the chord: the finalizer reports the broken shard instead.
+        result = {"status": "error", "message": str(e)}
+
+    result.update(
+        {"shard": shard_index, "size": len(product_ids), "worker": self.request.hostname}
+    )
+    return result
+
+
+@shared_task
+def finalize_sharded_audit(shard_results, productlist_id, parent_task_id):
+    processed = sum(r.get("processed_count", 0) for r in shard_results)
+    failed = [r["shard"] for r in shard_results if r.get("status") != "success"]
+
+    progress = TaskProgress(parent_task_id)
+    # Shards have been incrementing the count all along; never move it back.
+    if processed > progress.get_progress()["count"]:
+        progress.set_count(processed)
+    progress.set_status("failed" if len(failed) == len(shard_results) else "done")
+
+    ProductList.objects.filter(id=productlist_id).update(
+        is_audited_once=True, is_audit_running=False
+    )
+    return {
+        "status": "success" if not failed else "partial",
+        "processed_count": processed,
+        "failed_shards": failed,
+        "shards": sorted(shard_results, key=lambda r: r["shard"]),
+    }
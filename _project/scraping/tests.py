@@ -1,3 +1,861 @@
-from django.test import TestCase
+import asyncio
+import heapq
+import json
+import multiprocessing
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import aioredis
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from scraping.Audit.audit import AuditWorkers
+from scraping.Audit.amazon_regular import LOCATOR_FIELDS
+from scraping.Audit.captcha import CaptchaService
+from scraping.Audit.concurrency import AIMDController, OK
+from scraping.Audit.deadline import FieldTimings
+from scraping.Audit.http_fetcher import AmazonHttpFetcher
+from scraping.Audit.interception import DOM_ONLY, FULL, RequestInterceptor
+from scraping.Audit.journal import AuditJournal
+from scraping.Audit.retry import NAVIGATION, RetryQueue
+from scraping.Audit.scheduler import WorkQueueScheduler
+from scraping.Audit.identity import IdentityPool
+from scraping import views
+from scraping.benchmarks.simulator import AuditSimulation
+from scraping.tasks import finalize_sharded_audit
+from scraping.Audit.persistence import ResultSaver, result_row, row_result
+from scraping.Audit.capture import (
+    CAPTURE_RULES, ResponseCapture, allowed_urls, fill_gaps, json_payloads, offer_fields, twister_fields,
+)
+
+
+def _fake_solve(data):
+    return "XKCDQZ"
+
+
+def _solve_in_daemon(queue, stdlib_pool):
+    async def run():
+        CaptchaService._executor = None
+        CaptchaService._threads_only = False
+        service = CaptchaService(workers=1, cache_size=10, timeout=5)
+
+        async def fetch(src):
+            return b"captcha image"
+
+        service.fetch = fetch
+        with mock.patch("scraping.Audit.captcha.solve_image", _fake_solve):
+            solution = await service.solve("captcha.jpg")
+        queue.put((solution, CaptchaService._threads_only))
+        CaptchaService.shutdown_pool()
+
+    if stdlib_pool:
+        # multiprocessing refuses to fork from a daemon on the first submit.
+        context = multiprocessing.get_context("fork")
+        with mock.patch("scraping.Audit.captcha.billiard.get_context", return_value=context):
+            asyncio.run(run())
+    else:
+        asyncio.run(run())
+
+
+class CaptchaServiceTests(SimpleTestCase):
+    def _run_in_daemon(self, stdlib_pool):
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_solve_in_daemon, args=(queue, stdlib_pool), daemon=True)
+        process.start()
+        try:
+            return queue.get(timeout=30)
+        finally:
+            process.join(timeout=5)
+
+    def test_daemonic_process_solves_in_a_process_pool(self):
+        self.assertEqual(self._run_in_daemon(stdlib_pool=False), ("XKCDQZ", False))
+
+    def test_failed_pool_submit_falls_back_to_threads(self):
+        self.assertEqual(self._run_in_daemon(stdlib_pool=True), ("XKCDQZ", True))
+
+    def test_rejected_solution_is_not_a_success(self):
+        class Element:
+            async def get_attribute(self, name):
+                return "captcha.jpg"
+
+            async def click(self):
+                pass
+
+            async def type(self, text, delay):
+                pass
+
+        class Page:
+            def __init__(self, captcha_after_submit):
+                self.captcha_after_submit = captcha_after_submit
+                self.submitted = False
+
+            async def query_selector(self, selector):
+                if selector == 'button[type="submit"]':
+                    self.submitted = True
+                if selector == "#captchacharacters" and self.submitted and not self.captcha_after_submit:
+                    return None
+                return Element()
+
+            async def wait_for_load_state(self, state, timeout):
+                pass
+
+        async def run():
+            service = CaptchaService(workers=1, cache_size=10, timeout=5)
+            service._solve_image = mock.AsyncMock(return_value="XKCDQZ")
+            service.fetch = mock.AsyncMock(return_value=b"captcha image")
+            rejected = await service.solve_page(Page(captcha_after_submit=True))
+            cached_after_rejection = dict(service.solutions)
+            accepted = await service.solve_page(Page(captcha_after_submit=False))
+            return rejected, cached_after_rejection, accepted, service.stats()
+
+        rejected, cached, accepted, stats = asyncio.run(run())
+        self.assertEqual((rejected, cached, accepted), (False, {}, True))
+        self.assertEqual((stats["solved"], stats["accepted"], stats["rejected"]), (2, 1, 1))
+        self.assertEqual(stats["success_rate"], 0.5)
+
+
+class CaptureParsingTests(SimpleTestCase):
+    def test_json_payloads_reads_chunked_streams(self):
+        body = b'&&&{"a": 1}&&&not json&&&{"b": [2]}&&&'
+        self.assertEqual(json_payloads(body), [{"a": 1}, {"b": [2]}])
+        self.assertEqual(json_payloads(b'{"a": 1}'), [{"a": 1}])
+
+    def test_offer_fields_only_reads_the_audited_asin(self):
+        payload = {
+            "sponsored": [{"asin": "B0OTHER", "priceAmount": 99.0, "availability": "Only 1 left"}],
+            "desktop_buybox_group_1": [
+                {"asin": "B0AUDIT", "priceAmount": 1299.0, "basisPrice": {"amount": 1999}},
+            ],
+            "availability": "In stock",
+        }
+        fields = offer_fields(json_payloads(json.dumps(payload).encode()), "B0AUDIT")
+        self.assertEqual(fields, {"price": "1299.", "MRP": 1999.0})
+        self.assertEqual(offer_fields([payload], "B0MISSING"), {})
+
+    def test_twister_fields_need_the_audited_asin(self):
+        family = {"dimensionToAsinMap": {"0": "B0AUDIT", "1": "B0RED"}}
+        self.assertEqual(twister_fields([family], "B0AUDIT"), {"variations": "Available"})
+        self.assertEqual(twister_fields([family], "B0ACCESSORY"), {})
+
+    def test_dom_values_win_over_captured_ones(self):
+        fields = {"price": "1299.", "MRP": 0, "availability": "N/A"}
+        captured = {"price": "99.", "MRP": 1999.0, "availability": "In stock"}
+        merged, mismatches = fill_gaps(fields, captured)
+        self.assertEqual(merged, {"price": "1299.", "MRP": 1999.0, "availability": "In stock"})
+        self.assertEqual(mismatches, ["price"])
+
+    def test_dom_only_profile_lets_the_capture_endpoints_through(self):
+        interceptor = RequestInterceptor(DOM_ONLY, allow=allowed_urls(CAPTURE_RULES["amazon"]))
+        self.assertFalse(interceptor.should_block("xhr", "https://www.amazon.in/gp/twister/ajaxv2?asin=B0A"))
+        self.assertTrue(interceptor.should_block("xhr", "https://www.amazon.in/gp/product/ajax/ppd/dpx?asin=B0A"))
+        self.assertTrue(interceptor.should_block("image", "https://m.media-amazon.com/images/I/1.jpg"))
+
+    def test_trusted_fields_skip_their_probes(self):
+        from scraping.Audit.amazon_regular import AmazonScrapingLogic
+
+        capture = ResponseCapture(CAPTURE_RULES["amazon"], trusted=("price",))
+        logic = AmazonScrapingLogic.__new__(AmazonScrapingLogic)
+        logic.field_latency = {}
+        probed = []
+
+        def probe(field):
+            async def run():
+                probed.append(field)
+                return "N/A"
+            return run
+
+        with mock.patch.multiple(logic, **{method: probe(field) for field, method in LOCATOR_FIELDS}, create=True):
+            fields = asyncio.run(logic._extract_with_locators(skip=capture.trusted_fields({"price": "99.", "MRP": 1.0})))
+        self.assertNotIn("price", probed)
+        self.assertNotIn("price", fields)
+        self.assertIn("MRP", probed)
+
+    def test_rules_do_not_match_other_ajax_widgets(self):
+        twister, offers = CAPTURE_RULES["amazon"]
+        for url in (
+            "https://www.amazon.in/gp/product/ajax/aodAjaxMain?asin=B0AUDIT",
+            "https://www.amazon.in/gp/product/ajax/ppd/dpx?asin=B0AUDIT",
+        ):
+            self.assertFalse(twister.url_pattern.search(url))
+            self.assertFalse(offers.url_pattern.search(url))
+        self.assertTrue(twister.url_pattern.search("https://www.amazon.in/gp/twister/ajaxv2?asin=B0AUDIT"))
+        self.assertFalse(offers.url_pattern.search("https://www.amazon.in/gp/twister/ajaxv2?asin=B0AUDIT"))
+
+
+class ResultSaverUpsertTests(TestCase):
+    def setUp(self):
+        from scraping.models import ProductList
+
+        self.user = User.objects.create(username="auditor")
+        self.product_list = ProductList.objects.create(user=self.user, name="list")
+
+    def _result(self, **fields):
+        return {"asin": "B0TEST0001", "status": "Live", "title": "Kettle", "price": "1299.", "MRP": 1999.0, **fields}
+
+    def _save(self, mode, *results):
+        saver = ResultSaver(self.product_list, self.user, mode=mode)
+        for result in results:
+            saver._upsert([result_row(result)])
+
+    def _stored(self):
+        return self.product_list.products_list.get(product_id="B0TEST0001")
+
+    def test_placeholders_become_null(self):
+        for mode in ("sql", "orm"):
+            with self.subTest(mode=mode):
+                self._save(mode, self._result(price="N/A", reviews="N/A", ratings="N/A", MRP="N/A"))
+                stored = self._stored()
+                self.assertIsNone(stored.price)
+                self.assertIsNone(stored.mrp)
+                self.assertIsNone(stored.reviews)
+                stored.delete()
+
+    def test_change_count_and_unchanged_rows(self):
+        for mode in ("sql", "orm"):
+            with self.subTest(mode=mode):
+                self._save(mode, self._result(), self._result())
+                self.assertEqual(self._stored().change_count, 0)
+                self._save(mode, self._result(price="999."), self._result(price="999.", description="new copy"))
+                stored = self._stored()
+                self.assertEqual(stored.change_count, 1)
+                self.assertEqual(stored.price, 999.0)
+                self.assertEqual(stored.description, "new copy")
+                stored.delete()
+
+
+class ResultSaverFailureTests(SimpleTestCase):
+    def test_failed_batch_is_split_and_bad_rows_dead_lettered(self):
+        committed, dead = [], []
+        calls = []
+
+        def upsert(rows):
+            calls.append(len(rows))
+            if any(row.product_id == "B0BAD" for row in rows):
+                raise IntegrityError("rejected")
+            return 0
+
+        async def on_commit(ids):
+            committed.extend(ids)
+
+        async def run():
+            saver = ResultSaver(
+                product_list=SimpleNamespace(id=1),
+                user=SimpleNamespace(id=1),
+                batch_size=8,
+                flush_interval=0.01,
+                on_commit=on_commit,
+                dead_letter=dead.extend,
+                retries=2,
+                retry_delay=0,
+            )
+            saver._upsert = upsert
+            for asin in ["B0A", "B0B", "B0BAD", "B0C", "B0D"]:
+                await saver.add_result({"asin": asin, "status": "Live", "price": "10."})
+            await saver.close()
+            return saver.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(sorted(committed), ["B0A", "B0B", "B0C", "B0D"])
+        self.assertEqual([record["asin"] for record in dead], ["B0BAD"])
+        self.assertEqual(calls, [5, 2, 3, 1, 2])
+        self.assertEqual((stats["failed_rows"], stats["dead_lettered"], stats["write_retries"]), (1, 1, 0))
+
+    def test_database_failure_retries_the_whole_batch(self):
+        dead, calls = [], []
+
+        def upsert(rows):
+            calls.append(len(rows))
+            raise OperationalError("server closed the connection")
+
+        async def run():
+            saver = ResultSaver(
+                product_list=SimpleNamespace(id=1),
+                user=SimpleNamespace(id=1),
+                batch_size=8,
+                flush_interval=0.01,
+                dead_letter=dead.extend,
+                retries=2,
+                retry_delay=0,
+            )
+            saver._upsert = upsert
+            for asin in ["B0A", "B0B", "B0C"]:
+                await saver.add_result({"asin": asin, "status": "Live", "price": "10."})
+            await saver.close()
+            return saver.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(calls, [3, 3, 3])
+        self.assertEqual([record["asin"] for record in dead], ["B0A", "B0B", "B0C"])
+        self.assertEqual((stats["failed_rows"], stats["write_retries"]), (3, 2))
+
+    def test_row_result_round_trips(self):
+        result = {"asin": "B0A", "status": "Live", "price": "1,299.", "MRP": 1999.0, "A_plus": "Available", "bestSellerRank": "#1 in Home"}
+        row = result_row(result)
+        self.assertEqual(result_row(row_result(row)), row)
+
+
+class FakeRedis:
+    """The few Redis commands ``IdentityPool`` uses, shared like the real server."""
+
+    def __init__(self):
+        self.hashes: dict = {}
+        self.strings: dict = {}
+
+    def pipeline(self, transaction=True):
+        redis, results = self, []
+
+        class Pipeline:
+            def hincrby(self, key, field, amount):
+                fields = redis.hashes.setdefault(key, {})
+                fields[field] = fields.get(field, 0) + amount
+                results.append(fields[field])
+
+            def exists(self, key):
+                results.append(int(key in redis.strings))
+
+            async def execute(self):
+                return list(results)
+
+        return Pipeline()
+
+    async def set(self, key, value):
+        self.strings[key] = str(value)
+
+    async def mget(self, keys):
+        return [self.strings.get(key) for key in keys]
+
+
+class IdentityPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def _pool(self, redis=None, **kwargs):
+        pool = IdentityPool(size=2, directory=self.directory.name, min_pages=4, max_captcha_rate=0.25, **kwargs)
+
+        async def get_redis():
+            if redis is None:
+                raise aioredis.ConnectionError("no redis")
+            return redis
+
+        pool._get_redis = get_redis
+        return pool
+
+    def test_identity_retired_by_one_worker_leaves_every_pool(self):
+        async def run():
+            redis = FakeRedis()
+            first, second = self._pool(redis), self._pool(redis)
+            identity = await first.checkout()
+            await second.checkout()
+            for captcha_seen in (True, False, True, False):
+                await first.record(identity.name, captcha_seen)
+            self.assertNotIn(identity.name, first.identities)
+            # The other worker's copy still thinks it is healthy until its next page.
+            await second.record(identity.name, False)
+            self.assertNotIn(identity.name, second.identities)
+            self.assertEqual(redis.hashes[f"audit_identity:{identity.name}"], {"pages": 5, "captchas": 2})
+            # A fresh pool never hands out a retired identity.
+            fresh = self._pool(redis)
+            await fresh.checkout()
+            return first, second, fresh, identity
+
+        first, second, fresh, identity = asyncio.run(run())
+        self.assertEqual((first.retired, second.retired), (1, 1))
+        self.assertEqual(len(first.identities), 2)
+        self.assertNotIn(identity.name, fresh.identities)
+
+    def test_counts_locally_without_redis(self):
+        async def run():
+            pool = self._pool()
+            identity = await pool.checkout()
+            for _ in range(4):
+                await pool.record(identity.name, True)
+            return pool, identity
+
+        pool, identity = asyncio.run(run())
+        self.assertEqual(pool.retired, 1)
+        self.assertNotIn(identity.name, pool.identities)
+
+    def test_cookies_are_saved_periodically_and_on_close(self):
+        async def run():
+            pool = self._pool(save_interval=3600)
+            identity = await pool.checkout()
+            await pool.checkin(identity, {"cookies": [{"name": "session-id"}]})
+            saved_before_close = list(Path(self.directory.name).iterdir())
+            await pool.close()
+            return saved_before_close, identity
+
+        saved_before_close, identity = asyncio.run(run())
+        self.assertEqual(saved_before_close, [])
+        path = Path(self.directory.name) / f"{identity.name}.json"
+        self.assertEqual(json.loads(path.read_text()), {"cookies": [{"name": "session-id"}]})
+        reloaded = asyncio.run(self._pool().checkout())
+        self.assertEqual(reloaded.storage_state, {"cookies": [{"name": "session-id"}]})
+
+
+class PacingOrderTests(SimpleTestCase):
+    def test_identity_is_paced_before_taking_a_slot_and_a_context(self):
+        events = []
+
+        class Limiter:
+            @asynccontextmanager
+            async def slot(self):
+                events.append("slot")
+                yield
+
+        class Pool:
+            @asynccontextmanager
+            async def lease(self, interceptor, identity):
+                events.append(("lease", identity.name))
+                yield None, identity.context_settings()
+
+        class PageManager:
+            captcha_seen = False
+            snapshot = None
+
+            def __init__(self, context, context_settings, capture):
+                pass
+
+            async def _navigate(self, product):
+                events.append("navigate")
+                return {"asin": product}
+
+        class Pacer:
+            async def before_navigation(self, identity):
+                events.append(("pace", identity))
+
+        workers = AuditWorkers.__new__(AuditWorkers)
+        workers.http = workers.archive = workers.capture = workers.interceptor = None
+        workers.limiter, workers.pool = Limiter(), Pool()
+        with tempfile.TemporaryDirectory() as directory:
+            identities = IdentityPool(size=1, directory=directory)
+            identities._get_redis = mock.AsyncMock(side_effect=aioredis.ConnectionError("no redis"))
+            with mock.patch("scraping.Audit.audit.AmazonPageManager", PageManager), \
+                    mock.patch("scraping.Audit.audit.HumanPacer.for_current_loop", return_value=Pacer()), \
+                    mock.patch("scraping.Audit.audit.IdentityPool.for_current_loop", return_value=identities):
+                result, captcha_seen, _ = asyncio.run(workers.scrape_product("B0A"))
+
+        self.assertEqual((result, captcha_seen), ({"asin": "B0A"}, False))
+        self.assertEqual(events, [("pace", "in-0000"), "slot", ("lease", "in-0000"), "navigate"])
+        self.assertEqual(identities.identities["in-0000"].active, 0)
+
+
+class HttpFetcherTests(SimpleTestCase):
+    def _fetcher(self, status):
+        class Response:
+            url = "https://www.amazon.in/dp/B0A"
+
+            def __init__(self):
+                self.status = status
+
+            async def text(self, errors):
+                return "<html></html>"
+
+        class Session:
+            @asynccontextmanager
+            async def get(self, url):
+                events.append("get")
+                yield Response()
+
+        class Pacer:
+            async def before_navigation(self, identity):
+                events.append(("pace", identity))
+
+        events = []
+        fetcher = AmazonHttpFetcher(base_url="https://www.amazon.in", delay=(0, 0))
+        fetcher._get_session = Session
+        fetcher.pacer = Pacer()
+        return fetcher, events
+
+    def test_error_status_falls_back_to_the_browser(self):
+        fetcher, events = self._fetcher(503)
+        self.assertEqual(asyncio.run(fetcher.scrape("B0A")), (None, "http_503"))
+        self.assertEqual(fetcher.fallbacks, {"http_503": 1})
+        self.assertEqual(events, [("pace", "http"), "get"])
+
+
+class FieldTimingsTests(SimpleTestCase):
+    def test_loads_learned_timings_without_blocking_and_floors_status_fields(self):
+        redis = mock.MagicMock()
+        redis.hgetall = mock.AsyncMock(side_effect=[
+            {"status_card": "0.2", "title": "0.2"},
+            {"status_card:seen": "50", "status_card:present": "0", "title:seen": "50", "title:present": "0"},
+        ])
+
+        async def scan_iter(match):
+            yield "audit_field_presence:en_IN fashion"
+
+        redis.scan_iter = scan_iter
+        timings = FieldTimings()
+        timings.redis = redis
+        asyncio.run(timings.load())
+
+        self.assertEqual(timings.timeout("title"), 1.0)
+        self.assertEqual(timings.timeout("status_card"), 10)
+        self.assertTrue(timings.is_absent("en_IN fashion", "title"))
+        self.assertFalse(timings.is_absent("en_IN fashion", "status_card"))
+
+    def test_unsaved_presence_survives_a_failed_save(self):
+        timings = FieldTimings()
+        timings._get_redis = mock.AsyncMock(side_effect=aioredis.ConnectionError("no redis"))
+        timings.observe("default", "title", True, 0.5)
+        asyncio.run(timings.save())
+        self.assertEqual(timings.pending_presence, {("default", "title"): [1, 1]})
+
+
+class RunAuditViewTests(TestCase):
+    def setUp(self):
+        from scraping.models import ProductList
+
+        self.user = User.objects.create(username="auditor")
+        self.product_list = ProductList.objects.create(user=self.user, name="list", task_id="task-1")
+        self.other_list = ProductList.objects.create(user=self.user, name="other")
+        for patcher in (
+            mock.patch.object(views, "ping_celery", return_value=True),
+            mock.patch.object(views, "r"),
+            mock.patch.object(views, "TaskProgress"),
+            mock.patch.object(views, "run_audit_task"),
+            mock.patch.object(views, "run_sharded_audit_task"),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.progress = views.TaskProgress.return_value
+        self.progress.exists.return_value = True
+        self.progress.get_progress.return_value = {"user_id": self.user.id}
+        self.progress.get_product_list_id.return_value = self.product_list.id
+        views.run_audit_task.delay.return_value = SimpleNamespace(id="celery-2")
+
+    def _post(self, product_list, **data):
+        request = APIRequestFactory().post("/run_audit/", {"product_list_id": product_list.id, **data}, format="json")
+        force_authenticate(request, user=self.user)
+        return views.RunAudit.as_view()(request)
+
+    def _resume(self, product_list, **data):
+        return self._post(product_list, resume=True, **data)
+
+    def test_false_strings_are_false(self):
+        response = self._post(self.other_list, sharded="false", incremental="0", reAudit="off", resume="false")
+        self.assertEqual(response.status_code, 202)
+        views.run_sharded_audit_task.delay.assert_not_called()
+        views.run_audit_task.delay.assert_called_once_with(self.other_list.id, False, incremental=False)
+
+    def test_rejects_unparseable_flags(self):
+        self.assertEqual(self._post(self.other_list, sharded="maybe").status_code, 400)
+        views.run_audit_task.delay.assert_not_called()
+
+    def test_resumes_its_own_task(self):
+        self.assertEqual(self._resume(self.product_list).status_code, 202)
+        views.run_audit_task.delay.assert_called_once()
+
+    def test_rejects_a_running_list(self):
+        self.product_list.is_audit_running = True
+        self.product_list.save()
+        self.assertEqual(self._resume(self.product_list).status_code, 409)
+        views.run_audit_task.delay.assert_not_called()
+
+    def test_rejects_another_lists_task(self):
+        self.assertEqual(self._resume(self.other_list, task_id="task-1").status_code, 404)
+        self.progress.get_product_list_id.return_value = None
+        self.assertEqual(self._resume(self.other_list, task_id="task-1").status_code, 404)
+        views.run_audit_task.delay.assert_not_called()
+
+    def test_rejects_a_task_without_a_recorded_list(self):
+        self.progress.get_product_list_id.return_value = None
+        self.assertEqual(self._resume(self.product_list).status_code, 404)
+        views.run_audit_task.delay.assert_not_called()
+
+
+class FinalizeShardedAuditTests(TestCase):
+    def test_count_never_moves_backwards(self):
+        shard_results = [
+            {"shard": 0, "status": "success", "processed_count": 40},
+            {"shard": 1, "status": "success", "processed_count": 60},
+        ]
+        with mock.patch("scraping.tasks.TaskProgress") as progress_class:
+            progress = progress_class.return_value
+            progress.get_progress.return_value = {"count": 100}
+            result = finalize_sharded_audit(shard_results, 1, "parent")
+            progress.set_count.assert_not_called()
+            progress.get_progress.return_value = {"count": 90}
+            finalize_sharded_audit(shard_results, 1, "parent")
+            progress.set_count.assert_called_once_with(100)
+        self.assertEqual(result["processed_count"], 100)
+
+
+class ReplayTests(TransactionTestCase):
+    def test_replays_a_stopped_task_into_its_own_list(self):
+        from scraping.models import ProductList
+
+        user = User.objects.create(username="auditor")
+        product_list = ProductList.objects.create(user=user, name="list", task_id=None)
+        ProductList.objects.create(user=user, name="newer", task_id="task-2")
+        with tempfile.TemporaryDirectory() as directory, override_settings(AUDIT_JOURNAL_DIR=directory):
+            async def write():
+                journal = AuditJournal("task-1", product_list.id)
+                journal.write({"asin": "B0A", "status": "Live", "price": "10."})
+                await journal.close()
+
+            asyncio.run(write())
+            call_command("audit_journal", "task-1", "--replay", stdout=mock.MagicMock())
+
+        self.assertEqual(
+            list(product_list.products_list.values_list("product_id", "price")), [("B0A", 10.0)]
+        )
+
+    def test_refuses_a_journal_without_a_header(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(AUDIT_JOURNAL_DIR=directory):
+            task_dir = Path(directory) / "task-1"
+            task_dir.mkdir()
+            (task_dir / "part-0.ndjson").write_text('{"asin": "B0A", "status": "Live"}\n')
+            with self.assertRaisesMessage(CommandError, "has no readable header"):
+                call_command("audit_journal", "task-1", "--replay", stdout=mock.MagicMock())
+
+    def test_reextracts_a_stopped_task_into_its_own_list(self):
+        from scraping.models import ArchivedPage, ProductList
+
+        user = User.objects.create(username="auditor")
+        product_list = ProductList.objects.create(user=user, name="list", task_id=None)
+        ProductList.objects.create(user=user, name="newer", task_id="task-2")
+        ArchivedPage.objects.create(task_id="task-1", product_list=product_list, product_id="B0A", content_hash="0" * 32)
+        reextracted = [("B0A", {"asin": "B0A", "status": "Live", "price": "10."}, None)]
+        with mock.patch("scraping.management.commands.reextract_archive.reextract", return_value=reextracted):
+            call_command("reextract_archive", "task-1", stdout=mock.MagicMock())
+
+        self.assertEqual(
+            list(product_list.products_list.values_list("product_id", "price")), [("B0A", 10.0)]
+        )
+
+
+class SetAuditConcurrencyTests(TestCase):
+    def setUp(self):
+        from scraping.models import ProductList
+
+        self.user = User.objects.create(username="auditor")
+        ProductList.objects.create(user=self.user, name="list", task_id="task-1", is_audit_running=True)
+        patcher = mock.patch.object(views, "TaskProgress")
+        self.progress_class = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, slots):
+        request = APIRequestFactory().post("/", {"task_id": "task-1", "slots": slots}, format="json")
+        force_authenticate(request, user=self.user)
+        return views.SetAuditConcurrency.as_view()(request)
+
+    def test_rejects_non_numeric_slots(self):
+        self.assertEqual(self._post("abc").status_code, 400)
+        self.progress_class.return_value.set_slots.assert_not_called()
+
+    @override_settings(AUDIT_GLOBAL_BROWSER_SLOTS=20)
+    def test_clamps_slots_to_the_fleet_capacity(self):
+        for requested, applied in (("500", 20), (-3, 1), ("6", 6)):
+            with self.subTest(requested=requested):
+                response = self._post(requested)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data["slots"], applied)
+                self.progress_class.return_value.set_slots.assert_called_with(applied)
+
+
+class AIMDControllerTests(SimpleTestCase):
+    def _controller(self):
+        scheduler = SimpleNamespace(concurrency=4)
+        scheduler.resize = lambda slots: setattr(scheduler, "concurrency", slots)
+        return AIMDController(scheduler, min_slots=1, max_slots=40, min_samples=5)
+
+    def _tick(self, controller, latency):
+        controller.samples.clear()
+        for _ in range(5):
+            controller.record(OK, latency)
+        return controller.adjust()
+
+    def test_baseline_recovers_after_a_fast_window(self):
+        controller = self._controller()
+        self.assertEqual(self._tick(controller, 1.0), 5)
+        # Pages got slower for good: growth pauses, then resumes once the
+        # baseline has caught up.
+        slots = [self._tick(controller, 8.0) for _ in range(30)]
+        self.assertEqual(slots[0], 5)
+        self.assertGreater(slots[-1], 5)
+        self.assertGreater(controller.baseline_latency, 5.0)
+
+    def test_http_results_are_not_browser_samples(self):
+        async def scrape(product, on_page=None):
+            return {"asin": product, "status": "Live"}, None
+
+        workers = AuditWorkers.__new__(AuditWorkers)
+        workers.archive = None
+        workers.http = SimpleNamespace(scrape=scrape)
+        self.assertEqual(
+            asyncio.run(workers.scrape_product("B0A")), ({"asin": "B0A", "status": "Live"}, False, None)
+        )
+
+
+class RequestInterceptorTests(SimpleTestCase):
+    def _request(self, resource_type, url, body_size=0):
+        return SimpleNamespace(
+            resource_type=resource_type,
+            url=url,
+            sizes=mock.AsyncMock(return_value={"responseBodySize": body_size}),
+        )
+
+    def _response(self, request, headers):
+        return SimpleNamespace(request=request, url=request.url, headers=headers)
+
+    def test_counts_allowed_bytes_and_estimates_blocked_ones(self):
+        image = "https://m.media-amazon.com/images/I/1.jpg"
+
+        async def run():
+            full = RequestInterceptor(FULL)
+            full._on_response(self._response(self._request("image", image), {"content-length": "1000"}))
+            full._on_response(self._response(self._request("image", image, body_size=3000), {}))
+            await asyncio.gather(*full._measuring)
+
+            dom_only = RequestInterceptor(DOM_ONLY)
+            for resource_type in ("image", "image", "font"):
+                route = SimpleNamespace(request=self._request(resource_type, image), abort=mock.AsyncMock())
+                await dom_only._route(route)
+                route.abort.assert_awaited_once()
+            return full.stats(), dom_only.stats()
+
+        with mock.patch.dict(RequestInterceptor._sizes, clear=True):
+            full, dom_only = asyncio.run(run())
+        self.assertEqual((full["allowed_bytes"], full["allowed_bytes_by_type"]), (4000, {"image": 4000}))
+        self.assertEqual(dom_only["blocked"], {"image": 2, "font": 1})
+        self.assertEqual((dom_only["blocked_bytes_estimated"], dom_only["blocked_unsized"]), (4000, 1))
+
+
+class AuditSimulationTests(TransactionTestCase):
+    def test_failed_run_leaves_no_rows_behind(self):
+        from scraping.models import ProductInfo, ProductList
+
+        simulation = AuditSimulation(products=5, slots=2)
+        with mock.patch("scraping.benchmarks.simulator.redis.Redis.from_url"), \
+                mock.patch.object(AuditSimulation, "_run", mock.AsyncMock(side_effect=RuntimeError("boom"))):
+            with self.assertRaises(RuntimeError):
+                simulation.run()
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(ProductList.objects.exists())
+        self.assertFalse(ProductInfo.objects.exists())
+
+
+class WorkQueueSchedulerTests(SimpleTestCase):
+    def test_deferred_items_run_after_the_queue_and_in_parallel(self):
+        order, running, peak = [], [0], [0]
+
+        async def handler(item):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            await asyncio.sleep(0.05)
+            running[0] -= 1
+            order.append(item)
+            if item in ("a", "b", "c"):
+                scheduler.defer(f"retry-{item}", 0)
+
+        async def run():
+            return await scheduler.run(["a", "b", "c", "d"])
+
+        scheduler = WorkQueueScheduler(handler, concurrency=3)
+        stats = asyncio.run(run())
+        self.assertEqual(set(order[:4]), {"a", "b", "c", "d"})
+        self.assertEqual(set(order[4:]), {"retry-a", "retry-b", "retry-c"})
+        self.assertEqual(stats["completed"], 7)
+        self.assertEqual(peak[0], 3)
+        # All three due retries were fed on the first poll, not one per poll.
+        self.assertLess(stats["elapsed"], 1.0)
+
+    def test_retry_requeued_as_the_queue_drains_is_not_dropped(self):
+        handled = []
+
+        async def handler(item):
+            handled.append(item)
+            if item == "a":
+                scheduler.defer("retry-a", 0)
+
+        scheduler = WorkQueueScheduler(handler, concurrency=1)
+        join = scheduler.queue.join
+
+        async def join_then_feed():
+            await join()
+            # The feeder moving the due retry before run() looks again.
+            while scheduler._deferred:
+                scheduler.queue.put_nowait(heapq.heappop(scheduler._deferred)[2])
+
+        scheduler.queue.join = join_then_feed
+        stats = asyncio.run(scheduler.run(["a"]))
+        self.assertEqual(handled, ["a", "retry-a"])
+        self.assertEqual(stats["completed"], 2)
+
+    def test_defer_waits_for_its_delay_on_the_scheduler_clock(self):
+        now = [0.0]
+        scheduler = WorkQueueScheduler(None, concurrency=1, clock=lambda: now[0])
+        scheduler.defer("x", 30)
+
+        async def feed():
+            feeder = asyncio.create_task(scheduler._feed_deferred(poll=0.01))
+            await asyncio.sleep(0.03)
+            queued_early = scheduler.queue.qsize()
+            now[0] = 30
+            await asyncio.sleep(0.03)
+            feeder.cancel()
+            return queued_early, scheduler.queue.qsize()
+
+        self.assertEqual(asyncio.run(feed()), (0, 1))
+
+    def test_timed_out_items_go_to_the_failure_handler(self):
+        failures = []
+
+        async def handler(item):
+            await asyncio.sleep(1 if item == "slow" else 0)
+
+        async def on_failure(item, error):
+            failures.append((item, type(error)))
+
+        scheduler = WorkQueueScheduler(handler, concurrency=2, item_timeout=0.05, on_failure=on_failure)
+        stats = asyncio.run(scheduler.run(["slow", "fast"]))
+        self.assertEqual(failures, [("slow", asyncio.TimeoutError)])
+        self.assertEqual((stats["completed"], stats["timed_out"]), (1, 1))
+
+    def test_resize_grows_and_shrinks_slots(self):
+        peaks = []
+
+        async def handler(item):
+            if item == 0:
+                scheduler.resize(4)
+            elif item == 8:
+                scheduler.resize(1)
+            peaks.append(scheduler.busy)
+            await asyncio.sleep(0.01)
+
+        scheduler = WorkQueueScheduler(handler, concurrency=1)
+        stats = asyncio.run(scheduler.run(range(16)))
+        self.assertEqual(stats["completed"], 16)
+        self.assertEqual(max(peaks), 4)
+        self.assertEqual(peaks[-1], 1)
+
+
+class RetryQueueTests(SimpleTestCase):
+    def test_backoff_doubles_within_jittered_bounds_and_gives_up(self):
+        scheduler = SimpleNamespace(deferred=[])
+        scheduler.defer = lambda item, delay: scheduler.deferred.append(delay)
+        retries = RetryQueue(scheduler, max_attempts=4, base_delay=10, max_delay=30)
+        for _ in range(3):
+            self.assertTrue(retries.retry("B0A", NAVIGATION))
+        self.assertFalse(retries.retry("B0A", NAVIGATION))
+        for delay, ceiling in zip(scheduler.deferred, (10, 20, 30)):
+            self.assertGreaterEqual(delay, ceiling / 2)
+            self.assertLessEqual(delay, ceiling)
+        self.assertEqual(retries.stats(), {"retried": {NAVIGATION: 3}, "gave_up": {NAVIGATION: 1}})
+
+    def test_explicit_zero_overrides_the_settings(self):
+        scheduler = SimpleNamespace(defer=mock.Mock())
+        with override_settings(AUDIT_RETRY_MAX_ATTEMPTS=3):
+            retries = RetryQueue(scheduler, max_attempts=0, base_delay=0)
+        self.assertFalse(retries.retry("B0A", NAVIGATION))
+        scheduler.defer.assert_not_called()
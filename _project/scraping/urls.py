@@ -24,6 +24,12 @@ urlpatterns = [
     ),
     path("run_audit/", views.RunAudit.as_view(), name="create_product_list"),
     path("stop_audit/", views.StopCeleryTask.as_view(), name="stop_celery_task"),
+    path("browser_slots/", views.BrowserSlotUsage.as_view(), name="browser_slots"),
+    path(
+        "audit_concurrency/",
+        views.SetAuditConcurrency.as_view(),
+        name="audit_concurrency",
+    ),
     path(
         "delete_list/<int:pk>/", views.DeleteProductList.as_view(), name="delete_list"
     ),
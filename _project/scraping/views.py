@@ -1,6 +1,7 @@
 import json
 import redis
 import requests
+from django.conf import settings
 from django.http import HttpResponse
 from django.contrib.auth.models import User
 from django.http import StreamingHttpResponse
@@ -18,8 +19,11 @@ from celery import current_app
 from .bulk_create_product import ProductService
 from .file_parsing import FileParser
 
-from .tasks import run_audit_task
+from .tasks import run_audit_task, run_sharded_audit_task
+from .Audit.limiter import BrowserLimiter
+from .Audit.utils import TaskProgress
 from .models import ProductList, ProductInfo
+from .serializers import RunAuditOptionsSerializer
 from .utils import ProductListExcelExporter, ExcelExport, ping_celery
 
 
@@ -246,7 +250,11 @@ class RunAudit(APIView):
       
     
         
-        reaudit = request.data.get("reAudit")
+        options = RunAuditOptionsSerializer(data=request.data)
+        if not options.is_valid():
+            return Response(options.errors, status=status.HTTP_400_BAD_REQUEST)
+        reaudit = options.validated_data["reAudit"]
+        incremental = options.validated_data["incremental"]
         
         print(f"reaudit is {reaudit}")
         
@@ -264,7 +272,14 @@ class RunAudit(APIView):
             AUDIT_INSTANCE_COUNTER = "AUDIT_INSTANCES_"
             r.incr(AUDIT_INSTANCE_COUNTER)
             try:
-                task = run_audit_task.delay(product_list.id, reaudit)
+                if options.validated_data["resume"]:
+                    return self._resume(request, product_list, reaudit, incremental)
+
+                sharded = options.validated_data["sharded"]
+                if sharded is None:
+                    sharded = product_list.products_list.count() > settings.AUDIT_SHARD_THRESHOLD
+                audit_task = run_sharded_audit_task if sharded else run_audit_task
+                task = audit_task.delay(product_list.id, reaudit, incremental=incremental)
                 product_list.task_id = task.id  
                 product_list.is_audit_running = True
                 product_list.save(update_fields=["task_id", "is_audit_running"])
@@ -284,6 +299,45 @@ class RunAudit(APIView):
                 {"detail": "Product list not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
+    def _resume(self, request, product_list, reaudit, incremental):
+        """Continue an interrupted audit under its original task id."""
+        if product_list.is_audit_running:
+            return Response(
+                {"detail": "An audit is already running for this list"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        task_id = request.data.get("task_id") or product_list.task_id
+        progress = TaskProgress(task_id) if task_id else None
+        if (
+            progress is None
+            or not progress.exists()
+            or progress.get_progress()["user_id"] != request.user.id
+        ):
+            return Response(
+                {"detail": "Nothing to resume for this task"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        if progress.get_product_list_id() != product_list.id:
+            return Response(
+                {"detail": "This task does not belong to this product list"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        task = run_audit_task.delay(
+            product_list.id, reaudit, resume_task_id=task_id, incremental=incremental
+        )
+        # The new celery task is stopped together with the task id it resumes.
+        progress.set_shards([task.id])
+        product_list.task_id = task_id
+        product_list.is_audit_running = True
+        product_list.save(update_fields=["task_id", "is_audit_running"])
+        return Response(
+            {
+                "message": f"Audit resumed for {product_list.name}",
+                "task_id": task_id,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
 
 # === Stop an Audit ===
 
@@ -296,6 +350,10 @@ class StopCeleryTask(APIView):
             try:
                 # First try graceful stop
                 current_app.control.revoke(task_id, terminate=True, signal="SIGTERM")
+                # A sharded audit also has to stop the shards it fanned out
+                shard_ids = list(TaskProgress(task_id).get_shards())
+                if shard_ids:
+                    current_app.control.revoke(shard_ids, terminate=True, signal="SIGTERM")
                 ProductList.objects.filter(user=request.user, task_id=task_id).update(task_id=None)
                 return Response({
                     "status": "success",
@@ -306,6 +364,48 @@ class StopCeleryTask(APIView):
         else:
             return Response({"status": "error", "msg": "No task_id provided"})
 
+# === Resize a running Audit ===
+class SetAuditConcurrency(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        task_id = request.data.get("task_id")
+        slots = request.data.get("slots")
+        if not task_id or not slots:
+            return Response(
+                {"status": "error", "msg": "task_id and slots are required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not ProductList.objects.filter(user=request.user, task_id=task_id, is_audit_running=True).exists():
+            return Response(
+                {"status": "error", "msg": "No running audit for this task_id"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        try:
+            slots = int(slots)
+        except (TypeError, ValueError):
+            return Response(
+                {"status": "error", "msg": "slots must be a whole number"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        # More slots than the fleet-wide limiter allows would only queue on it.
+        slots = min(max(slots, 1), settings.AUDIT_GLOBAL_BROWSER_SLOTS)
+        TaskProgress(task_id).set_slots(slots)
+        return Response({"status": "success", "msg": f"task id {task_id} resized to {slots} slots", "slots": slots})
+
+# === Browser slot usage across the worker fleet ===
+class BrowserSlotUsage(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            return Response({"status": "success", "slots": BrowserLimiter.get_usage()})
+        except redis.ConnectionError as e:
+            return Response(
+                {"status": "error", "msg": str(e)},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
 # === get all running celery tasks ===
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -407,7 +507,7 @@ class AuditStreamingSSR(APIView):
 
                 yield f"data: {json.dumps(progress)}\n\n".encode("utf-8")
 
-                if total > 0 and processed >= total:
+                if (total > 0 and processed >= total) or progress.get("status") in ("done", "failed"):
                     yield f"event: complete\ndata: {json.dumps(progress)}\n\n".encode("utf-8")
                     break
 